@@ -0,0 +1,210 @@
+"""
+===================================
+CONTROL DE ADMISIÓN
+===================================
+Decide si un request se atiende apenas se leen sus headers, antes de
+abrir archivos o llamar a Wompi, para que un cliente que abusa (un
+scraper recorriendo rutas del SPA o el proxy) no deje sin threads a los
+pagos reales
+
+- Token bucket por IP de cliente y clase de ruta: cada clase tiene su
+  ritmo sostenido (requests por segundo) y su ráfaga máxima
+- Límite global de requests en curso: los últimos lugares quedan
+  reservados para las clases prioritarias (pagos y webhooks)
+- Rechazo rápido sin cuerpo: 429 + Retry-After si el cliente excedió su
+  ritmo, 503 + Retry-After si el servidor está lleno
+
+Lo usan server.py y wompi_webhook.py a través de AdmissionMixin. Con
+--workers cada proceso lleva sus propios contadores. ADMISSION=off lo
+desactiva (p. ej. para benchmark.py, que carga todo desde 127.0.0.1).
+"""
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+ENABLED = os.environ.get('ADMISSION', 'on').lower() != 'off'
+
+# Detrás de un túnel (localhost.run, ssh -R) todos los clientes llegan
+# desde 127.0.0.1: si el peer es local y trae X-Forwarded-For, la IP del
+# cliente es la última de ese header (la que agregó el túnel), así cada
+# visitante tiene su propio bucket. Con ADMISSION_TRUST_FORWARDED=1 se
+# confía en el header también desde otras IPs (un proxy en otra máquina)
+TRUST_FORWARDED = os.environ.get('ADMISSION_TRUST_FORWARDED', '') == '1'
+LOOPBACK_ADDRESSES = frozenset({'127.0.0.1', '::1', '::ffff:127.0.0.1'})
+
+# Buckets que se recuerdan (IP, clase); se olvidan los menos usados
+MAX_TRACKED_CLIENTS = 50000
+
+# Retry-After de un 503 por servidor lleno
+OVERLOAD_RETRY_AFTER = 1
+
+# Motivos de rechazo
+RATE_LIMITED = 'rate_limit'
+OVERLOADED = 'overload'
+
+
+class Rejection:
+    """Respuesta rápida para un request que no se atiende"""
+    __slots__ = ('status', 'retry_after', 'reason')
+    
+    def __init__(self, status, retry_after, reason):
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionController:
+    """
+    Token buckets por (IP, clase de ruta) y límite de requests en curso
+    
+    limits: clase -> (requests por segundo, ráfaga), o None para no
+    limitar esa clase; las clases que no están usan default_limit.
+    priority: clases que pueden usar los `reserved` lugares finales de
+    max_active. exempt: clases que no cuentan en max_active (se atienden
+    aunque el servidor esté lleno).
+    """
+    
+    def __init__(self, limits, default_limit, max_active, reserved=0, priority=(), exempt=(),
+                 max_clients=MAX_TRACKED_CLIENTS):
+        self.limits = dict(limits)
+        self.default_limit = default_limit
+        self.max_active = max_active
+        self.reserved = reserved
+        self.priority = frozenset(priority)
+        self.exempt = frozenset(exempt)
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()  # (ip, clase) -> [tokens, último uso]
+        self._active = 0
+        self._rejections = {}  # (clase, motivo) -> cantidad
+        self._lock = threading.Lock()
+    
+    def admit(self, client, route_class):
+        """
+        None si el request se atiende (luego llamar a release), o el
+        Rejection con el que hay que responder
+        """
+        limit = self.limits.get(route_class, self.default_limit)
+        counted = route_class not in self.exempt
+        capacity = self.max_active - (0 if route_class in self.priority else self.reserved)
+        now = time.monotonic()
+        
+        with self._lock:
+            bucket = None
+            if limit is not None:
+                rate, burst = limit
+                key = (client, route_class)
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = [float(burst), now]
+                    self._buckets[key] = bucket
+                    if len(self._buckets) > self.max_clients:
+                        self._buckets.popitem(last=False)
+                else:
+                    self._buckets.move_to_end(key)
+                    bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                    bucket[1] = now
+                if bucket[0] < 1:
+                    return self._reject(route_class, RATE_LIMITED, 429,
+                                        math.ceil((1 - bucket[0]) / rate))
+            
+            if counted and self._active >= capacity:
+                return self._reject(route_class, OVERLOADED, 503, OVERLOAD_RETRY_AFTER)
+            
+            if bucket is not None:
+                bucket[0] -= 1
+            if counted:
+                self._active += 1
+        return None
+    
+    def _reject(self, route_class, reason, status, retry_after):
+        key = (route_class, reason)
+        self._rejections[key] = self._rejections.get(key, 0) + 1
+        return Rejection(status, max(retry_after, 1), reason)
+    
+    def release(self, route_class):
+        """Un request admitido terminó"""
+        if route_class not in self.exempt:
+            with self._lock:
+                self._active -= 1
+    
+    def active(self):
+        return self._active
+    
+    def tracked_clients(self):
+        return len(self._buckets)
+    
+    def rejections(self):
+        with self._lock:
+            return dict(self._rejections)
+    
+    def register_metrics(self, registry, prefix):
+        """Exponer los contadores en un metrics.Registry"""
+        registry.gauge(f'{prefix}_admission_rejections_total',
+                       'Requests rechazados por el control de admisión',
+                       self.rejections, ('route', 'reason'), kind='counter')
+        registry.gauge(f'{prefix}_admission_active_requests',
+                       'Requests en curso que cuentan para el límite global', self.active)
+        registry.gauge(f'{prefix}_admission_max_active_requests',
+                       'Límite global de requests en curso', lambda: self.max_active)
+        registry.gauge(f'{prefix}_admission_tracked_clients',
+                       'Buckets (IP, clase de ruta) en memoria', self.tracked_clients)
+
+
+class AdmissionMixin:
+    """
+    Control de admisión para un BaseHTTPRequestHandler
+    
+    La subclase define admission_controller (un AdmissionController, o
+    None para atender todo) y admission_class(), que clasifica el
+    request solo con la línea de request y los headers. El rechazo se
+    envía desde parse_request, así el método do_* no llega a ejecutarse.
+    """
+    admission_controller = None
+    
+    def handle_one_request(self):
+        self.admitted_class = None
+        try:
+            super().handle_one_request()
+        finally:
+            if self.admitted_class is not None:
+                self.admission_controller.release(self.admitted_class)
+                self.admitted_class = None
+    
+    def parse_request(self):
+        if not super().parse_request():
+            return False
+        if self.admission_controller is None:
+            return True
+        
+        route_class = self.admission_class()
+        self.route_class = route_class
+        rejection = self.admission_controller.admit(self.admission_client(), route_class)
+        if rejection is not None:
+            self.send_rejection(rejection)
+            return False
+        self.admitted_class = route_class
+        return True
+    
+    def admission_class(self):
+        return 'other'
+    
+    def admission_client(self):
+        """IP del cliente: la que informa el túnel local o el proxy de confianza"""
+        peer = self.client_address[0]
+        if TRUST_FORWARDED or peer in LOOPBACK_ADDRESSES:
+            forwarded = self.headers.get('X-Forwarded-For')
+            if forwarded:
+                return forwarded.rsplit(',', 1)[-1].strip() or peer
+        return peer
+    
+    def send_rejection(self, rejection):
+        """429/503 sin cuerpo; se cierra la conexión para liberar el thread"""
+        self.close_connection = True
+        self.send_response(rejection.status)
+        self.send_header('Retry-After', str(rejection.retry_after))
+        self.send_header('Content-Length', '0')
+        self.send_header('Connection', 'close')
+        self.end_headers()
@@ -0,0 +1,498 @@
+"""
+===================================
+MINIFICACIÓN Y HUELLAS DE ASSETS
+===================================
+Etapa de build para server.py (--build / --fingerprint)
+
+- Minifica los CSS y JS de assets/ y escribe copias con el hash del
+  contenido en el nombre (main.css -> main.3f9a1c12.css), junto al
+  original para que las rutas relativas sigan funcionando
+- Las imágenes y fuentes se copian con hash sin modificarlas
+- Las referencias entre archivos (@import y url() en CSS, import en JS)
+  apuntan a las copias con hash, así que el hash de un archivo cambia
+  también cuando cambia algo que importa
+- asset-manifest.json guarda nombre original -> nombre con hash;
+  server.py lo usa para reescribir index.html y los componentes al
+  servirlos (los archivos fuente no se tocan)
+
+Un nombre con hash nunca cambia de contenido: se puede cachear un año
+con immutable. Los nombres originales siguen existiendo (GitHub Pages
+los usa) con caché corta.
+
+La minificación es conservadora: quita comentarios, sangría y espacios
+repetidos, sin renombrar ni reordenar nada.
+"""
+
+import hashlib
+import json
+import os
+import posixpath
+import re
+
+MANIFEST_FILE = 'asset-manifest.json'
+ASSETS_DIR = 'assets'
+
+# Tipos que reciben copia con hash; CSS y JS además se minifican
+FINGERPRINT_TYPES = {'.css', '.js', '.png', '.jpg', '.jpeg', '.gif', '.svg',
+                     '.ico', '.webp', '.woff', '.woff2', '.ttf'}
+MINIFY_TYPES = {'.css', '.js'}
+
+# Caracteres de hash en el nombre
+HASH_LENGTH = 8
+HASHED_NAME_RE = re.compile(r'^(.+)\.[0-9a-f]{%d}(\.[^.]+)$' % HASH_LENGTH)
+
+# Variantes precomprimidas que acompañan a cada archivo
+VARIANT_SUFFIXES = ('.gz', '.br')
+
+# Referencias que se reescriben: (prefijo)(ruta sin query ni fragmento)
+HTML_REF_RE = re.compile(r'''(\b(?:src|href)\s*=\s*["'])([^"'?#]+)''', re.I)
+CSS_URL_RE = re.compile(r'''(url\(\s*["']?)([^"')?#\s]+)''', re.I)
+CSS_IMPORT_RE = re.compile(r'''(@import\s+["'])([^"'?#]+)''', re.I)
+JS_IMPORT_RE = re.compile(r'''(\b(?:from|import)\s*\(?\s*["'])(\.\.?/[^"'?#]+)''')
+
+REFERENCE_PATTERNS = {
+    '.css': (CSS_URL_RE, CSS_IMPORT_RE),
+    '.js': (JS_IMPORT_RE,),
+    '.html': (HTML_REF_RE, CSS_URL_RE, JS_IMPORT_RE),
+}
+
+
+# ========================================
+# MINIFICACIÓN
+# ========================================
+# Después de estos caracteres o palabras, "/" empieza una regex y no una división
+_REGEX_PRECEDERS = set('(,=:[!&|?{};+-*%<>~^')
+_REGEX_KEYWORDS = {'return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'new',
+                   'delete', 'void', 'throw', 'yield', 'await', 'instanceof'}
+
+
+def _regex_allowed(out):
+    j = len(out) - 1
+    while j >= 0 and out[j] in ' \n':
+        j -= 1
+    if j < 0 or out[j] in _REGEX_PRECEDERS:
+        return True
+    if out[j].isalnum() or out[j] in '_$':
+        k = j
+        while k >= 0 and (out[k].isalnum() or out[k] in '_$'):
+            k -= 1
+        return ''.join(out[k + 1:j + 1]) in _REGEX_KEYWORDS
+    return False
+
+
+def _copy_quoted(source, i, out, quote):
+    """Copiar un string (o una regex) desde source[i]; retorna el índice siguiente"""
+    n = len(source)
+    out.append(source[i])
+    i += 1
+    in_class = False
+    while i < n:
+        c = source[i]
+        out.append(c)
+        i += 1
+        if c == '\\' and i < n:
+            out.append(source[i])
+            i += 1
+        elif c == '\n':
+            break  # string o regex sin cerrar: seguir como código
+        elif quote == '/' and c == '[':
+            in_class = True
+        elif quote == '/' and c == ']':
+            in_class = False
+        elif c == quote and not in_class:
+            break
+    return i
+
+
+def minify_js(source):
+    """
+    Quitar comentarios, sangría, líneas vacías y espacios repetidos
+    
+    Los saltos de línea se conservan (la inserción automática de ";"
+    depende de ellos), igual que strings, regex y template literals.
+    Los comentarios /*! ... */ (licencias) se conservan.
+    """
+    out = []
+    templates = []  # por cada ${ abierto: llaves de código sin cerrar
+    i, n = 0, len(source)
+    
+    def newline():
+        while out and out[-1] == ' ':
+            out.pop()
+        if out and out[-1] != '\n':
+            out.append('\n')
+    
+    while i < n:
+        c = source[i]
+        nxt = source[i + 1] if i + 1 < n else ''
+        
+        if c == '`' or (c == '}' and templates and templates[-1] == 0):
+            # Template literal (o su continuación tras ${...}): se copia tal cual
+            if c == '}':
+                templates.pop()
+            out.append(c)
+            i += 1
+            while i < n:
+                c = source[i]
+                if c == '\\':
+                    out.append(source[i:i + 2])
+                    i += 2
+                    continue
+                if c == '`':
+                    out.append(c)
+                    i += 1
+                    break
+                if c == '$' and source.startswith('${', i):
+                    out.append('${')
+                    i += 2
+                    templates.append(0)
+                    break
+                out.append(c)
+                i += 1
+            continue
+        
+        if c in '"\'':
+            i = _copy_quoted(source, i, out, c)
+        elif c == '/' and nxt == '/':
+            end = source.find('\n', i)
+            i = n if end < 0 else end
+        elif c == '/' and nxt == '*':
+            end = source.find('*/', i + 2)
+            end = n if end < 0 else end + 2
+            if source.startswith('/*!', i):
+                out.append(source[i:end])
+            elif '\n' in source[i:end]:
+                newline()
+            elif out and out[-1] not in ' \n':
+                out.append(' ')
+            i = end
+        elif c == '/' and _regex_allowed(out):
+            i = _copy_quoted(source, i, out, '/')
+        elif c in '\r\n':
+            newline()
+            i += 1
+        elif c in ' \t':
+            if out and out[-1] not in ' \n':
+                out.append(' ')
+            i += 1
+        else:
+            if templates:
+                if c == '{':
+                    templates[-1] += 1
+                elif c == '}':
+                    templates[-1] -= 1
+            out.append(c)
+            i += 1
+    
+    newline()
+    return ''.join(out)
+
+
+def minify_css(source):
+    """Quitar comentarios y espacios sobrantes (alrededor de { } ; , y después de :)"""
+    out = []
+    i, n = 0, len(source)
+    space = False
+    
+    while i < n:
+        c = source[i]
+        if source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            end = n if end < 0 else end + 2
+            if source.startswith('/*!', i):
+                out.append(source[i:end])
+            space = True
+            i = end
+            continue
+        if c.isspace():
+            space = True
+            i += 1
+            continue
+        if c in '{};,':
+            if c == '}' and out and out[-1] == ';':
+                out.pop()
+            out.append(c)
+            space = False
+            i += 1
+            continue
+        if space and out and out[-1] not in '{};,:':
+            out.append(' ')
+        space = False
+        if c in '"\'':
+            i = _copy_quoted(source, i, out, c)
+        else:
+            out.append(c)
+            i += 1
+    return ''.join(out).strip()
+
+
+_HTML_RAW_RE = re.compile(r'(<(script|style|pre|textarea)\b[^>]*>)(.*?)(</\2\s*>)', re.I | re.S)
+_JS_TYPES = {'module', 'text/javascript', 'application/javascript'}
+_HTML_COMMENT_RE = re.compile(r'<!--(?!\[if).*?-->', re.S)
+
+
+def minify_html(source):
+    """
+    Quitar comentarios HTML y sangría
+    
+    El contenido de <script> y <style> en línea se minifica como JS y
+    CSS; <pre> y <textarea> quedan intactos.
+    """
+    def text(chunk):
+        chunk = _HTML_COMMENT_RE.sub('', chunk)
+        chunk = re.sub(r'[ \t]*\n\s*', '\n', chunk)
+        return re.sub(r'[ \t]{2,}', ' ', chunk)
+    
+    out = []
+    position = 0
+    for match in _HTML_RAW_RE.finditer(source):
+        out.append(text(source[position:match.start()]))
+        opening, tag, body, closing = match.groups()
+        tag = tag.lower()
+        script_type = re.search(r'''\btype\s*=\s*["']?([^"'\s>]+)''', opening, re.I)
+        if tag == 'script' and (script_type is None or script_type.group(1).lower() in _JS_TYPES):
+            body = minify_js(body)
+        elif tag == 'style':
+            body = minify_css(body)
+        out.append(opening + body + closing)
+        position = match.end()
+    out.append(text(source[position:]))
+    return ''.join(out).strip() + '\n'
+
+
+# ========================================
+# REFERENCIAS
+# ========================================
+def _resolve(base_url, ref):
+    """URL absoluta de una referencia relativa a la carpeta base_url ('/assets/css/')"""
+    if re.match(r'^([a-z][a-z0-9+.-]*:|//)', ref, re.I):
+        return None
+    return posixpath.normpath(ref if ref.startswith('/') else base_url + ref)
+
+
+def rewrite_references(text, kind, base_url, mapping):
+    """
+    Cambiar en text las referencias que aparecen en mapping (url -> url
+    con hash) conservando su forma relativa; kind es '.css', '.js' o '.html'
+    """
+    def replace(match):
+        ref = match.group(2)
+        hashed = mapping.get(_resolve(base_url, ref))
+        if hashed is None:
+            return match.group(0)
+        return match.group(1) + ref[:ref.rfind('/') + 1] + posixpath.basename(hashed)
+    
+    for pattern in REFERENCE_PATTERNS[kind]:
+        text = pattern.sub(replace, text)
+    return text
+
+
+def find_references(text, kind, base_url):
+    """URLs absolutas a las que apunta text"""
+    found = set()
+    for pattern in REFERENCE_PATTERNS[kind]:
+        for match in pattern.finditer(text):
+            url = _resolve(base_url, match.group(2))
+            if url is not None:
+                found.add(url)
+    return found
+
+
+# ========================================
+# MANIFIESTO
+# ========================================
+class AssetManifest:
+    """Nombres originales -> nombres con hash de un build"""
+    
+    def __init__(self, files):
+        self.files = dict(files)  # '/assets/css/main.css' -> '/assets/css/main.3f9a1c12.css'
+        self.hashed_urls = frozenset(self.files.values())
+    
+    def __len__(self):
+        return len(self.files)
+    
+    @classmethod
+    def load(cls, path=MANIFEST_FILE):
+        """Leer un manifiesto; None si no existe o está dañado"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls(json.load(f)['files'])
+        except (OSError, ValueError, KeyError):
+            return None
+    
+    def save(self, path=MANIFEST_FILE):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'files': self.files}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+    
+    def rewrite_html(self, html):
+        """
+        HTML minificado y apuntando a los archivos con hash
+        
+        Las rutas relativas se resuelven desde la raíz del sitio (el
+        <base href> de index.html, donde también se insertan los componentes).
+        """
+        return rewrite_references(minify_html(html), '.html', '/', self.files)
+
+
+# ========================================
+# BUILD
+# ========================================
+def _strongly_connected(nodes, edges):
+    """
+    Componentes fuertemente conexos (Tarjan), cada uno después de los
+    componentes de los que depende
+    """
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    result = []
+    counter = 0
+    
+    for root in sorted(nodes):
+        if root in index:
+            continue
+        # Versión iterativa: (nodo, iterador de sus dependencias)
+        work = [(root, iter(sorted(edges.get(root, ()))))]
+        index[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child not in index:
+                    index[child] = lowlink[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(sorted(edges.get(child, ())))))
+                    break
+                if child in on_stack:
+                    lowlink[node] = min(lowlink[node], index[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    result.append(sorted(component))
+    return result
+
+
+def _hashed_url(url, digest):
+    stem, ext = posixpath.splitext(url)
+    return f'{stem}.{digest[:HASH_LENGTH]}{ext}'
+
+
+def _write_if_changed(path, data):
+    """Escribir de forma atómica; un nombre con hash que ya existe no se toca"""
+    try:
+        if os.path.getsize(path) == len(data):
+            return False
+    except OSError:
+        pass
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return True
+
+
+def _collect_sources(root, assets_dir, previous):
+    sources = {}
+    for dirpath, dirnames, filenames in os.walk(os.path.join(root, assets_dir)):
+        dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+        for name in filenames:
+            ext = os.path.splitext(name)[1].lower()
+            if name.startswith('.') or ext not in FINGERPRINT_TYPES:
+                continue
+            path = os.path.join(dirpath, name)
+            url = '/' + os.path.relpath(path, root).replace(os.sep, '/')
+            # Las copias con hash de builds anteriores no son fuentes
+            hashed = HASHED_NAME_RE.match(name)
+            if url in previous or (hashed and os.path.exists(
+                    os.path.join(dirpath, hashed.group(1) + hashed.group(2)))):
+                continue
+            sources[url] = path
+    return sources
+
+
+def build(root='.', assets_dir=ASSETS_DIR, manifest_path=MANIFEST_FILE):
+    """
+    Minificar y escribir las copias con hash de assets/ y el manifiesto
+    
+    Las copias de builds anteriores que ya no se usan se borran.
+    Retorna (manifiesto, archivos escritos).
+    """
+    previous = AssetManifest.load(os.path.join(root, manifest_path))
+    previous_urls = previous.hashed_urls if previous else frozenset()
+    sources = _collect_sources(root, assets_dir, previous_urls)
+    
+    contents = {}
+    edges = {}
+    for url, path in sources.items():
+        ext = posixpath.splitext(url)[1].lower()
+        with open(path, 'rb') as f:
+            data = f.read()
+        if ext in MINIFY_TYPES:
+            text = data.decode('utf-8')
+            text = minify_css(text) if ext == '.css' else minify_js(text)
+            base_url = posixpath.dirname(url) + '/'
+            edges[url] = find_references(text, ext, base_url) & sources.keys()
+            contents[url] = text
+        else:
+            contents[url] = data
+    
+    mapping = {}
+    outputs = {}
+    for component in _strongly_connected(sources, edges):
+        # Primero las referencias a archivos ya resueltos; dentro de un
+        # ciclo de imports todos comparten el hash del conjunto
+        for url in component:
+            if isinstance(contents[url], str):
+                ext = posixpath.splitext(url)[1].lower()
+                contents[url] = rewrite_references(
+                    contents[url], ext, posixpath.dirname(url) + '/', mapping)
+        digest = hashlib.sha256()
+        for url in component:
+            content = contents[url]
+            digest.update(content.encode('utf-8') if isinstance(content, str) else content)
+        digest = digest.hexdigest()
+        for url in component:
+            mapping[url] = _hashed_url(url, digest)
+        for url in component:
+            content = contents[url]
+            if isinstance(content, str):
+                if len(component) > 1:
+                    ext = posixpath.splitext(url)[1].lower()
+                    content = rewrite_references(content, ext, posixpath.dirname(url) + '/', mapping)
+                content = content.encode('utf-8')
+            outputs[url] = content
+    
+    written = 0
+    for url, data in outputs.items():
+        path = os.path.join(root, mapping[url].lstrip('/').replace('/', os.sep))
+        written += _write_if_changed(path, data)
+    
+    # Borrar las copias (y sus variantes .gz/.br) que dejó de usar el build
+    for url in previous_urls - set(mapping.values()):
+        path = os.path.join(root, url.lstrip('/').replace('/', os.sep))
+        for suffix in ('',) + VARIANT_SUFFIXES:
+            try:
+                os.remove(path + suffix)
+            except OSError:
+                pass
+    
+    manifest = AssetManifest(mapping)
+    manifest.save(os.path.join(root, manifest_path))
+    return manifest, written
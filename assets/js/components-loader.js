@@ -10,6 +10,10 @@ class ComponentsLoader {
         this.components = {};
         this.loadedComponents = new Set();
         this.loadingPromises = new Map();
+        // HTML recibido en un paquete de /__components, pendiente de insertar
+        this.bundledComponents = new Map();
+        // GitHub Pages solo sirve archivos: allí se cargan uno por uno
+        this.bundleUnavailable = window.location.hostname.endsWith('github.io');
     }
 
     /**
@@ -25,6 +29,14 @@ class ComponentsLoader {
             return this.loadingPromises.get(componentName);
         }
 
+        // Componente ya insertado por el servidor (server.py --inline-components)
+        const inlined = this.getInlinedComponent(componentName, containerId);
+        if (inlined !== null) {
+            this.components[componentName] = inlined;
+            this.loadedComponents.add(componentName);
+            return inlined;
+        }
+
         const loadPromise = this.fetchComponent(componentName);
         this.loadingPromises.set(componentName, loadPromise);
 
@@ -54,6 +66,12 @@ class ComponentsLoader {
      * Obtener HTML de un componente
      */
     async fetchComponent(componentName) {
+        if (this.bundledComponents.has(componentName)) {
+            const html = this.bundledComponents.get(componentName);
+            this.bundledComponents.delete(componentName);
+            return html;
+        }
+
         const response = await fetch(`./assets/components/${componentName}.html`);
         if (!response.ok) {
             throw new Error(`HTTP ${response.status}: ${response.statusText}`);
@@ -61,10 +79,49 @@ class ComponentsLoader {
         return await response.text();
     }
 
+    /**
+     * HTML de un componente que el servidor ya insertó en su contenedor
+     */
+    getInlinedComponent(componentName, containerId) {
+        const container = containerId ? document.getElementById(containerId) : null;
+        if (container && container.dataset.component === componentName) {
+            return container.innerHTML;
+        }
+        return null;
+    }
+
+    /**
+     * Pedir varios componentes en un solo request (server.py /__components)
+     * Si el servidor no lo soporta, cada componente se pide por separado
+     */
+    async fetchBundle(componentNames) {
+        const pending = componentNames.filter(name =>
+            !this.loadedComponents.has(name) && !this.bundledComponents.has(name));
+        if (this.bundleUnavailable || pending.length < 2) {
+            return;
+        }
+
+        try {
+            const response = await fetch(`./__components?names=${pending.map(encodeURIComponent).join(',')}`);
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+            }
+            const bundle = await response.json();
+            Object.entries(bundle).forEach(([name, html]) => this.bundledComponents.set(name, html));
+        } catch (error) {
+            this.bundleUnavailable = true;
+            console.warn('Component bundle unavailable, loading components individually:', error.message);
+        }
+    }
+
     /**
      * Cargar múltiples componentes en paralelo
      */
     async loadMultipleComponents(components) {
+        await this.fetchBundle(components
+            .filter(({ name, container }) => this.getInlinedComponent(name, container) === null)
+            .map(({ name }) => name));
+
         const promises = components.map(({ name, container }) =>
             this.loadComponent(name, container)
         );
@@ -164,6 +164,9 @@ export class Router {
             let html;
             if (this.componentCache.has(componentName)) {
                 html = this.componentCache.get(componentName);
+            } else if (this.getLoadedComponent(componentName) !== null) {
+                html = this.getLoadedComponent(componentName);
+                this.componentCache.set(componentName, html);
             } else {
                 const response = await fetch(`./assets/components/${componentName}`);
                 if (!response.ok) {
@@ -264,6 +267,12 @@ export class Router {
     async loadAndCacheComponent(componentName) {
         if (this.componentCache.has(componentName)) return;
 
+        const loaded = this.getLoadedComponent(componentName);
+        if (loaded !== null) {
+            this.componentCache.set(componentName, loaded);
+            return;
+        }
+
         try {
             const response = await fetch(`./assets/components/${componentName}`);
             if (response.ok) {
@@ -275,6 +284,15 @@ export class Router {
         }
     }
 
+    /**
+     * HTML de un componente que components-loader ya tiene (paquete o
+     * insertado por el servidor), para no pedirlo otra vez
+     */
+    getLoadedComponent(componentName) {
+        if (!window.componentsLoader) return null;
+        return window.componentsLoader.getComponent(componentName.replace(/\.html$/, ''));
+    }
+
     /**
      * Ejecutar scripts del componente
      */
@@ -35,6 +35,9 @@ export class WompiIntegration {
         this.isInitialized = false;
         this.currentCheckout = null;
 
+        // Si volvemos de un pago pendiente, escuchar su estado en vivo
+        this.resumePendingWatch();
+
         console.log('💳 Wompi Widget Integration initialized - PRODUCTION MODE', {
             sandbox: this.sandbox,
             publicKey: this.publicKey?.substring(0, 10) + '...',
@@ -532,6 +535,106 @@ export class WompiIntegration {
         this.showError('El pago no pudo ser procesado. Por favor intenta nuevamente.');
     }
 
+    /**
+     * Recibir en vivo los cambios de estado de una transacción
+     * El servidor local los envía apenas llega el webhook de Wompi
+     * (Server-Sent Events). Si el servidor rechaza la conexión se vuelve
+     * a intentar unas pocas veces; en GitHub Pages no existe ese endpoint
+     * y se mantiene el flujo normal. Retorna una función para dejar de escuchar.
+     */
+    watchTransactionStatus(reference, onStatus) {
+        const isGitHubPages = window.location.hostname.includes('github.io');
+        if (!reference || isGitHubPages || typeof EventSource === 'undefined') {
+            return () => {};
+        }
+
+        // Si el servidor está lleno (429/503) el navegador cierra la
+        // conexión y no reintenta solo: volver a abrirla más tarde
+        const retryDelays = [5000, 15000, 30000, 60000];
+        let attempt = 0;
+        let source = null;
+        let retryTimer = null;
+        let stopped = false;
+
+        const stop = () => {
+            stopped = true;
+            clearTimeout(retryTimer);
+            if (source) source.close();
+        };
+
+        const connect = () => {
+            source = new EventSource(`/events/transactions/${encodeURIComponent(reference)}`);
+
+            source.onopen = () => {
+                attempt = 0;
+            };
+
+            source.onmessage = (message) => {
+                let update;
+                try {
+                    update = JSON.parse(message.data);
+                } catch (error) {
+                    return;
+                }
+                onStatus(update);
+                if (['APPROVED', 'DECLINED', 'VOIDED', 'ERROR'].includes(update.status)) {
+                    stop();
+                }
+            };
+
+            source.onerror = () => {
+                if (stopped || source.readyState !== EventSource.CLOSED) return;
+                if (attempt >= retryDelays.length) {
+                    console.warn('⚠️ Live transaction status unavailable:', reference);
+                    return;
+                }
+                retryTimer = setTimeout(connect, retryDelays[attempt++]);
+            };
+        };
+
+        connect();
+        return stop;
+    }
+
+    /**
+     * Escuchar el estado de la referencia de /confirmacion?ref=...&status=pending
+     */
+    resumePendingWatch() {
+        const params = new URLSearchParams(window.location.search);
+        const reference = params.get('ref');
+        if (!reference || params.get('status') !== 'pending') return;
+
+        console.log('📡 Watching pending transaction:', reference);
+        this.watchTransactionStatus(reference, (update) => this.handleStatusUpdate(update));
+    }
+
+    /**
+     * Aplicar un cambio de estado recibido en vivo
+     */
+    handleStatusUpdate(update) {
+        const info = this.getTransactionInfo(update.reference) || { reference: update.reference };
+        if (info.status === update.status) return;
+
+        this.saveTransactionInfo({
+            ...info,
+            transactionId: update.transaction_id || info.transactionId,
+            status: update.status,
+            timestamp: Date.now()
+        });
+
+        const transaction = { id: update.transaction_id, reference: update.reference, status: update.status };
+        switch (update.status) {
+            case 'APPROVED':
+                this.handleApprovedTransaction(transaction, info.orderData);
+                break;
+            case 'DECLINED':
+            case 'VOIDED':
+            case 'ERROR':
+                this.handleFailedTransaction(transaction, info.orderData);
+                break;
+        }
+    }
+
     /**
      * Guardar información de la transacción en localStorage
      */
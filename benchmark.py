@@ -0,0 +1,502 @@
+"""
+===================================
+BENCHMARK DE SERVER.PY Y DEL WEBHOOK
+===================================
+Prueba de carga reproducible y sin internet:
+
+- Levanta un Wompi falso local (latencia configurable)
+- Inicia server.py y wompi_webhook.py como procesos aparte
+- Repite cargas completas de la SPA (index.html + componentes, CSS, JS
+  e imágenes), requests al proxy de Wompi y ráfagas de webhooks firmados
+- Reporta requests/seg, latencias p50/p95/p99 y memoria (RSS) de cada
+  servidor, y guarda todo en JSON para comparar corridas
+
+Uso:
+    python benchmark.py                          # todos los escenarios
+    python benchmark.py --scenarios static --duration 20
+    python benchmark.py --server-args="--async --workers 4"
+    python benchmark.py --scenarios webhook --durability event
+    python benchmark.py --output antes.json
+    python benchmark.py --output despues.json --compare antes.json
+"""
+
+import argparse
+import glob
+import hashlib
+import hmac
+import http.client
+import http.server
+import json
+import os
+import platform
+import re
+import shlex
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+SCENARIOS = ('static', 'proxy', 'webhook')
+
+# Respuestas del Wompi falso
+STUB_MERCHANT = json.dumps({
+    'data': {'id': 1, 'name': 'Benchmark', 'presigned_acceptance': {
+        'acceptance_token': 'tok_benchmark', 'permalink': 'https://example.com/terms'}}
+}).encode('utf-8')
+
+
+# ========================================
+# WOMPI FALSO
+# ========================================
+class StubWompiHandler(http.server.BaseHTTPRequestHandler):
+    """Upstream local con keep-alive y una latencia fija por request"""
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+    
+    def do_GET(self):
+        self.reply(200, STUB_MERCHANT if '/merchants/' in self.path else b'{"data": []}')
+    
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        self.reply(201, json.dumps({'data': {
+            'id': f'bench-{time.monotonic_ns()}', 'status': 'PENDING'}}).encode('utf-8'))
+    
+    def reply(self, code, body):
+        if self.latency:
+            time.sleep(self.latency)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(latency):
+    StubWompiHandler.latency = latency
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StubWompiHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+# ========================================
+# PROCESOS BAJO PRUEBA
+# ========================================
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def start_spa_server(port, upstream, extra_args, log):
+    env = dict(os.environ, WOMPI_API_BASE=upstream)
+    cmd = [sys.executable, os.path.join(ROOT, 'server.py'), '--port', str(port),
+           '--no-precompress'] + extra_args
+    return subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def start_webhook_server(port, workdir, durability, log):
+    # El webhook usa constantes de módulo: se ajustan antes de arrancar
+    # para no tocar el puerto 8080 ni las transacciones reales (cwd es
+    # workdir, así que tampoco se migra un transactions.json real)
+    code = (
+        'import sys; sys.path.insert(0, {root!r}); import wompi_webhook as w; '
+        'w.PORT = {port}; w.TRANSACTIONS_DB = {data!r}; w.run_webhook_server()'
+    ).format(root=ROOT, port=port, data=os.path.join(workdir, 'transactions.db'))
+    env = dict(os.environ, WEBHOOK_DURABILITY=durability)
+    return subprocess.Popen([sys.executable, '-c', code], cwd=workdir, env=env,
+                            stdout=log, stderr=subprocess.STDOUT)
+
+
+def process_tree(pid):
+    """pid y sus hijos (los workers de --workers)"""
+    pids = [pid]
+    for child in glob.glob(f'/proc/{pid}/task/*/children'):
+        try:
+            with open(child) as f:
+                for value in f.read().split():
+                    pids.extend(process_tree(int(value)))
+        except OSError:
+            pass
+    return pids
+
+
+def memory_kb(pid):
+    """(RSS actual, pico de RSS) en KB sumando los procesos hijos; Linux"""
+    rss = peak = 0
+    for member in process_tree(pid):
+        try:
+            with open(f'/proc/{member}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        rss += int(line.split()[1])
+                    elif line.startswith('VmHWM:'):
+                        peak += int(line.split()[1])
+        except OSError:
+            pass
+    return rss, peak
+
+
+def stop(process):
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+# ========================================
+# GENERADOR DE CARGA
+# ========================================
+def page_assets():
+    """Recursos que descarga el navegador en una carga completa de la SPA"""
+    with open(os.path.join(ROOT, 'index.html'), encoding='utf-8') as f:
+        html = f.read()
+    paths = set()
+    for ref in re.findall(r'(?:href|src)=["\']([^"\'#?]+)', html):
+        if ref.startswith(('http:', 'https:', '//', 'data:', 'mailto:')):
+            continue
+        local = os.path.join(ROOT, ref.lstrip('./').lstrip('/'))
+        if os.path.isfile(local):
+            paths.add('/' + os.path.relpath(local, ROOT).replace(os.sep, '/'))
+    for pattern in ('assets/components/*.html', 'assets/js/*.js', 'assets/css/*.css'):
+        for path in glob.glob(os.path.join(ROOT, pattern)):
+            paths.add('/' + os.path.relpath(path, ROOT).replace(os.sep, '/'))
+    images = sorted(glob.glob(os.path.join(ROOT, 'assets/images/**/*.*'), recursive=True))
+    for path in images[:10]:
+        paths.add('/' + os.path.relpath(path, ROOT).replace(os.sep, '/'))
+    return ['/'] + sorted(paths)
+
+
+class Recorder:
+    """Latencias y errores por etiqueta, compartido por los threads de carga"""
+    
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.bytes = 0
+        self._lock = threading.Lock()
+    
+    def add(self, label, seconds, size):
+        with self._lock:
+            self.latencies.setdefault(label, []).append(seconds)
+            self.bytes += size
+    
+    def error(self, label, reason):
+        with self._lock:
+            key = f'{label}: {reason}'
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+
+class Client:
+    """Conexión keep-alive (se reabre sola si el servidor la cierra)"""
+    
+    def __init__(self, port, recorder):
+        self.port = port
+        self.recorder = recorder
+        self.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    
+    def request(self, label, method, path, body=None, headers=None):
+        started = time.perf_counter()
+        try:
+            self.conn.request(method, path, body=body, headers=headers or {})
+            response = self.conn.getresponse()
+            data = response.read()
+            if response.will_close:
+                self.conn.close()
+        except (OSError, http.client.HTTPException) as e:
+            self.conn.close()
+            self.recorder.error(label, type(e).__name__)
+            return False
+        elapsed = time.perf_counter() - started
+        if response.status >= 400:
+            self.recorder.error(label, f'HTTP {response.status}')
+            return False
+        self.recorder.add(label, elapsed, len(data))
+        return True
+
+
+def static_load(client, assets):
+    """Una carga completa de la SPA: la página y luego sus recursos"""
+    started = time.perf_counter()
+    ok = client.request('static', 'GET', '/carrito',
+                        headers={'Accept-Encoding': 'br, gzip'})
+    for path in assets[1:]:
+        ok = client.request('static', 'GET', path,
+                            headers={'Accept-Encoding': 'br, gzip'}) and ok
+    if ok:
+        client.recorder.add('page_load', time.perf_counter() - started, 0)
+
+
+def proxy_load(client, _):
+    """Lo que hace el checkout: acceptance token y crear la transacción"""
+    client.request('proxy_get', 'GET', '/api/wompi/merchants/pub_test_benchmark')
+    body = json.dumps({'amount_in_cents': 150000, 'currency': 'COP',
+                       'reference': f'bench-{time.monotonic_ns()}'}).encode('utf-8')
+    client.request('proxy_post', 'POST', '/api/wompi/transactions', body=body,
+                   headers={'Content-Type': 'application/json'})
+
+
+def webhook_event(sequence, secret):
+    status = ('APPROVED', 'DECLINED', 'PENDING')[sequence % 3]
+    payload = json.dumps({
+        'event': 'transaction.updated',
+        'data': {'transaction': {
+            'id': f'bench-{os.getpid()}-{sequence}',
+            'reference': f'REF-{sequence}',
+            'status': status,
+            'amount_in_cents': 150000 + sequence,
+            'currency': 'COP',
+            'payment_method_type': ('CARD', 'NEQUI', 'PSE')[sequence % 3],
+            'created_at': datetime.now().isoformat(),
+        }},
+        'sent_at': datetime.now().isoformat(),
+    }).encode('utf-8')
+    signature = hmac.new(secret.encode(), payload, hashlib.sha256).hexdigest()
+    return payload, {'Content-Type': 'application/json', 'X-Event-Signature': signature}
+
+
+def run_load(name, port, work, concurrency, duration, context):
+    """Ejecutar work(client, context) en bucle desde varios threads"""
+    recorder = Recorder()
+    deadline = time.monotonic() + duration
+    
+    def loop():
+        client = Client(port, recorder)
+        while time.monotonic() < deadline:
+            work(client, context)
+        client.conn.close()
+    
+    threads = [threading.Thread(target=loop, name=f'{name}-{i}') for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder, time.perf_counter() - started
+
+
+def run_webhook_bursts(port, burst_size, pause, duration, secret):
+    """Ráfagas de burst_size webhooks simultáneos separadas por pause segundos"""
+    recorder = Recorder()
+    deadline = time.monotonic() + duration
+    sequence = 0
+    started = time.perf_counter()
+    while time.monotonic() < deadline:
+        threads = []
+        for _ in range(burst_size):
+            payload, headers = webhook_event(sequence, secret)
+            sequence += 1
+            client = Client(port, recorder)
+            threads.append(threading.Thread(
+                target=client.request, args=('webhook', 'POST', '/webhook', payload, headers)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        time.sleep(pause)
+    return recorder, time.perf_counter() - started
+
+
+# ========================================
+# REPORTE
+# ========================================
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(recorder, elapsed):
+    result = {'elapsed_s': round(elapsed, 3), 'bytes': recorder.bytes,
+              'errors': recorder.errors, 'labels': {}}
+    total = 0
+    for label, values in sorted(recorder.latencies.items()):
+        values.sort()
+        if label != 'page_load':
+            total += len(values)
+        result['labels'][label] = {
+            'count': len(values),
+            'rps': round(len(values) / elapsed, 1) if elapsed else 0.0,
+            'p50_ms': round(percentile(values, 0.50) * 1000, 3),
+            'p95_ms': round(percentile(values, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(values, 0.99) * 1000, 3),
+            'max_ms': round(values[-1] * 1000, 3),
+        }
+    result['requests'] = total
+    result['rps'] = round(total / elapsed, 1) if elapsed else 0.0
+    return result
+
+
+def print_report(results, baseline=None):
+    print(f"\n{'=' * 72}")
+    print(f"📊 Resultados ({results['started_at']}, commit {results['commit'] or '?'})")
+    print(f"{'=' * 72}")
+    print(f"{'escenario':<12}{'ruta':<12}{'req/s':>10}{'p50 ms':>10}"
+          f"{'p95 ms':>10}{'p99 ms':>10}{'errores':>9}")
+    for scenario, data in results['scenarios'].items():
+        errors = sum(data['errors'].values())
+        for label, stats in data['labels'].items():
+            line = (f"{scenario:<12}{label:<12}{stats['rps']:>10}{stats['p50_ms']:>10}"
+                    f"{stats['p95_ms']:>10}{stats['p99_ms']:>10}{errors:>9}")
+            previous = (baseline or {}).get('scenarios', {}).get(scenario, {}) \
+                .get('labels', {}).get(label)
+            if previous and previous['rps']:
+                line += f"   Δ req/s {100 * (stats['rps'] / previous['rps'] - 1):+.1f}%"
+                if previous['p99_ms']:
+                    line += f", Δ p99 {100 * (stats['p99_ms'] / previous['p99_ms'] - 1):+.1f}%"
+            print(line)
+            errors = 0  # los errores se muestran una vez por escenario
+        for reason, count in data['errors'].items():
+            print(f"   ⚠️ {reason} x{count}")
+    print(f"{'-' * 72}")
+    for name, memory in results['memory_kb'].items():
+        print(f"🧠 {name}: RSS {memory['rss'] // 1024} MB, pico {memory['peak'] // 1024} MB")
+    print(f"{'=' * 72}\n")
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+# ========================================
+# MAIN
+# ========================================
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de server.py y wompi_webhook.py')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f'Escenarios separados por coma (default: {",".join(SCENARIOS)})')
+    parser.add_argument('--duration', type=float, default=10,
+                        help='Segundos por escenario (default: 10)')
+    parser.add_argument('--concurrency', type=int, default=16,
+                        help='Clientes simultáneos en static/proxy (default: 16)')
+    parser.add_argument('--burst', type=int, default=50,
+                        help='Webhooks por ráfaga (default: 50)')
+    parser.add_argument('--burst-pause', type=float, default=0.5,
+                        help='Segundos entre ráfagas de webhooks (default: 0.5)')
+    parser.add_argument('--durability', default='group',
+                        help='WEBHOOK_DURABILITY del webhook: event, group o interval (default: group)')
+    parser.add_argument('--upstream-latency', type=float, default=0.05,
+                        help='Latencia del Wompi falso en segundos (default: 0.05)')
+    parser.add_argument('--server-args', default='',
+                        help='Argumentos extra para server.py, p. ej. "--async --workers 4"')
+    parser.add_argument('--warmup', type=float, default=2,
+                        help='Segundos de calentamiento antes de medir (default: 2)')
+    parser.add_argument('--admission', action='store_true',
+                        help='Dejar activo el control de admisión (limita por IP y toda la '
+                             'carga sale de 127.0.0.1)')
+    parser.add_argument('--output', help='Guardar los resultados en este archivo JSON')
+    parser.add_argument('--compare', help='JSON de una corrida anterior para comparar')
+    args = parser.parse_args()
+    
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"escenarios desconocidos: {', '.join(sorted(unknown))}")
+    
+    # Los límites por IP de admission.py rechazarían la carga (un solo
+    # cliente); los servidores heredan la variable
+    if not args.admission:
+        os.environ['ADMISSION'] = 'off'
+    
+    # Import tardío: el secret de los webhooks es el mismo que valida el servidor
+    sys.path.insert(0, ROOT)
+    from wompi_webhook import WOMPI_EVENTS_SECRET
+    
+    results = {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'args': vars(args),
+        'scenarios': {},
+        'memory_kb': {},
+    }
+    
+    workdir = tempfile.mkdtemp(prefix='spa-bench-')
+    log = open(os.path.join(workdir, 'servers.log'), 'wb')
+    stub = start_stub(args.upstream_latency)
+    upstream = f'http://127.0.0.1:{stub.server_address[1]}/v1/'
+    processes = {}
+    try:
+        if 'static' in scenarios or 'proxy' in scenarios:
+            port = free_port()
+            processes['server.py'] = (start_spa_server(
+                port, upstream, shlex.split(args.server_args), log), port)
+        if 'webhook' in scenarios:
+            port = free_port()
+            processes['wompi_webhook.py'] = (start_webhook_server(port, workdir, args.durability, log), port)
+        for name, (process, port) in processes.items():
+            if not wait_for_port(port):
+                raise SystemExit(f"❌ {name} no arrancó (ver {log.name})")
+        
+        assets = page_assets()
+        print(f"🚀 Benchmark: {', '.join(scenarios)} ({args.duration:g}s c/u, "
+              f"{args.concurrency} clientes, {len(assets)} recursos por página)")
+        
+        for scenario in scenarios:
+            if scenario == 'webhook':
+                _, port = processes['wompi_webhook.py']
+                run_webhook_bursts(port, args.burst, args.burst_pause,
+                                   min(args.warmup, 1), WOMPI_EVENTS_SECRET)
+                recorder, elapsed = run_webhook_bursts(
+                    port, args.burst, args.burst_pause, args.duration, WOMPI_EVENTS_SECRET)
+            else:
+                _, port = processes['server.py']
+                work = static_load if scenario == 'static' else proxy_load
+                run_load(scenario, port, work, args.concurrency, args.warmup, assets)
+                recorder, elapsed = run_load(
+                    scenario, port, work, args.concurrency, args.duration, assets)
+            results['scenarios'][scenario] = summarize(recorder, elapsed)
+            print(f"  ✅ {scenario}: {results['scenarios'][scenario]['rps']} req/s")
+        
+        for name, (process, _) in processes.items():
+            rss, peak = memory_kb(process.pid)
+            results['memory_kb'][name] = {'rss': rss, 'peak': peak}
+    finally:
+        for process, _ in processes.values():
+            stop(process)
+        stub.shutdown()
+        log.close()
+    
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"💾 Resultados guardados en {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+"""
+===================================
+GROUP COMMIT PARA SQLITE
+===================================
+Agrupar escrituras que llegan casi al mismo tiempo en una sola
+transacción (un solo fsync), con durabilidad configurable:
+
+- 'event':    una transacción y un fsync por escritura (lo más simple)
+- 'group':    un thread junta las escrituras de unos pocos milisegundos
+              y las confirma juntas; cada productor espera a que su
+              grupo esté en disco antes de continuar
+- 'interval': las escrituras se aplican al instante en una transacción
+              abierta que se confirma cada `interval` segundos; no se
+              espera el disco (un corte puede perder ese intervalo)
+
+Lo usan transaction_store.py y webhook_queue.py.
+"""
+
+import threading
+import time
+
+DURABILITY_MODES = ('event', 'group', 'interval')
+
+# Tiempo máximo que el committer espera para juntar más escrituras
+GROUP_WINDOW = 0.002
+GROUP_MAX_BATCH = 256
+
+# Cada cuánto se confirma la transacción abierta en modo 'interval'
+COMMIT_INTERVAL = 0.05
+
+# Límites de los histogramas de tamaño de grupo
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+
+class _Write:
+    """Una escritura pendiente en modo 'group'"""
+    __slots__ = ('fn', 'wait', 'done', 'result', 'error')
+    
+    def __init__(self, fn, wait):
+        self.fn = fn
+        self.wait = wait
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class GroupCommitter:
+    """
+    Ejecutar escrituras sobre una conexión SQLite (isolation_level=None)
+    
+    submit(fn) llama fn(conn) dentro de una transacción y retorna su
+    resultado. Si fn falla solo se deshace esa escritura (SAVEPOINT), no
+    el grupo completo. batch_sizes y commit_latency son Histogram
+    opcionales con la etiqueta name.
+    """
+    
+    def __init__(self, conn, name, durability='group', window=GROUP_WINDOW,
+                 max_batch=GROUP_MAX_BATCH, interval=COMMIT_INTERVAL,
+                 batch_sizes=None, commit_latency=None):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"durabilidad '{durability}' no válida: usar {', '.join(DURABILITY_MODES)}")
+        self.conn = conn
+        self.name = name
+        self.durability = durability
+        self.window = window
+        self.max_batch = max_batch
+        self.interval = interval
+        self.batch_sizes = batch_sizes
+        self.commit_latency = commit_latency
+        self.lock = threading.RLock()  # protege la conexión
+        self._pending = []
+        self._cond = threading.Condition()
+        self._in_transaction = 0  # escrituras sin confirmar en modo 'interval'
+        self.commits = 0
+        
+        if durability != 'event':
+            threading.Thread(target=self._run, name=f'commit-{name}', daemon=True).start()
+    
+    def submit(self, fn, wait=True):
+        """
+        Ejecutar fn(conn) y retornar su resultado
+        
+        En modo 'group' con wait=False la escritura se encola y se
+        retorna None sin esperar (para escrituras cuyo resultado no se usa).
+        """
+        if self.durability == 'event':
+            with self.lock:
+                self.conn.execute('BEGIN IMMEDIATE')
+                started = time.perf_counter()
+                try:
+                    result = fn(self.conn)
+                except Exception:
+                    self.conn.execute('ROLLBACK')
+                    raise
+                self.conn.execute('COMMIT')
+                self._observe(1, time.perf_counter() - started)
+                return result
+        
+        if self.durability == 'interval':
+            with self.lock:
+                if not self._in_transaction:
+                    self.conn.execute('BEGIN IMMEDIATE')
+                self._in_transaction += 1
+                return self._apply(fn)
+        
+        write = _Write(fn, wait)
+        with self._cond:
+            self._pending.append(write)
+            if len(self._pending) == 1 or len(self._pending) >= self.max_batch:
+                self._cond.notify()
+        if not wait:
+            return None
+        write.done.wait()
+        if write.error is not None:
+            raise write.error
+        return write.result
+    
+    def _apply(self, fn):
+        # Un SAVEPOINT por escritura: si falla, el resto del grupo sigue
+        self.conn.execute('SAVEPOINT write')
+        try:
+            result = fn(self.conn)
+        except Exception:
+            self.conn.execute('ROLLBACK TO write')
+            self.conn.execute('RELEASE write')
+            raise
+        self.conn.execute('RELEASE write')
+        return result
+    
+    def _run(self):
+        while True:
+            if self.durability == 'interval':
+                time.sleep(self.interval)
+                self.flush()
+                continue
+            
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                # Esperar un poco a que lleguen más escrituras al grupo
+                deadline = time.monotonic() + self.window
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not self._cond.wait(remaining):
+                        break
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+            self._commit_batch(batch)
+    
+    def _commit_batch(self, batch):
+        started = time.perf_counter()
+        with self.lock:
+            try:
+                self.conn.execute('BEGIN IMMEDIATE')
+                for write in batch:
+                    try:
+                        write.result = self._apply(write.fn)
+                    except Exception as e:
+                        write.error = e
+                self.conn.execute('COMMIT')
+            except Exception as e:
+                # Falló el BEGIN o el COMMIT: nada del grupo quedó guardado
+                try:
+                    self.conn.execute('ROLLBACK')
+                except Exception:
+                    pass
+                for write in batch:
+                    write.error = e
+        self._observe(len(batch), time.perf_counter() - started)
+        for write in batch:
+            if write.error is not None and not write.wait:
+                print(f"❌ Escritura en {self.name} falló: {write.error}")
+            write.done.set()
+    
+    def _observe(self, size, latency):
+        self.commits += 1
+        if self.batch_sizes is not None:
+            self.batch_sizes.observe(size, (self.name,))
+        if self.commit_latency is not None:
+            self.commit_latency.observe(latency, (self.name,))
+    
+    def flush(self):
+        """Confirmar ya lo que esté pendiente (modo 'interval' o 'group')"""
+        if self.durability == 'interval':
+            with self.lock:
+                if self._in_transaction:
+                    started = time.perf_counter()
+                    self.conn.execute('COMMIT')
+                    self._observe(self._in_transaction, time.perf_counter() - started)
+                    self._in_transaction = 0
+        elif self.durability == 'group':
+            with self._cond:
+                batch, self._pending = self._pending, []
+            if batch:
+                self._commit_batch(batch)
+    
+    def maintenance(self, fn):
+        """Ejecutar fn(conn) fuera de toda transacción (checkpoint, migración)"""
+        with self.lock:
+            self.flush()
+            return fn(self.conn)
@@ -0,0 +1,325 @@
+"""
+===================================
+MÉTRICAS (formato Prometheus)
+===================================
+Contadores e histogramas en memoria compartidos por server.py y
+wompi_webhook.py, expuestos en /__metrics en el formato de texto de
+Prometheus (https://prometheus.io/docs/instrumenting/exposition_formats/)
+
+Registrar un valor cuesta una búsqueda en un dict y un lock, sin
+asignar memoria en el camino caliente. El costo se mide con:
+
+    python metrics.py
+
+Con --workers cada proceso tiene sus propias métricas; cada scrape
+muestra las del proceso que atendió la conexión (etiqueta pid).
+
+/__metrics solo responde a la misma máquina (y no a través de un proxy o
+túnel, que llegan desde 127.0.0.1 con X-Forwarded-For). Para leerlo desde
+otra, definir METRICS_TOKEN y enviar Authorization: Bearer <token>.
+"""
+
+import bisect
+import hmac
+import os
+import threading
+import time
+
+# Límites (segundos) de los histogramas de latencia
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Token para leer /__metrics desde otra máquina; sin él, solo localhost
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+LOCAL_ADDRESSES = frozenset({'127.0.0.1', '::1', '::ffff:127.0.0.1'})
+
+
+def direct_local_request(handler):
+    """
+    True si el request de un BaseHTTPRequestHandler viene de esta máquina
+    y no a través de un proxy o túnel (localhost.run llega desde
+    127.0.0.1, pero agrega X-Forwarded-For)
+    """
+    return (handler.client_address[0] in LOCAL_ADDRESSES
+            and 'X-Forwarded-For' not in handler.headers and 'Forwarded' not in handler.headers)
+
+
+def _format_labels(labelnames, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Contador que solo crece, con una serie por combinación de etiquetas"""
+    kind = 'counter'
+    
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+    
+    def value(self, labels=()):
+        return self._values.get(labels, 0)
+    
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class Histogram:
+    """
+    Histograma con límites fijos
+    
+    Cada serie guarda conteos por bucket (no acumulados, se acumulan al
+    exportar), la suma y el total de observaciones.
+    """
+    kind = 'histogram'
+    
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # etiquetas -> [conteos por bucket..., +Inf, suma]
+        self._lock = threading.Lock()
+    
+    def observe(self, value, labels=()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+    
+    def count(self, labels=()):
+        series = self._series.get(labels)
+        return sum(series[:-1]) if series else 0
+    
+    def samples(self):
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                yield (self.name + '_bucket',
+                       _format_labels(self.labelnames, labels, le), cumulative)
+            yield self.name + '_sum', _format_labels(self.labelnames, labels), series[-1]
+            yield self.name + '_count', _format_labels(self.labelnames, labels), cumulative
+
+
+class Gauge:
+    """
+    Valor leído al momento del scrape (p. ej. estadísticas de una caché)
+    
+    kind='counter' para contadores que ya lleva otro objeto.
+    """
+    
+    def __init__(self, name, documentation, labelnames=(), callback=None, kind='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self.kind = kind
+    
+    def samples(self):
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in values.items():
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class Registry:
+    """Conjunto de métricas de un proceso"""
+    
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+    
+    def _add(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+    
+    def counter(self, name, documentation, labelnames=()):
+        return self._add(Counter(name, documentation, labelnames))
+    
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+    
+    def gauge(self, name, documentation, callback, labelnames=(), kind='gauge'):
+        return self._add(Gauge(name, documentation, labelnames, callback, kind))
+    
+    def render(self):
+        """Todas las métricas en formato de texto de Prometheus"""
+        lines = []
+        for metric in list(self._metrics):
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                # Un callback que falla no debe romper el scrape completo
+                lines.append(f'# {metric.name}: {e}')
+                continue
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in samples:
+                lines.append(f'{name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+class RequestMetrics:
+    """
+    Métricas HTTP comunes a los dos servidores
+    
+    Un request se registra con observe() al terminar: conteo por clase de
+    ruta y status, latencia por clase de ruta y bytes de entrada/salida.
+    """
+    
+    def __init__(self, registry, prefix):
+        self.registry = registry
+        self.requests = registry.counter(
+            f'{prefix}_requests_total', 'Requests atendidos', ('route', 'status'))
+        self.latency = registry.histogram(
+            f'{prefix}_request_duration_seconds', 'Duración de los requests',
+            ('route',))
+        self.bytes_in = registry.counter(
+            f'{prefix}_request_bytes_total', 'Bytes recibidos en cuerpos de request',
+            ('route',))
+        self.bytes_out = registry.counter(
+            f'{prefix}_response_bytes_total', 'Bytes enviados en cuerpos de respuesta',
+            ('route',))
+        started = time.time()
+        registry.gauge(f'{prefix}_process_start_time_seconds',
+                       'Inicio del proceso (epoch)', lambda: {(os.getpid(),): started},
+                       ('pid',))
+    
+    def observe(self, route, status, duration, bytes_in, bytes_out):
+        self.requests.inc((route, status))
+        self.latency.observe(duration, (route,))
+        if bytes_in:
+            self.bytes_in.inc((route,), bytes_in)
+        if bytes_out:
+            self.bytes_out.inc((route,), bytes_out)
+
+
+class InstrumentedHandlerMixin:
+    """
+    Registrar cada request de un BaseHTTPRequestHandler
+    
+    La subclase define request_metrics (un RequestMetrics) y asigna
+    self.route_class según la ruta; el status y los bytes enviados se
+    toman de send_response/send_header. Las respuestas sin
+    Content-Length suman sus bytes en self.response_bytes.
+    """
+    request_metrics = None
+    
+    def handle_one_request(self):
+        started = time.perf_counter()
+        self.route_class = 'other'
+        self.response_status = None
+        self.response_bytes = 0
+        try:
+            super().handle_one_request()
+        finally:
+            if self.response_status is not None and self.request_metrics is not None:
+                self.request_metrics.observe(
+                    self.route_class, self.response_status,
+                    time.perf_counter() - started, self.request_bytes(), self.response_bytes)
+    
+    def request_bytes(self):
+        headers = getattr(self, 'headers', None)
+        try:
+            return max(int(headers.get('Content-Length', 0)), 0) if headers else 0
+        except ValueError:
+            return 0
+    
+    def send_response(self, code, message=None):
+        self.response_status = code
+        super().send_response(code, message)
+    
+    def send_header(self, keyword, value):
+        if keyword.lower() == 'content-length' and self.command != 'HEAD':
+            try:
+                self.response_bytes = int(value)
+            except ValueError:
+                pass
+        super().send_header(keyword, value)
+    
+    def metrics_allowed(self):
+        """Con METRICS_TOKEN se exige Bearer; sin él, solo localhost sin proxy"""
+        if METRICS_TOKEN:
+            authorization = self.headers.get('Authorization', '')
+            return hmac.compare_digest(authorization.encode('utf-8'),
+                                       f'Bearer {METRICS_TOKEN}'.encode('utf-8'))
+        return direct_local_request(self)
+    
+    def send_metrics(self, registry):
+        """Responder /__metrics con el contenido del registro"""
+        self.route_class = 'metrics'
+        if not self.metrics_allowed():
+            self.send_response(403)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def benchmark(iterations=200000):
+    """Medir el costo de registrar un request completo"""
+    registry = Registry()
+    http = RequestMetrics(registry, 'bench')
+    
+    started = time.perf_counter()
+    for _ in range(iterations):
+        pass
+    baseline = time.perf_counter() - started
+    
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        http.observe('static', 200, time.perf_counter() - t0, 0, 1024)
+    elapsed = time.perf_counter() - started - baseline
+    
+    started = time.perf_counter()
+    for _ in range(1000):
+        registry.render()
+    render = (time.perf_counter() - started) / 1000
+    return elapsed / iterations, render
+
+
+if __name__ == '__main__':
+    per_request, render = benchmark()
+    print(f"⏱️  Registrar un request: {per_request * 1e6:.2f} µs")
+    print(f"⏱️  Generar /__metrics: {render * 1e3:.2f} ms")
@@ -0,0 +1,229 @@
+"""
+===================================
+TOTALES INCREMENTALES DE PAGOS
+===================================
+Conteos y montos por período, estado, método de pago y moneda que se
+actualizan con cada evento, en la misma transacción que lo guarda
+
+Así el reporte de ventas (ingresos aprobados, tasa de rechazo, pagos
+por método) es leer unas pocas filas en lugar de recorrer todas las
+transacciones.
+
+- Cada transacción cuenta una sola vez, en el período de su created_at
+  (en UTC): si pasa de PENDING a APPROVED se resta de PENDING y se suma
+  a APPROVED, y una entrega repetida del mismo estado no cambia nada
+- Un PENDING que llega después de un estado final (los workers procesan
+  en paralelo) no revierte el estado final
+- Los montos se acumulan en centavos (enteros, sin error de redondeo)
+
+Lo usa transaction_store.py; las funciones reciben la conexión dentro
+de una transacción abierta.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+# Granularidades guardadas -> cantidad de caracteres del período ISO
+# ('2026-01-16T12:34' por minuto, '2026-01-16T12' por hora, '' total)
+GRANULARITIES = {'minute': 16, 'hour': 13, 'total': 0}
+
+# Estado no final: uno que llegue tarde no reemplaza APPROVED, DECLINED, etc.
+PENDING_STATUS = 'PENDING'
+
+# Marca en PRAGMA user_version: los totales ya se calcularon del historial
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollups (
+    granularity TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    status TEXT NOT NULL,
+    payment_method TEXT NOT NULL,
+    currency TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    amount_cents INTEGER NOT NULL,
+    PRIMARY KEY (granularity, bucket, status, payment_method, currency)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS transaction_state (
+    transaction_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    created_minute TEXT NOT NULL,
+    payment_method TEXT NOT NULL,
+    currency TEXT NOT NULL,
+    amount_cents INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+UPSERT_SQL = """
+INSERT INTO rollups (granularity, bucket, status, payment_method, currency, count, amount_cents)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (granularity, bucket, status, payment_method, currency)
+DO UPDATE SET count = count + excluded.count, amount_cents = amount_cents + excluded.amount_cents
+"""
+
+
+def bucket_minute(value):
+    """
+    Minuto UTC ('YYYY-MM-DDTHH:MM') de una fecha ISO
+    
+    Las fechas sin zona (el timestamp local del servidor) se toman como
+    hora local. Retorna None si la fecha no se puede leer.
+    """
+    if not value:
+        return None
+    try:
+        moment = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return moment.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M')
+
+
+def _add(conn, minute, status, payment_method, currency, count, amount_cents):
+    for granularity, length in GRANULARITIES.items():
+        conn.execute(UPSERT_SQL, (granularity, minute[:length], status, payment_method,
+                                  currency, count, count * amount_cents))
+
+
+def apply(conn, record):
+    """Actualizar los totales con un registro nuevo del log"""
+    transaction_id = record.get('transaction_id')
+    status = record.get('status')
+    if not transaction_id or not status:
+        return
+    payment_method = record.get('payment_method') or ''
+    currency = record.get('currency') or ''
+    amount_cents = round((record.get('amount') or 0) * 100)
+    
+    previous = conn.execute(
+        'SELECT status, created_minute, payment_method, currency, amount_cents '
+        'FROM transaction_state WHERE transaction_id = ?', (transaction_id,)).fetchone()
+    
+    if previous is None:
+        minute = (bucket_minute(record.get('created_at'))
+                  or bucket_minute(record.get('timestamp')))
+        if minute is None:
+            return
+        conn.execute('INSERT INTO transaction_state VALUES (?, ?, ?, ?, ?, ?)',
+                     (transaction_id, status, minute, payment_method, currency, amount_cents))
+        _add(conn, minute, status, payment_method, currency, 1, amount_cents)
+        return
+    
+    old_status, minute, old_method, old_currency, old_amount = tuple(previous)
+    if status == old_status or (status == PENDING_STATUS and old_status != PENDING_STATUS):
+        return
+    
+    # Cambio de estado: la transacción se mueve, sigue contando una vez
+    _add(conn, minute, old_status, old_method, old_currency, -1, old_amount)
+    _add(conn, minute, status, payment_method, currency, 1, amount_cents)
+    conn.execute('UPDATE transaction_state SET status = ?, payment_method = ?, currency = ?, '
+                 'amount_cents = ? WHERE transaction_id = ?',
+                 (status, payment_method, currency, amount_cents, transaction_id))
+
+
+def rebuild(conn, records):
+    """Recalcular los totales desde cero a partir del historial completo"""
+    conn.execute('DELETE FROM rollups')
+    conn.execute('DELETE FROM transaction_state')
+    for record in records:
+        apply(conn, record)
+    conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+
+def needs_rebuild(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION
+
+
+def read(conn, granularity, start=None, end=None, max_buckets=None):
+    """
+    Filas (bucket, status, payment_method, currency, count, amount_cents)
+    de los períodos más recientes primero
+    
+    start/end son minutos UTC ('YYYY-MM-DDTHH:MM', end excluido) y se
+    recortan a la granularidad; se leen a lo sumo max_buckets períodos.
+    Con 'total' y un rango se suman las horas y minutos del rango.
+    """
+    length = GRANULARITIES[granularity]
+    if not length and (start or end):
+        yield from _read_range_total(conn, start, end)
+        return
+    sql = ('SELECT bucket, status, payment_method, currency, count, amount_cents '
+           'FROM rollups WHERE granularity = ? AND count != 0')
+    params = [granularity]
+    if start and length:
+        sql += ' AND bucket >= ?'
+        params.append(start[:length])
+    if end and length:
+        sql += ' AND bucket < ?'
+        params.append(end[:length])
+    sql += ' ORDER BY bucket DESC'
+    
+    buckets = 0
+    last = None
+    for row in conn.execute(sql, params):
+        if row[0] != last:
+            buckets += 1
+            last = row[0]
+            if max_buckets is not None and buckets > max_buckets:
+                break
+        yield tuple(row)
+
+
+def _read_range_total(conn, start, end):
+    """
+    Filas 'total' de [start, end): las horas completas del rango salen de
+    las filas por hora y solo los bordes sueltos de las filas por minuto
+    """
+    hour_start = None
+    if start:
+        hour_start = start[:13]
+        if not start.endswith(':00'):
+            hour_start = (datetime.strptime(hour_start, '%Y-%m-%dT%H')
+                          + timedelta(hours=1)).strftime('%Y-%m-%dT%H')
+    hour_end = end[:13] if end else None
+    
+    minute = "granularity = 'minute' AND bucket >= ? AND bucket < ?"
+    if hour_start is not None and hour_end is not None and hour_start >= hour_end:
+        # El rango no tiene ninguna hora completa
+        parts, params = [minute], [start, end]
+    else:
+        hours, params = ["granularity = 'hour'"], []
+        if hour_start is not None:
+            hours.append('bucket >= ?')
+            params.append(hour_start)
+        if hour_end is not None:
+            hours.append('bucket < ?')
+            params.append(hour_end)
+        parts = [' AND '.join(hours)]
+        if hour_start is not None and hour_start + ':00' != start:
+            parts.append(minute)
+            params += [start, hour_start + ':00']
+        if hour_end is not None and hour_end + ':00' != end:
+            parts.append(minute)
+            params += [hour_end + ':00', end]
+    
+    sql = ("SELECT 'total', status, payment_method, currency, SUM(count), SUM(amount_cents) "
+           'FROM rollups WHERE ' + ' OR '.join(f'({part})' for part in parts)
+           + ' GROUP BY status, payment_method, currency HAVING SUM(count) != 0')
+    for row in conn.execute(sql, params):
+        yield tuple(row)
+
+
+def summarize(rows):
+    """
+    Resumen de un conjunto de filas de read(): conteos por estado,
+    ingresos aprobados por moneda y tasa de rechazo (sobre aprobadas +
+    rechazadas)
+    """
+    by_status = {}
+    approved_amount = {}
+    for _, status, _, currency, count, amount_cents in rows:
+        by_status[status] = by_status.get(status, 0) + count
+        if status == 'APPROVED':
+            approved_amount[currency] = approved_amount.get(currency, 0) + amount_cents
+    approved = by_status.get('APPROVED', 0)
+    declined = by_status.get('DECLINED', 0)
+    return {
+        'count': sum(by_status.values()),
+        'by_status': by_status,
+        'approved_amount': {currency: cents / 100 for currency, cents in approved_amount.items()},
+        'decline_rate': round(declined / (approved + declined), 4) if approved + declined else None,
+    }
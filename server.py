@@ -5,17 +5,1079 @@ Con caché, compresión, proxy para Wompi y mejor rendimiento
 """
 import http.server
 import socketserver
+import socket
+import signal
+import time
 import os
+import re
+import posixpath
 import gzip
 import io
+import hashlib
 import json
-import urllib.request
+import queue
+import ssl
+import http.client
 import urllib.parse
-import urllib.error
+import threading
+import argparse
+import asyncio
+import contextlib
+import fnmatch
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict, deque
 from datetime import datetime, timedelta
-from email.utils import formatdate
+from email.utils import formatdate, parsedate_to_datetime
+from html.parser import HTMLParser
 
-class OptimizedSPAHandler(http.server.SimpleHTTPRequestHandler):
+import admission
+import asset_pipeline
+import metrics
+import status_events
+
+# Brotli es opcional: sin el paquete solo se generan variantes gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Presupuesto de memoria para la caché de archivos estáticos (en bytes)
+ASSET_CACHE_MAX_BYTES = int(os.environ.get('SPA_ASSET_CACHE_MB', '64')) * 1024 * 1024
+
+# Motor asyncio: conexiones simultáneas, threads para requests activos y
+# segundos que una conexión keep-alive puede quedar inactiva
+ASYNC_MAX_CONNECTIONS = 20000
+ASYNC_WORKERS = 32
+ASYNC_IDLE_TIMEOUT = 15
+
+# Threads aparte para /api/: si Wompi se pone lento, los requests del proxy
+# no pueden ocupar los threads que sirven el sitio estático
+ASYNC_PROXY_WORKERS = 24
+
+# Tamaño máximo del cuerpo de un request (los pagos de Wompi son pequeños)
+MAX_REQUEST_BODY = 1024 * 1024
+
+# URL base de Wompi (PRODUCCIÓN - pagos reales). Se puede apuntar a un
+# stub local para pruebas con WOMPI_API_BASE=http://127.0.0.1:9000/v1/
+WOMPI_API_BASE = os.environ.get('WOMPI_API_BASE', 'https://production.wompi.co/v1/')
+
+# Pool de conexiones hacia Wompi: tamaño máximo, segundos que una conexión
+# puede quedar inactiva antes de descartarla y timeout de cada request
+UPSTREAM_POOL_SIZE = 16
+UPSTREAM_IDLE_TIMEOUT = 50
+UPSTREAM_TIMEOUT = 30
+
+# Segundos que un request puede esperar turno para hablar con Wompi antes
+# de responder 503 (el pool limita los requests simultáneos al upstream)
+UPSTREAM_QUEUE_TIMEOUT = 2
+
+# Circuit breaker: con al menos BREAKER_MIN_CALLS llamadas en la ventana y
+# una proporción de fallos (errores, 5xx o respuestas más lentas que
+# BREAKER_SLOW_CALL) mayor a BREAKER_FAILURE_RATE, se deja de llamar a
+# Wompi durante BREAKER_COOLDOWN segundos
+BREAKER_WINDOW = 30
+BREAKER_MIN_CALLS = 10
+BREAKER_FAILURE_RATE = 0.5
+BREAKER_SLOW_CALL = 5
+BREAKER_COOLDOWN = 15
+
+# Tamaño de los bloques al reenviar cuerpos entre cliente y Wompi
+PROXY_CHUNK_SIZE = 16 * 1024
+
+# Caché de GETs del proxy: TTL en segundos por ruta de Wompi. Con TTL 0 no
+# se guarda la respuesta, pero los requests simultáneos se agrupan en uno.
+# Las rutas que no aparecen aquí van siempre directo a Wompi.
+PROXY_CACHE_TTLS = (
+    (re.compile(r'^merchants/[^/?]+$'), 300),           # acceptance tokens
+    (re.compile(r'^pse/financial_institutions$'), 3600),
+    (re.compile(r'^payment_methods(\?.*)?$'), 300),
+    (re.compile(r'^transactions/[^/?]+$'), 0),          # estado de pago: siempre fresco
+)
+PROXY_CACHE_MAX_ENTRIES = 512
+
+# Cada cuántos segundos se revisa el disco para actualizar el índice de archivos
+FILE_INDEX_POLL_INTERVAL = 2
+
+# Archivos de la carpeta que no son del sitio y nunca se sirven: las bases
+# de wompi_webhook.py (el -wal y el -shm además cambian con cada escritura
+# y no deben renovar el índice), el log JSON de transacciones, el código y
+# el manifiesto de --fingerprint. Se comparan en minúsculas (Windows)
+PRIVATE_FILE_PATTERNS = (
+    '*.db', '*.db-*', '*.sqlite', '*.sqlite-*', '*.jsonl', '*.migrated',
+    'transactions.json', '*.py', '*.pyc', asset_pipeline.MANIFEST_FILE,
+)
+PRIVATE_DIRS = frozenset({'__pycache__', 'node_modules'})
+
+# Variantes precomprimidas (codificación -> extensión), en orden de preferencia
+PRECOMPRESSED_VARIANTS = (('br', '.br'), ('gzip', '.gz'))
+
+# Rutas que se precomprimen al iniciar
+PRECOMPRESS_ROOTS = ('assets', 'index.html')
+
+# Archivos con hash en el nombre (ver asset_pipeline.py): su contenido no
+# cambia nunca, se cachean un año con immutable
+FINGERPRINT_CACHE_TIME = 31536000
+
+# Paquete de componentes: varios fragmentos de assets/components en una
+# sola respuesta (GET /__components?names=header,hero-section,footer)
+COMPONENT_BUNDLE_PATH = '/__components'
+COMPONENTS_URL = '/assets/components/'
+COMPONENT_BUNDLE_MAX = 32
+
+# Componentes visibles al cargar que --inline-components inserta en
+# index.html: (componente, id del contenedor)
+INLINE_COMPONENTS = (('header', 'header-container'), ('hero-section', 'app-container'))
+
+# Respuestas armadas (paquetes e index.html con componentes) en memoria
+GENERATED_CACHE_MAX_ENTRIES = 64
+
+# Recursos críticos del shell (CSS y JS de index.html, módulos que importa
+# main.js y el paquete de componentes inicial): se anuncian con headers
+# Link y 103 Early Hints en "/" y en las rutas del SPA
+COMPONENTS_LOADER_URL = '/assets/js/components-loader.js'
+PRELOAD_MAX_LINKS = 24
+# Imports estáticos de un módulo (los import() dinámicos no son críticos)
+STATIC_IMPORT_RE = re.compile(
+    r'''^\s*(?:import\s*(?:[\w$*{},\s]+?\s*from\s*)?|export\s*[\w$*{},\s]+?\s*from\s*)'''
+    r'''["'](\.\.?/[^"'?#]+)["']''', re.M)
+# Lista de preloadAllComponents() en components-loader.js
+PRELOAD_COMPONENTS_RE = re.compile(r'preloadAllComponents\s*\(\)\s*\{.*?\[(.*?)\]', re.S)
+COMPONENT_NAME_RE = re.compile(r'''\bname:\s*['"]([\w-]+)['"]''')
+
+# Avisos en vivo del estado de un pago (ver status_events.py):
+# GET /events/transactions/<referencia> con Server-Sent Events
+STATUS_EVENTS_PATH = '/events/transactions/'
+STATUS_REFERENCE_RE = re.compile(r'[A-Za-z0-9_.:-]{1,64}')
+# Comentario cada tantos segundos para que proxies y navegador no corten
+STATUS_STREAM_HEARTBEAT = 15
+# Duración máxima de una respuesta; EventSource se reconecta solo
+STATUS_STREAM_MAX_SECONDS = 300
+STATUS_STREAM_RETRY_MS = 3000
+# Eventos sin enviar que se guardan por cliente
+STATUS_STREAM_BACKLOG = 16
+STATUS_STREAM_RETRY_AFTER = 5
+# Modo threads: cada respuesta de avisos ocupa un thread hasta
+# STATUS_STREAM_MAX_SECONDS, así que se admiten pocas a la vez; con más,
+# 503 y el navegador vuelve a intentar unas pocas veces más tarde
+STATUS_STREAM_THREADED_MAX = 8
+
+# Métricas del proceso, expuestas en /__metrics
+METRICS_PATH = '/__metrics'
+METRICS = metrics.Registry()
+HTTP_METRICS = metrics.RequestMetrics(METRICS, 'spa')
+UPSTREAM_LATENCY = METRICS.histogram(
+    'spa_wompi_upstream_duration_seconds',
+    'Latencia de Wompi hasta recibir los headers de respuesta', ('outcome',))
+COMPRESSION_BYTES = METRICS.counter(
+    'spa_compression_bytes_total',
+    'Bytes de respuestas comprimidas, antes y después de comprimir', ('encoding', 'stage'))
+
+# Control de admisión (ver admission.py): (requests por segundo, ráfaga)
+# por IP y clase de ruta. Una carga completa del SPA pide unos 60 archivos
+ADMISSION_LIMITS = {
+    'static': (50, 200),
+    'spa_fallback': (5, 30),
+    'component_bundle': (5, 30),
+    'wompi_proxy': (5, 30),
+    'status_events': (1, 10),
+    'metrics': (5, 20),
+}
+ADMISSION_DEFAULT_LIMIT = (10, 50)
+# Requests en curso a la vez; los últimos lugares son solo para el proxy
+# de pagos. Los avisos en vivo cuentan mientras ocupan un thread (modo
+# threads); en modo asyncio se liberan al pasar al event loop
+ADMISSION_MAX_ACTIVE = 256
+ADMISSION_RESERVED = 32
+ADMISSION = admission.AdmissionController(
+    ADMISSION_LIMITS, ADMISSION_DEFAULT_LIMIT, ADMISSION_MAX_ACTIVE,
+    reserved=ADMISSION_RESERVED, priority=('wompi_proxy',))
+ADMISSION.register_metrics(METRICS, 'spa')
+METRICS.gauge('spa_status_subscribers', 'Clientes esperando avisos de estado de pago',
+              lambda: status_events.HUB.subscriber_count())
+METRICS.gauge('spa_status_subscriptions_rejected_total',
+              'Suscripciones rechazadas por límite de clientes',
+              lambda: status_events.HUB.rejected, kind='counter')
+METRICS.gauge('spa_status_events_received_total', 'Avisos de estado recibidos del webhook',
+              lambda: status_events.HUB.received, kind='counter')
+METRICS.gauge('spa_status_events_forged_total', 'Datagramas de estado descartados por firma inválida',
+              lambda: status_events.HUB.forged, kind='counter')
+
+
+def parse_accept_encoding(header):
+    """
+    Parsear Accept-Encoding a un dict {codificación: q}
+
+    'gzip;q=0.8, br' -> {'gzip': 0.8, 'br': 1.0}
+    """
+    codings = {}
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding] = q
+    return codings
+
+
+def negotiate_encoding(header, available):
+    """
+    Elegir la mejor codificación entre las disponibles
+
+    available va en orden de preferencia del servidor (ej. ['br', 'gzip']).
+    Retorna la codificación elegida o None para enviar el archivo original.
+    """
+    if not header or not available:
+        return None
+    codings = parse_accept_encoding(header)
+    default_q = codings.get('*', 0.0)
+    # El original solo gana si el cliente le da explícitamente un q mayor
+    best, best_q = None, codings.get('identity', 0.0)
+    for coding in available:
+        q = codings.get(coding, default_q)
+        # Con empate se prefiere la variante comprimida
+        if q > 0 and q >= best_q and (best is None or q > best_q):
+            best, best_q = coding, q
+    return best
+
+
+class RangeNotSatisfiable(Exception):
+    """El header Range pide bytes fuera del archivo (416)"""
+
+
+def parse_range(header, length):
+    """
+    Parsear un header Range de un solo rango de bytes
+
+    Retorna (inicio, fin) inclusivos, o None si el header se debe ignorar
+    (sintaxis inválida o varios rangos: se responde el archivo completo).
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, sep, last = spec.strip().partition('-')
+    if not sep:
+        return None
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else length - 1
+            if start >= length:
+                raise RangeNotSatisfiable()
+            if start > end:
+                return None
+        else:
+            # Rango de sufijo: los últimos N bytes
+            suffix = int(last)
+            if suffix == 0:
+                raise RangeNotSatisfiable()
+            start, end = max(length - suffix, 0), length - 1
+    except ValueError:
+        return None
+    return start, min(end, length - 1)
+
+
+class UpstreamUnavailable(Exception):
+    """El upstream no se puede usar ahora (circuito abierto o sin turno)"""
+    
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker por tasa de fallos y latencia
+    
+    closed: las llamadas pasan y se registra su resultado.
+    open: se rechazan de inmediato durante `cooldown` segundos.
+    half-open: pasa una sola llamada de prueba; si sale bien se cierra.
+    """
+    
+    def __init__(self, window=BREAKER_WINDOW, min_calls=BREAKER_MIN_CALLS,
+                 failure_rate=BREAKER_FAILURE_RATE, slow_call=BREAKER_SLOW_CALL,
+                 cooldown=BREAKER_COOLDOWN):
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call = slow_call
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._calls = deque()  # (momento, falló)
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.trips = 0
+    
+    def allow(self):
+        """True si la llamada puede ir al upstream"""
+        with self._lock:
+            if self.state == 'open':
+                if time.monotonic() - self._opened_at < self.cooldown:
+                    self.rejected += 1
+                    return False
+                self.state = 'half-open'
+            if self.state == 'half-open':
+                if self._probe_in_flight:
+                    self.rejected += 1
+                    return False
+                self._probe_in_flight = True
+            return True
+    
+    def record(self, ok, latency):
+        """Registrar el resultado de una llamada que allow() dejó pasar"""
+        failed = not ok or latency > self.slow_call
+        now = time.monotonic()
+        with self._lock:
+            if self.state == 'half-open':
+                self._probe_in_flight = False
+                if failed:
+                    self._trip(now)
+                else:
+                    self.state = 'closed'
+                    self._calls.clear()
+                return
+            
+            self._calls.append((now, failed))
+            while self._calls and now - self._calls[0][0] > self.window:
+                self._calls.popleft()
+            failures = sum(1 for _, call_failed in self._calls if call_failed)
+            if (len(self._calls) >= self.min_calls
+                    and failures / len(self._calls) > self.failure_rate):
+                self._trip(now)
+    
+    def cancel(self):
+        """Liberar una llamada que allow() dejó pasar pero que no se hizo"""
+        with self._lock:
+            if self.state == 'half-open':
+                self._probe_in_flight = False
+    
+    def _trip(self, now):
+        self.state = 'open'
+        self._opened_at = now
+        self._calls.clear()
+        self.trips += 1
+        print(f"🚨 Circuit breaker abierto: Wompi no responde bien, "
+              f"rechazando llamadas por {self.cooldown}s")
+    
+    def retry_after(self):
+        """Segundos sugeridos para el header Retry-After"""
+        with self._lock:
+            if self.state != 'open':
+                return 1
+            return max(1, int(self.cooldown - (time.monotonic() - self._opened_at)) + 1)
+    
+    def stats(self):
+        with self._lock:
+            return {'state': self.state, 'trips': self.trips, 'rejected': self.rejected}
+
+
+class _LimitedReader:
+    """Leer como máximo `length` bytes de un stream (cuerpo del request)"""
+    
+    def __init__(self, stream, length):
+        self._stream = stream
+        self._remaining = length
+        self.consumed = 0
+    
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b''
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._stream.read(size)
+        self._remaining -= len(data)
+        self.consumed += len(data)
+        return data
+
+
+class UpstreamPool:
+    """
+    Pool thread-safe de conexiones HTTP(S) persistentes hacia un upstream
+    
+    Reutiliza conexiones keep-alive para no pagar DNS + TCP + TLS en cada
+    request al proxy. Las conexiones inactivas por más de idle_timeout se
+    descartan y nunca hay más de max_size abiertas a la vez.
+    """
+    
+    def __init__(self, base_url, max_size=UPSTREAM_POOL_SIZE,
+                 idle_timeout=UPSTREAM_IDLE_TIMEOUT, timeout=UPSTREAM_TIMEOUT,
+                 queue_timeout=UPSTREAM_QUEUE_TIMEOUT, ssl_context=None, breaker=None,
+                 latency=None):
+        parts = urllib.parse.urlsplit(base_url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base_path = parts.path if parts.path.endswith('/') else parts.path + '/'
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.ssl_context = ssl_context
+        if self.scheme == 'https' and ssl_context is None:
+            self.ssl_context = ssl.create_default_context()
+        self.breaker = breaker
+        self.latency = latency  # Histogram opcional (etiqueta outcome)
+        
+        self._idle = deque()  # (conexión, último uso), la más reciente a la derecha
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self.requests = 0
+        self.evicted = 0
+        self.closed = 0
+        self.retired_uses = 0  # requests atendidos por conexiones ya cerradas
+        self.in_flight = 0
+        self.queue_rejections = 0
+    
+    def request(self, method, path, body=None, headers=None):
+        """Hacer un request al upstream y retornar (status, cuerpo completo)"""
+        with self.stream(method, path, body=body, headers=headers) as response:
+            return response.status, response.read()
+    
+    @contextlib.contextmanager
+    def stream(self, method, path, body=None, headers=None):
+        """
+        Hacer un request y entregar la respuesta sin leer su cuerpo
+        
+        body puede ser bytes o un objeto con read() (se envía por bloques).
+        Si el circuito está abierto o no hay turno dentro de queue_timeout
+        se lanza UpstreamUnavailable sin tocar la red.
+        
+        Si una conexión reutilizada resulta cerrada por el servidor se
+        reintenta una vez con una nueva (para POST solo si el envío falló
+        antes de mandar nada, así nunca se duplica un pago).
+        """
+        if self.breaker is not None and not self.breaker.allow():
+            raise UpstreamUnavailable('Wompi no disponible (circuit breaker abierto)',
+                                      self.breaker.retry_after())
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self.queue_rejections += 1
+            if self.breaker is not None:
+                self.breaker.cancel()
+            raise UpstreamUnavailable('Demasiados requests simultáneos a Wompi', 1)
+        
+        with self._lock:
+            self.in_flight += 1
+        started = time.monotonic()
+        conn = response = None
+        try:
+            try:
+                conn, response = self._open(method, path, body, headers)
+            except Exception:
+                self._record(False, time.monotonic() - started)
+                raise
+            self._record(response.status < 500, time.monotonic() - started)
+            yield response
+        finally:
+            if conn is not None:
+                # Solo vuelve al pool si el cuerpo se leyó completo
+                if response is not None and response.isclosed() and not response.will_close:
+                    self._checkin(conn)
+                else:
+                    self._close(conn)
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+    
+    def _record(self, ok, latency):
+        if self.breaker is not None:
+            self.breaker.record(ok, latency)
+        if self.latency is not None:
+            self.latency.observe(latency, ('ok' if ok else 'error',))
+    
+    def _open(self, method, path, body, headers):
+        conn, reused = self._checkout()
+        try:
+            return conn, self._send(conn, method, path, body, headers)
+        except (http.client.HTTPException, OSError):
+            self._close(conn)
+            retry_safe = method == 'GET' or (
+                not conn._pool_sent and not getattr(body, 'consumed', 0))
+            if not (reused and retry_safe):
+                raise
+        conn = self._new_connection()
+        try:
+            return conn, self._send(conn, method, path, body, headers)
+        except Exception:
+            self._close(conn)
+            raise
+    
+    def _send(self, conn, method, path, body, headers):
+        conn._pool_sent = False
+        conn.request(method, self.base_path + path, body=body, headers=headers or {})
+        conn._pool_sent = True
+        response = conn.getresponse()
+        conn._pool_uses += 1
+        with self._lock:
+            self.requests += 1
+        return response
+    
+    def _checkout(self):
+        """Tomar la conexión inactiva más reciente o crear una nueva"""
+        now = time.monotonic()
+        stale = []
+        conn = None
+        with self._lock:
+            while self._idle:
+                candidate, last_used = self._idle.pop()
+                if now - last_used > self.idle_timeout:
+                    stale.append(candidate)
+                    continue
+                conn = candidate
+                self.reused += 1
+                break
+        for candidate in stale:
+            self._close(candidate, evicted=True)
+        if conn is not None:
+            return conn, True
+        return self._new_connection(), False
+    
+    def _checkin(self, conn):
+        """Devolver una conexión al pool y descartar las más viejas"""
+        now = time.monotonic()
+        stale = []
+        with self._lock:
+            self._idle.append((conn, now))
+            while self._idle and now - self._idle[0][1] > self.idle_timeout:
+                stale.append(self._idle.popleft()[0])
+        for candidate in stale:
+            self._close(candidate, evicted=True)
+    
+    def _new_connection(self):
+        if self.scheme == 'https':
+            conn = http.client.HTTPSConnection(
+                self.host, self.port, timeout=self.timeout, context=self.ssl_context)
+        else:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        conn._pool_uses = 0
+        with self._lock:
+            self.created += 1
+        return conn
+    
+    def _close(self, conn, evicted=False):
+        conn.close()
+        with self._lock:
+            self.closed += 1
+            self.retired_uses += conn._pool_uses
+            if evicted:
+                self.evicted += 1
+    
+    def stats(self):
+        """Contadores del pool, incluyendo cuántas veces se reutiliza cada conexión"""
+        with self._lock:
+            idle_uses = sum(conn._pool_uses for conn, _ in self._idle)
+            return {
+                'idle': len(self._idle),
+                'created': self.created,
+                'reused': self.reused,
+                'requests': self.requests,
+                'evicted': self.evicted,
+                'closed': self.closed,
+                'in_flight': self.in_flight,
+                'queue_rejections': self.queue_rejections,
+                'requests_per_connection': (
+                    (self.retired_uses + idle_uses) / self.created if self.created else 0.0),
+            }
+
+
+class _Flight:
+    """Un request al upstream en curso que otros threads pueden esperar"""
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ProxyResponseCache:
+    """
+    Caché TTL con coalescencia de requests para los GET del proxy
+    
+    La clave es la ruta más el header Authorization. Solo se guardan
+    respuestas 200 y, si varios threads piden la misma clave a la vez, solo
+    uno va al upstream (single-flight) y los demás reciben su resultado.
+    """
+    
+    def __init__(self, rules=PROXY_CACHE_TTLS, max_entries=PROXY_CACHE_MAX_ENTRIES,
+                 wait_timeout=UPSTREAM_TIMEOUT * 2):
+        self.rules = rules
+        self.max_entries = max_entries
+        self.wait_timeout = wait_timeout
+        self._entries = OrderedDict()  # clave -> (expira, status, cuerpo)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.bypassed = 0
+        self.evictions = 0
+    
+    def ttl_for(self, path):
+        """TTL de la ruta, o None si la ruta no pasa por la caché"""
+        for pattern, ttl in self.rules:
+            if pattern.match(path):
+                return ttl
+        return None
+    
+    def note_bypass(self):
+        """Contar un GET que no pasa por la caché (se reenvía en streaming)"""
+        with self._lock:
+            self.bypassed += 1
+    
+    def fetch(self, path, authorization, loader):
+        """
+        Obtener (status, cuerpo, estado) usando la caché
+        
+        loader() hace el request real y retorna (status, cuerpo). El estado
+        es 'HIT', 'MISS', 'COALESCED' o 'BYPASS' (para el header X-Cache).
+        """
+        ttl = self.ttl_for(path)
+        if ttl is None:
+            with self._lock:
+                self.bypassed += 1
+            status, body = loader()
+            return status, body, 'BYPASS'
+        
+        auth_key = hashlib.sha256(authorization.encode()).hexdigest() if authorization else ''
+        key = (path, auth_key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1], entry[2], 'HIT'
+                del self._entries[key]
+            
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        
+        if not leader:
+            if not flight.done.wait(self.wait_timeout):
+                raise TimeoutError('Timeout esperando la respuesta de Wompi')
+            if flight.error is not None:
+                raise flight.error
+            return flight.result[0], flight.result[1], 'COALESCED'
+        
+        try:
+            flight.result = loader()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+                if flight.result is not None and flight.result[0] == 200 and ttl > 0:
+                    self._store(key, ttl, flight.result)
+            flight.done.set()
+        return flight.result[0], flight.result[1], 'MISS'
+    
+    def _store(self, key, ttl, result):
+        self._entries[key] = (time.monotonic() + ttl, result[0], result[1])
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    def stats(self):
+        """Contadores de uso de la caché del proxy"""
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'bypassed': self.bypassed,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            }
+
+
+class AssetCache:
+    """
+    Caché LRU en memoria para archivos estáticos
+
+    Guarda el contenido original y su versión gzip para no leer ni
+    comprimir de nuevo el mismo archivo en cada request. La clave es la
+    ruta y cada entrada recuerda (mtime, tamaño): si el archivo cambia en
+    disco la entrada deja de ser válida y se reemplaza.
+    """
+
+    def __init__(self, max_bytes=ASSET_CACHE_MAX_BYTES, max_entry_bytes=None):
+        self.max_bytes = max_bytes
+        # Archivos muy grandes (imágenes pesadas) no desplazan a todo lo demás
+        self.max_entry_bytes = max_entry_bytes or max_bytes // 8
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path, mtime, size):
+        """Retornar (raw, gzipped) si la versión en caché sigue vigente"""
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == mtime and entry[1] == size:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[2], entry[3]
+            self.misses += 1
+            return None
+
+    def put(self, path, mtime, size, raw, gzipped):
+        """Guardar una versión del archivo, expulsando las menos usadas"""
+        entry_bytes = len(raw) + (len(gzipped) if gzipped else 0)
+        if entry_bytes > self.max_entry_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old is not None:
+                self.current_bytes -= old[4]
+            self._entries[path] = (mtime, size, raw, gzipped, entry_bytes)
+            self.current_bytes += entry_bytes
+            while self.current_bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted[4]
+                self.evictions += 1
+
+    def stats(self):
+        """Contadores de uso de la caché"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+
+class GeneratedContent:
+    """
+    Caché de respuestas armadas a partir de varios archivos (paquetes de
+    componentes, index.html con componentes insertados)
+    
+    Cada respuesta recuerda la firma (url, mtime, tamaño) de sus archivos
+    de origen: si alguno cambia, la firma del índice ya no coincide y se
+    arma de nuevo en el siguiente request.
+    """
+    
+    def __init__(self, max_entries=GENERATED_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # clave -> (firma, raw, gzipped, hash)
+        self._lock = threading.Lock()
+    
+    def get(self, key, signature, build):
+        """Retornar (raw, gzipped, hash), llamando build() si cambió el origen"""
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached[0] == signature:
+                self._entries.move_to_end(key)
+                return cached[1:]
+        
+        raw = build()
+        gzipped = None
+        if len(raw) > 1024:
+            compressed = gzip.compress(raw, compresslevel=6, mtime=0)
+            if len(compressed) < len(raw):
+                gzipped = compressed
+        entry = (signature, raw, gzipped, hashlib.sha256(raw).hexdigest()[:32])
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry[1:]
+
+
+def status_frame(event):
+    """Un aviso de estado en formato text/event-stream"""
+    return f'data: {json.dumps(event, ensure_ascii=False)}\n\n'.encode('utf-8')
+
+
+class _ShellScanner(HTMLParser):
+    """
+    Recursos que el navegador pide al leer un HTML, en orden de aparición:
+    (href, rel, as, crossorigin) con rel preload, modulepreload o preconnect
+    """
+    
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.resources = []
+    
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'link' and attrs.get('href'):
+            rels = (attrs.get('rel') or '').lower().split()
+            crossorigin = 'crossorigin' in attrs
+            if 'stylesheet' in rels:
+                self.resources.append((attrs['href'], 'preload', 'style', crossorigin))
+            elif 'preconnect' in rels:
+                self.resources.append((attrs['href'], 'preconnect', None, crossorigin))
+            elif 'modulepreload' in rels:
+                self.resources.append((attrs['href'], 'modulepreload', None, crossorigin))
+            elif 'preload' in rels:
+                self.resources.append((attrs['href'], 'preload', attrs.get('as'), crossorigin))
+        elif tag == 'script' and attrs.get('src') and 'nomodule' not in attrs:
+            if (attrs.get('type') or '').lower() == 'module':
+                self.resources.append((attrs['src'], 'modulepreload', None, False))
+            else:
+                self.resources.append((attrs['src'], 'preload', 'script', 'crossorigin' in attrs))
+
+
+def local_url(base_url, ref):
+    """URL absoluta de una referencia del sitio, o None si es de otro origen"""
+    if re.match(r'^([a-z][a-z0-9+.-]*:|//)', ref, re.I):
+        return None
+    return posixpath.normpath(ref if ref.startswith('/') else base_url + ref)
+
+
+class _ContainerFinder(HTMLParser):
+    """
+    Posiciones (línea, columna) del elemento con id=container_id: inicio y
+    fin de su tag de apertura e inicio de su tag de cierre
+    """
+    
+    def __init__(self, container_id):
+        super().__init__(convert_charrefs=True)
+        self.container_id = container_id
+        self.tag = None
+        self.start = None
+        self.start_text = None
+        self.end = None
+        self.depth = 0
+    
+    def handle_starttag(self, tag, attrs):
+        if self.tag is None:
+            if dict(attrs).get('id') == self.container_id:
+                self.tag = tag
+                self.start = self.getpos()
+                self.start_text = self.get_starttag_text()
+                self.depth = 1
+        elif tag == self.tag and self.end is None:
+            self.depth += 1
+    
+    def handle_startendtag(self, tag, attrs):
+        pass  # <x/> no contiene nada ni cambia la profundidad
+    
+    def handle_endtag(self, tag):
+        if tag == self.tag and self.end is None:
+            self.depth -= 1
+            if self.depth == 0:
+                self.end = self.getpos()
+
+
+def inline_component(html, container_id, name, fragment):
+    """
+    Insertar un fragmento dentro del elemento con id=container_id
+    
+    Solo si el contenedor está vacío (espacios y comentarios no cuentan):
+    si ya tiene contenido o no se encuentra, el HTML queda igual y el
+    componente lo carga el JS. El contenedor queda marcado con
+    data-component para que components-loader.js no lo vuelva a pedir.
+    """
+    finder = _ContainerFinder(container_id)
+    finder.feed(html)
+    finder.close()
+    if finder.start is None or finder.end is None:
+        print(f"⚠️ No se encontró el contenedor #{container_id} para {name}")
+        return html
+    
+    # HTMLParser cuenta las líneas solo por \n
+    line_starts = [0]
+    for line in html.split('\n'):
+        line_starts.append(line_starts[-1] + len(line) + 1)
+    start = line_starts[finder.start[0] - 1] + finder.start[1]
+    content_start = start + len(finder.start_text)
+    content_end = line_starts[finder.end[0] - 1] + finder.end[1]
+    if re.sub(r'<!--.*?-->', '', html[content_start:content_end], flags=re.S).strip():
+        print(f"⚠️ #{container_id} ya tiene contenido: {name} no se inserta")
+        return html
+    return (html[:start] + finder.start_text[:-1] + f' data-component="{name}">'
+            + fragment + html[content_end:])
+
+
+def is_private_file(name):
+    """True si el archivo coincide con PRIVATE_FILE_PATTERNS"""
+    lowered = name.lower()
+    return any(fnmatch.fnmatchcase(lowered, pattern) for pattern in PRIVATE_FILE_PATTERNS)
+
+
+class FileEntry:
+    """Un archivo servible con todo lo que se necesita para responder"""
+    __slots__ = ('url', 'path', 'size', 'mtime_ns', 'ext', 'content_type',
+                 'cache_time', 'compressible', 'variants', 'immutable')
+    
+    def __init__(self, url, path, st, content_type, cache_time, compressible, variants,
+                 immutable=False):
+        self.url = url
+        self.path = path
+        self.size = st.st_size
+        self.mtime_ns = st.st_mtime_ns
+        self.ext = os.path.splitext(path)[1].lower()
+        self.content_type = content_type
+        self.cache_time = cache_time
+        self.compressible = compressible
+        self.variants = variants
+        self.immutable = immutable
+
+
+class FileIndex:
+    """
+    Índice en memoria de los archivos servibles
+    
+    Resuelve una URL a su archivo (o al index.html del SPA) con una sola
+    búsqueda en un dict, sin stat() por request. Un thread revisa el disco
+    cada poll_interval segundos y reemplaza el índice si algo cambió.
+    Los archivos y carpetas ocultos (.git, .github, ...) y los de
+    PRIVATE_FILE_PATTERNS y PRIVATE_DIRS no se sirven.
+    Las URLs de immutable_urls (nombres con hash) se cachean un año.
+    """
+    
+    def __init__(self, root, guess_type, compressible_types, cache_times,
+                 poll_interval=FILE_INDEX_POLL_INTERVAL, immutable_urls=frozenset()):
+        self.root = root
+        self.guess_type = guess_type
+        self.compressible_types = compressible_types
+        self.cache_times = cache_times
+        self.immutable_urls = immutable_urls
+        self.poll_interval = poll_interval
+        self.version = 0
+        self._files = {}        # '/assets/css/main.css' -> FileEntry
+        self._directories = {}  # '/' o '/carpeta' -> FileEntry de su index.html
+        self._signature = None
+        self._lock = threading.Lock()
+        self.refresh()
+    
+    def start_polling(self):
+        thread = threading.Thread(target=self._poll, name='file-index', daemon=True)
+        thread.start()
+    
+    def _poll(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.refresh()
+            except OSError as e:
+                print(f"⚠️ No se pudo actualizar el índice de archivos: {e}")
+    
+    def refresh(self):
+        """Recorrer el disco y reemplazar el índice si algo cambió"""
+        found = {}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [name for name in dirnames
+                           if not name.startswith('.') and name.lower() not in PRIVATE_DIRS]
+            rel = os.path.relpath(dirpath, self.root)
+            url_dir = '/' if rel == '.' else '/' + rel.replace(os.sep, '/') + '/'
+            for name in filenames:
+                if name.startswith('.') or is_private_file(name):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                found[url_dir + name] = (path, st)
+        
+        signature = {url: (st.st_mtime_ns, st.st_size) for url, (_, st) in found.items()}
+        if signature == self._signature:
+            return False
+        
+        files = {}
+        directories = {}
+        for url, (path, st) in found.items():
+            entry = self._build_entry(url, path, st, found)
+            files[url] = entry
+            if url.endswith('/index.html'):
+                directories[url[:-len('/index.html')] or '/'] = entry
+        
+        with self._lock:
+            self._files = files
+            self._directories = directories
+            self._signature = signature
+            self.version += 1
+        return True
+    
+    def _build_entry(self, url, path, st, found):
+        ext = os.path.splitext(path)[1].lower()
+        compressible = ext in self.compressible_types
+        variants = {}
+        if compressible:
+            # Una variante vale solo si conserva el mtime del original
+            for coding, suffix in PRECOMPRESSED_VARIANTS:
+                variant = found.get(url + suffix)
+                if variant is not None and variant[1].st_mtime_ns == st.st_mtime_ns:
+                    variants[coding] = variant[0]
+        immutable = url in self.immutable_urls
+        cache_time = FINGERPRINT_CACHE_TIME if immutable else self.cache_times.get(ext, 3600)
+        return FileEntry(url, path, st, self.guess_type(path), cache_time,
+                         compressible, variants, immutable)
+    
+    def update(self, entry, st):
+        """Reemplazar una entrada cuando el archivo cambió antes del próximo poll"""
+        fresh = FileEntry(entry.url, entry.path, st, entry.content_type,
+                          entry.cache_time, entry.compressible, {}, entry.immutable)
+        with self._lock:
+            if self._files.get(entry.url) is entry:
+                self._files[entry.url] = fresh
+                self.version += 1
+            for key, value in self._directories.items():
+                if value is entry:
+                    self._directories[key] = fresh
+        return fresh
+    
+    def resolve(self, url):
+        """
+        Resolver una URL a (entrada, es_fallback_spa)
+        
+        Archivo existente -> su entrada; carpeta con index.html -> ese
+        index; cualquier otra ruta -> /index.html (rutas del SPA). La
+        entrada es None solo si no existe /index.html.
+        """
+        path = url.split('?', 1)[0].split('#', 1)[0]
+        path = urllib.parse.unquote(path, errors='surrogatepass')
+        trailing_slash = path.endswith('/')
+        path = posixpath.normpath(path)
+        if path.startswith('//'):
+            path = '/' + path.lstrip('/')
+        
+        if not trailing_slash:
+            entry = self._files.get(path)
+            if entry is not None:
+                return entry, False
+        entry = self._directories.get(path)
+        if entry is not None:
+            return entry, False
+        return self._directories.get('/'), True
+    
+    def get(self, url):
+        """Entrada de un archivo concreto, o None"""
+        return self._files.get(url)
+
+
+class OptimizedSPAHandler(metrics.InstrumentedHandlerMixin, admission.AdmissionMixin,
+                          http.server.SimpleHTTPRequestHandler):
     """Handler optimizado con caché y compresión"""
     
     # Extensiones que se pueden comprimir
@@ -26,8 +1088,10 @@ class OptimizedSPAHandler(http.server.SimpleHTTPRequestHandler):
     # Configuración de caché por tipo de archivo (en segundos)
     CACHE_TIMES = {
         '.html': 0,  # No cachear HTML para SPA routing
-        '.css': 31536000,  # 1 año para CSS
-        '.js': 31536000,   # 1 año para JS
+        # CSS y JS con nombre fijo: caché corta (las copias con hash de
+        # --fingerprint usan FINGERPRINT_CACHE_TIME)
+        '.css': 300,
+        '.js': 300,
         '.png': 2592000,   # 30 días para imágenes
         '.jpg': 2592000,
         '.jpeg': 2592000,
@@ -39,23 +1103,85 @@ class OptimizedSPAHandler(http.server.SimpleHTTPRequestHandler):
         '.ttf': 31536000,
     }
     
+    # Caché compartida por todos los threads del servidor
+    asset_cache = AssetCache()
+    
+    # Conexiones persistentes compartidas por los dos handlers del proxy,
+    # con límite de requests simultáneos y circuit breaker
+    wompi_pool = UpstreamPool(WOMPI_API_BASE, breaker=CircuitBreaker(),
+                              latency=UPSTREAM_LATENCY)
+    
+    # Respuestas de GETs idempotentes a Wompi (acceptance tokens, bancos PSE)
+    wompi_cache = ProxyResponseCache()
+    
+    # Métricas por clase de ruta (static, spa_fallback, wompi_proxy,
+    # component_bundle, status_events, metrics)
+    request_metrics = HTTP_METRICS
+    
+    # Límites por cliente y clase de ruta (ADMISSION=off los desactiva)
+    admission_controller = ADMISSION if admission.ENABLED else None
+    
+    # Respuestas de avisos en curso en modo threads (None: sin límite propio)
+    status_stream_slots = threading.BoundedSemaphore(STATUS_STREAM_THREADED_MAX)
+    
+    # Paquetes de componentes e index.html armado, por versión de sus archivos
+    generated = GeneratedContent()
+    
+    # Componentes que se insertan en index.html (--inline-components)
+    inline_components = ()
+    
+    # Manifiesto de asset_pipeline (--fingerprint): el HTML se sirve
+    # minificado y apuntando a los archivos con hash
+    asset_manifest = None
+    
+    # Índice de archivos servibles, se crea con el primer request (ver file_index)
+    _file_index = None
+    _file_index_lock = threading.Lock()
+    
+    # Cache-Control elegido para la respuesta en curso (None: según self.path)
+    cache_time = None
+    immutable = False
+    
+    # Headers Link de la respuesta en curso (solo el shell los lleva)
+    preload_links = ()
+    
+    # (versión del índice, links) de los recursos críticos del shell
+    _shell_links = (None, ())
+    
+    # Hash del contenido por versión de archivo: ruta -> (mtime, tamaño, hash)
+    content_hashes = {}
+    
+    # Sufijo del ETag según de dónde sale el cuerpo comprimido
+    ETAG_SUFFIXES = {'br': '-br', 'gzip': '-gz', 'gzip-memory': '-gz6'}
+    
     def end_headers(self):
         """Añadir headers de caché y compresión antes de enviar"""
-        # Obtener extensión del archivo
-        _, ext = os.path.splitext(self.path)
+        # Política de caché del archivo servido, o según la extensión
+        cache_time = self.cache_time
+        if cache_time is None:
+            _, ext = os.path.splitext(self.path.split('?', 1)[0])
+            cache_time = self.CACHE_TIMES.get(ext.lower(), 3600)  # Default 1 hora
         
         # Configurar caché
-        cache_time = self.CACHE_TIMES.get(ext.lower(), 3600)  # Default 1 hora
-        if cache_time > 0:
-            self.send_header('Cache-Control', f'public, max-age={cache_time}')
+        if self.path.startswith('/api/'):
+            # Respuestas del proxy: el navegador no debe guardarlas (el estado
+            # de una transacción cambia); la caché está del lado del servidor
+            self.send_header('Cache-Control', 'no-store')
+        elif cache_time > 0:
+            self.send_header('Cache-Control', f'public, max-age={cache_time}'
+                             f'{", immutable" if self.immutable else ""}')
             # Calcular fecha de expiración
             expires = datetime.utcnow() + timedelta(seconds=cache_time)
             self.send_header('Expires', formatdate(expires.timestamp(), usegmt=True))
         else:
-            self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
+            # no-cache (sin no-store) para que el navegador revalide con ETag
+            self.send_header('Cache-Control', 'no-cache')
             self.send_header('Pragma', 'no-cache')
             self.send_header('Expires', '0')
         
+        if self.preload_links:
+            self.send_header('Link', ', '.join(self.preload_links))
+        
         # Headers de seguridad
         self.send_header('X-Content-Type-Options', 'nosniff')
         self.send_header('X-Frame-Options', 'SAMEORIGIN')
@@ -66,39 +1192,116 @@ class OptimizedSPAHandler(http.server.SimpleHTTPRequestHandler):
         """Manejar GET con soporte para SPA routing, compresión y proxy de Wompi"""
         # Si es una petición al proxy de Wompi, manejarla
         if self.path.startswith('/api/wompi/'):
+            self.route_class = 'wompi_proxy'
             self.handle_wompi_proxy_get()
             return
         
-        # Traducir la ruta para verificar si el archivo existe
-        file_path = self.translate_path(self.path)
+        if self.path == METRICS_PATH:
+            self.cache_time = 0
+            self.send_metrics(METRICS)
+            return
         
-        # Si es la raíz, servir index.html
-        if self.path == '/':
-            self.serve_with_compression()
+        if self.path.startswith(STATUS_EVENTS_PATH):
+            self.route_class = 'status_events'
+            self.serve_status_events()
             return
         
-        # Si el archivo existe físicamente, servirlo
-        if os.path.exists(file_path) and os.path.isfile(file_path):
-            self.serve_with_compression()
+        if self.path.split('?', 1)[0] == COMPONENT_BUNDLE_PATH:
+            self.route_class = 'component_bundle'
+            self.serve_component_bundle()
             return
         
-        # Si es un directorio que existe, buscar index.html dentro
-        if os.path.exists(file_path) and os.path.isdir(file_path):
-            index_path = os.path.join(file_path, 'index.html')
-            if os.path.exists(index_path):
-                self.path = self.path.rstrip('/') + '/index.html'
-                self.serve_with_compression()
-                return
+        self.serve_path()
+    
+    def do_HEAD(self):
+        """
+        HEAD: los mismos headers que GET, sin cuerpo
+        
+        Pasa por el mismo índice que GET (los archivos privados siguen
+        fuera y las rutas SPA dan el shell). El proxy de Wompi, las
+        métricas y el stream de estados solo responden a GET.
+        """
+        path = self.path.split('?', 1)[0]
+        if (path.startswith('/api/wompi/') or path == METRICS_PATH
+                or path.startswith(STATUS_EVENTS_PATH)):
+            self.cache_time = 0
+            self.send_response(405)
+            self.send_header('Allow', 'GET')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
         
-        # Para cualquier otra ruta (rutas SPA como /carrito, /tienda, etc.)
-        # servir index.html
-        self.path = '/index.html'
-        self.serve_with_compression()
+        if path == COMPONENT_BUNDLE_PATH:
+            self.route_class = 'component_bundle'
+            self.serve_component_bundle()
+            return
+        
+        self.serve_path()
+    
+    def serve_path(self):
+        """Servir un archivo del sitio (GET o HEAD) a partir del índice"""
+        # Resolver la ruta con el índice en memoria: archivo existente,
+        # index.html de una carpeta o, para rutas SPA como /carrito o
+        # /tienda, el index.html principal
+        entry, is_fallback = self.file_index().resolve(self.path)
+        self.route_class = 'spa_fallback' if is_fallback else 'static'
+        if entry is not None and entry.url == '/index.html':
+            # Shell del SPA: que el navegador pida CSS y JS mientras llega el HTML
+            self.preload_links = self.shell_preload_links()
+            self.send_early_hints()
+        if entry is not None and entry.ext == '.html' and (
+                self.asset_manifest is not None
+                or (self.inline_components and entry.url == '/index.html')):
+            self.serve_html(entry)
+            return
+        self.serve_with_compression(entry)
+    
+    def write_body(self, data):
+        """Escribir el cuerpo de la respuesta (nada si el request es HEAD)"""
+        if self.command != 'HEAD':
+            self.wfile.write(data)
+    
+    def admission_class(self):
+        """Clase de ruta del request para admission.py (el índice está en memoria)"""
+        path = self.path.split('?', 1)[0]
+        if path.startswith('/api/wompi/'):
+            return 'wompi_proxy'
+        if self.command not in ('GET', 'HEAD'):
+            return 'other'
+        if path == METRICS_PATH:
+            return 'metrics'
+        if path.startswith(STATUS_EVENTS_PATH):
+            return 'status_events'
+        if path == COMPONENT_BUNDLE_PATH:
+            return 'component_bundle'
+        _, is_fallback = self.file_index().resolve(self.path)
+        return 'spa_fallback' if is_fallback else 'static'
+    
+    def send_rejection(self, rejection):
+        # Sin la caché de la extensión pedida: un 429 no debe guardarse
+        self.cache_time = 0
+        super().send_rejection(rejection)
+    
+    def file_index(self):
+        """Índice de archivos compartido, creado la primera vez que se usa"""
+        index = OptimizedSPAHandler._file_index
+        if index is None:
+            with OptimizedSPAHandler._file_index_lock:
+                index = OptimizedSPAHandler._file_index
+                if index is None:
+                    manifest = self.asset_manifest
+                    index = FileIndex(self.directory, self.guess_type,
+                                      self.COMPRESSIBLE_TYPES, self.CACHE_TIMES,
+                                      immutable_urls=manifest.hashed_urls if manifest else frozenset())
+                    index.start_polling()
+                    OptimizedSPAHandler._file_index = index
+        return index
     
     def do_POST(self):
         """Manejar peticiones POST - principalmente para proxy de Wompi"""
         # Solo permitir proxy para rutas específicas de Wompi
         if self.path.startswith('/api/wompi/'):
+            self.route_class = 'wompi_proxy'
             self.handle_wompi_proxy()
         else:
             self.send_error(404, "Endpoint not found")
@@ -106,77 +1309,39 @@ class OptimizedSPAHandler(http.server.SimpleHTTPRequestHandler):
     def handle_wompi_proxy(self):
         """Proxy para peticiones a la API de Wompi"""
         try:
-            # Leer el cuerpo de la petición
+            # El cuerpo de la petición se reenvía por bloques, sin leerlo entero
             content_length = int(self.headers.get('Content-Length', 0))
-            post_data = self.rfile.read(content_length) if content_length > 0 else b''
+            post_data = _LimitedReader(self.rfile, content_length) if content_length > 0 else b''
             
             # Extraer la ruta de Wompi (remover /api/wompi/)
             wompi_path = self.path.replace('/api/wompi/', '')
             
-            # URL base de Wompi (PRODUCCIÓN - pagos reales)
-            wompi_base_url = 'https://production.wompi.co/v1/'
-            target_url = wompi_base_url + wompi_path
-            
             print(f"🔄 Proxy Wompi: {wompi_path}")
             
             # Preparar headers para la petición a Wompi
             headers = {
                 'Content-Type': 'application/json',
-                'Accept': 'application/json'
+                'Accept': 'application/json',
+                'Content-Length': str(max(content_length, 0))
             }
             
             # Si hay un Authorization header, pasarlo
             if 'Authorization' in self.headers:
                 headers['Authorization'] = self.headers['Authorization']
             
-            # Hacer la petición a Wompi
-            req = urllib.request.Request(
-                target_url,
-                data=post_data,
-                headers=headers,
-                method='POST'
-            )
-            
-            # Ejecutar la petición
-            with urllib.request.urlopen(req, timeout=30) as response:
-                response_data = response.read()
-                response_code = response.getcode()
-                
-                # Enviar respuesta al cliente
-                self.send_response(response_code)
-                self.send_header('Content-Type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
-                self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
-                self.send_header('Content-Length', str(len(response_data)))
-                self.end_headers()
-                self.wfile.write(response_data)
-                
+            # Hacer la petición a Wompi por una conexión del pool
+            response_code = self.stream_from_wompi(
+                'POST', wompi_path, headers, body=post_data, allow_methods='POST, OPTIONS')
+            if response_code < 400:
                 print(f"✅ Proxy Wompi exitoso: {response_code}")
-                
-        except urllib.error.HTTPError as e:
-            # Error HTTP de Wompi
-            error_data = e.read()
-            print(f"❌ Error Wompi HTTP {e.code}: {error_data.decode('utf-8', errors='ignore')}")
-            
-            self.send_response(e.code)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Content-Length', str(len(error_data)))
-            self.end_headers()
-            self.wfile.write(error_data)
             
+        except UpstreamUnavailable as e:
+            print(f"⏳ Proxy Wompi rechazado: {e}")
+            self.send_proxy_unavailable(e)
         except Exception as e:
             # Error general
-            error_msg = json.dumps({'error': str(e)}).encode('utf-8')
             print(f"❌ Error en proxy Wompi: {str(e)}")
-            
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Content-Length', str(len(error_msg)))
-            self.end_headers()
-            self.wfile.write(error_msg)
+            self.send_proxy_error(500, json.dumps({'error': str(e)}).encode('utf-8'))
     
     def handle_wompi_proxy_get(self):
         """Proxy para peticiones GET a la API de Wompi"""
@@ -184,10 +1349,6 @@ class OptimizedSPAHandler(http.server.SimpleHTTPRequestHandler):
             # Extraer la ruta de Wompi (remover /api/wompi/)
             wompi_path = self.path.replace('/api/wompi/', '')
             
-            # URL base de Wompi (PRODUCCIÓN - pagos reales)
-            wompi_base_url = 'https://production.wompi.co/v1/'
-            target_url = wompi_base_url + wompi_path
-            
             print(f"🔄 Proxy Wompi GET: {wompi_path}")
             
             # Preparar headers para la petición a Wompi
@@ -199,126 +1360,618 @@ class OptimizedSPAHandler(http.server.SimpleHTTPRequestHandler):
             if 'Authorization' in self.headers:
                 headers['Authorization'] = self.headers['Authorization']
             
-            # Hacer la petición a Wompi
-            req = urllib.request.Request(
-                target_url,
-                headers=headers,
-                method='GET'
-            )
+            # Las rutas sin regla de caché se reenvían en streaming
+            if self.wompi_cache.ttl_for(wompi_path) is None:
+                self.wompi_cache.note_bypass()
+                response_code = self.stream_from_wompi('GET', wompi_path, headers)
+                if response_code < 400:
+                    print(f"✅ Proxy Wompi GET exitoso: {response_code} (BYPASS)")
+                return
             
-            # Ejecutar la petición
-            with urllib.request.urlopen(req, timeout=30) as response:
-                response_data = response.read()
-                response_code = response.getcode()
-                
-                # Enviar respuesta al cliente
-                self.send_response(response_code)
-                self.send_header('Content-Type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-                self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
-                self.send_header('Content-Length', str(len(response_data)))
-                self.end_headers()
-                self.wfile.write(response_data)
-                
-                print(f"✅ Proxy Wompi GET exitoso: {response_code}")
-                
-        except urllib.error.HTTPError as e:
-            # Error HTTP de Wompi
-            error_data = e.read()
-            print(f"❌ Error Wompi HTTP {e.code}: {error_data.decode('utf-8', errors='ignore')}")
+            # Hacer la petición a Wompi por una conexión del pool, salvo que
+            # la respuesta esté en caché o ya haya un request igual en curso
+            response_code, response_data, cache_state = self.wompi_cache.fetch(
+                wompi_path, self.headers.get('Authorization'),
+                lambda: self.wompi_pool.request('GET', wompi_path, headers=headers))
             
-            self.send_response(e.code)
+            if response_code >= 400:
+                # Error HTTP de Wompi
+                print(f"❌ Error Wompi HTTP {response_code}: {response_data.decode('utf-8', errors='ignore')}")
+                self.send_proxy_error(response_code, response_data)
+                return
+            
+            # Enviar respuesta al cliente
+            self.send_response(response_code)
             self.send_header('Content-Type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Content-Length', str(len(error_data)))
+            self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
+            self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+            self.send_header('Content-Length', str(len(response_data)))
+            self.send_header('X-Cache', cache_state)
             self.end_headers()
-            self.wfile.write(error_data)
+            self.wfile.write(response_data)
+            
+            print(f"✅ Proxy Wompi GET exitoso: {response_code} ({cache_state})")
             
+        except UpstreamUnavailable as e:
+            print(f"⏳ Proxy Wompi GET rechazado: {e}")
+            self.send_proxy_unavailable(e)
         except Exception as e:
             # Error general
-            error_msg = json.dumps({'error': str(e)}).encode('utf-8')
             print(f"❌ Error en proxy Wompi GET: {str(e)}")
+            self.send_proxy_error(500, json.dumps({'error': str(e)}).encode('utf-8'))
+    
+    def stream_from_wompi(self, method, wompi_path, headers, body=None,
+                          allow_methods='GET, POST, OPTIONS'):
+        """
+        Reenviar la respuesta de Wompi al cliente por bloques
+        
+        Retorna el status de Wompi. Los errores (4xx/5xx) son pequeños y se
+        leen completos para poder registrarlos.
+        """
+        with self.wompi_pool.stream(method, wompi_path, body=body, headers=headers) as response:
+            if response.status >= 400:
+                # Error HTTP de Wompi
+                error_data = response.read()
+                print(f"❌ Error Wompi HTTP {response.status}: {error_data.decode('utf-8', errors='ignore')}")
+                self.send_proxy_error(response.status, error_data)
+                return response.status
             
-            self.send_response(500)
+            # Enviar respuesta al cliente
+            self.send_response(response.status)
             self.send_header('Content-Type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Content-Length', str(len(error_msg)))
+            self.send_header('Access-Control-Allow-Methods', allow_methods)
+            self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+            content_length = response.getheader('Content-Length')
+            if content_length is not None:
+                self.send_header('Content-Length', content_length)
+            else:
+                # Sin longitud conocida el final del cuerpo lo marca el cierre
+                self.send_header('Connection', 'close')
+                self.close_connection = True
             self.end_headers()
-            self.wfile.write(error_msg)
+            
+            try:
+                while True:
+                    chunk = response.read(PROXY_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    self.wfile.write(chunk)
+                    if content_length is None:
+                        self.response_bytes += len(chunk)
+            except (http.client.HTTPException, OSError) as e:
+                # Los headers ya salieron: solo queda cortar la conexión
+                print(f"❌ Proxy Wompi interrumpido: {e}")
+                self.close_connection = True
+            return response.status
+    
+    def send_proxy_unavailable(self, error):
+        """Responder 503 rápido cuando Wompi no se puede usar"""
+        error_data = json.dumps({'error': str(error)}).encode('utf-8')
+        self.send_response(503)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Retry-After', str(error.retry_after))
+        self.send_header('Content-Length', str(len(error_data)))
+        self.end_headers()
+        self.wfile.write(error_data)
+    
+    def send_proxy_error(self, code, error_data):
+        """Enviar un error del proxy de Wompi al cliente"""
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Content-Length', str(len(error_data)))
+        self.end_headers()
+        self.wfile.write(error_data)
 
     
     def do_OPTIONS(self):
         """Manejar peticiones OPTIONS para CORS preflight"""
+        if self.path.startswith('/api/wompi/'):
+            self.route_class = 'wompi_proxy'
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
         self.send_header('Access-Control-Max-Age', '86400')
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
     
-    def serve_with_compression(self):
+    def serve_with_compression(self, entry=None):
         """Servir archivo con compresión gzip si es apropiado"""
-        # Obtener la ruta del archivo
-        path = self.translate_path(self.path)
-        
-        # Verificar si el archivo existe
-        if not os.path.exists(path):
+        # Obtener la entrada del archivo
+        if entry is None:
+            entry, _ = self.file_index().resolve(self.path)
+        if entry is None:
             self.send_error(404, "File not found")
             return
         
-        if os.path.isdir(path):
-            # Si es directorio, buscar index.html
-            index_path = os.path.join(path, 'index.html')
-            if os.path.exists(index_path):
-                path = index_path
-            else:
-                self.send_error(404, "File not found")
-                return
+        path = entry.path
+        compressible = entry.compressible
+        variants = entry.variants
+        accept_encoding = self.headers.get('Accept-Encoding', '')
+        self.cache_time = entry.cache_time
+        self.immutable = entry.immutable
+        
+        # Negociar la codificación: primero las variantes precomprimidas,
+        # luego el gzip en memoria si no hay .gz en disco
+        available = [coding for coding, _ in PRECOMPRESSED_VARIANTS if coding in variants]
+        if compressible and 'gzip' not in variants:
+            available.append('gzip')
+        encoding = negotiate_encoding(accept_encoding, available)
         
-        # Leer el archivo
+        # Elegir el cuerpo: las variantes precomprimidas y los archivos no
+        # comprimibles salen del disco con sendfile, el resto de la caché
+        body_file = content = None
+        etag_suffix = ''
         try:
-            with open(path, 'rb') as f:
-                content = f.read()
+            if encoding in variants:
+                body_file = open(variants[encoding], 'rb')
+                etag_suffix = self.ETAG_SUFFIXES[encoding]
+            elif compressible and entry.size <= self.asset_cache.max_entry_bytes:
+                raw, gzipped = self.load_asset(entry)
+                # Usar la versión comprimida solo si realmente reduce el tamaño
+                if encoding == 'gzip' and gzipped is not None:
+                    content = gzipped
+                    etag_suffix = self.ETAG_SUFFIXES['gzip-memory']
+                else:
+                    content, encoding = raw, None
+            else:
+                body_file, encoding = open(path, 'rb'), None
         except IOError:
             self.send_error(404, "File not found")
             return
         
-        # Verificar si debemos comprimir
-        _, ext = os.path.splitext(path)
-        accept_encoding = self.headers.get('Accept-Encoding', '')
-        should_compress = (
-            ext.lower() in self.COMPRESSIBLE_TYPES and
-            'gzip' in accept_encoding and
-            len(content) > 1024  # Solo comprimir si es mayor a 1KB
-        )
-        
-        # Comprimir si es apropiado
-        if should_compress:
-            # Comprimir contenido
-            buf = io.BytesIO()
-            with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=6) as gz:
-                gz.write(content)
-            compressed_content = buf.getvalue()
+        try:
+            if body_file:
+                # Un solo fstat sobre el fd abierto: la longitud real y, si el
+                # archivo original cambió antes del próximo poll, la entrada nueva
+                st = os.fstat(body_file.fileno())
+                length = st.st_size
+                if not encoding and (st.st_size, st.st_mtime_ns) != (entry.size, entry.mtime_ns):
+                    entry = self.file_index().update(entry, st)
+            else:
+                length = len(content)
+            mtime = entry.mtime_ns / 1e9
+            last_modified = formatdate(mtime, usegmt=True)
+            etag = f'"{self.content_hash(path, entry.mtime_ns, entry.size)}{etag_suffix}"'
             
-            # Solo usar compresión si realmente reduce el tamaño
-            if len(compressed_content) < len(content):
-                content = compressed_content
-                self.send_response(200)
-                self.send_header('Content-Encoding', 'gzip')
+            # Petición condicional: el cliente ya tiene esta versión
+            if self.not_modified(etag, mtime):
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Last-Modified', last_modified)
+                if compressible:
+                    self.send_header('Vary', 'Accept-Encoding')
+                self.end_headers()
+                return
+            
+            # Rango pedido por el cliente (descargas reanudadas, video, etc.)
+            try:
+                byte_range = self.requested_range(length, etag, last_modified)
+            except RangeNotSatisfiable:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{length}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            
+            if byte_range:
+                start, end = byte_range
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {start}-{end}/{length}')
             else:
+                start, end = 0, length - 1
                 self.send_response(200)
+                if encoding:
+                    COMPRESSION_BYTES.inc((encoding, 'original'), entry.size)
+                    COMPRESSION_BYTES.inc((encoding, 'compressed'), length)
+            if encoding:
+                self.send_header('Content-Encoding', encoding)
+            if compressible:
+                self.send_header('Vary', 'Accept-Encoding')
+            
+            # Enviar headers
+            self.send_header('Content-Type', entry.content_type)
+            self.send_header('Content-Length', str(end - start + 1))
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', last_modified)
+            self.send_header('Accept-Ranges', 'bytes')
+            self.end_headers()
+            
+            # Enviar contenido
+            if body_file:
+                self.send_file(body_file, start, end - start + 1)
+            else:
+                self.write_body(content[start:end + 1])
+        finally:
+            if body_file:
+                body_file.close()
+    
+    def serve_component_bundle(self):
+        """
+        Responder varios componentes en un solo JSON {nombre: html}
+        
+        Evita la cascada de un request por fragmento al cargar la página.
+        Se arma una vez por versión de los fragmentos y se revalida con
+        ETag (304) como cualquier archivo HTML.
+        """
+        # Tampoco se cachean los errores: la lista la arma el JS y un
+        # componente que falta puede aparecer en el próximo deploy
+        self.cache_time = 0
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        names = [name for value in query.get('names', []) for name in value.split(',') if name]
+        names = list(dict.fromkeys(names))
+        if not names or len(names) > COMPONENT_BUNDLE_MAX:
+            self.send_error(400, f"Indicar entre 1 y {COMPONENT_BUNDLE_MAX} componentes en names=")
+            return
+        
+        index = self.file_index()
+        entries = []
+        for name in names:
+            entry = index.get(f'{COMPONENTS_URL}{name}.html')
+            if entry is None:
+                self.send_error(404, f"Componente no encontrado: {name}")
+                return
+            entries.append(entry)
+        
+        def build():
+            bundle = {name: self.html_text(entry) for name, entry in zip(names, entries)}
+            return json.dumps(bundle, ensure_ascii=False).encode('utf-8')
+        
+        self.serve_generated(('bundle',) + tuple(names), entries, build,
+                             'application/json; charset=utf-8')
+    
+    def html_text(self, entry):
+        """Texto de un HTML como se envía: minificado y con nombres con hash (--fingerprint)"""
+        html = self.load_asset(entry)[0].decode('utf-8')
+        if self.asset_manifest is not None:
+            html = self.asset_manifest.rewrite_html(html)
+        return html
+    
+    def serve_html(self, entry):
+        """
+        Servir un HTML armado en memoria: con --fingerprint apunta a los
+        archivos con hash, y el index.html principal lleva insertados los
+        componentes de inline_components (el primer render no espera a
+        que el JS los pida)
+        """
+        parts = []
+        if entry.url == '/index.html':
+            index = self.file_index()
+            for name, container_id in self.inline_components:
+                fragment = index.get(f'{COMPONENTS_URL}{name}.html')
+                if fragment is not None:
+                    parts.append((name, container_id, fragment))
+        
+        def build():
+            html = self.html_text(entry)
+            for name, container_id, fragment in parts:
+                html = inline_component(html, container_id, name, self.html_text(fragment))
+            return html.encode('utf-8')
+        
+        self.serve_generated(('html', entry.url), [entry] + [part[2] for part in parts], build,
+                             entry.content_type)
+    
+    def serve_generated(self, key, sources, build, content_type):
+        """Enviar una respuesta de self.generated con gzip, ETag y 304"""
+        signature = tuple((source.url, source.mtime_ns, source.size) for source in sources)
+        raw, gzipped, digest = self.generated.get(key, signature, build)
+        self.cache_time = 0
+        
+        encoding = negotiate_encoding(self.headers.get('Accept-Encoding', ''),
+                                      ['gzip'] if gzipped is not None else [])
+        body = gzipped if encoding else raw
+        etag = f'"{digest}{self.ETAG_SUFFIXES["gzip-memory"] if encoding else ""}"'
+        mtime = max(source.mtime_ns for source in sources) / 1e9
+        last_modified = formatdate(mtime, usegmt=True)
+        
+        if self.not_modified(etag, mtime):
+            self.send_response(304)
         else:
             self.send_response(200)
+            if encoding:
+                self.send_header('Content-Encoding', encoding)
+                COMPRESSION_BYTES.inc((encoding, 'original'), len(raw))
+                COMPRESSION_BYTES.inc((encoding, 'compressed'), len(body))
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', last_modified)
+        self.end_headers()
+        if self.response_status == 200:
+            self.write_body(body)
+    
+    def shell_preload_links(self):
+        """Headers Link del shell, calculados una vez por versión del índice"""
+        index = self.file_index()
+        version, links = OptimizedSPAHandler._shell_links
+        if version != index.version:
+            version = index.version
+            links = self.build_preload_links(index)
+            OptimizedSPAHandler._shell_links = (version, links)
+        return links
+    
+    def build_preload_links(self, index):
+        """
+        Recursos críticos del shell como valores de header Link
+        
+        Sale de leer index.html tal como se envía (con --fingerprint, los
+        nombres con hash): hojas de estilo, scripts, preloads y preconnect,
+        los módulos que importa main.js (solo imports estáticos) y el
+        paquete de /__components que pide components-loader.js al iniciar.
+        """
+        shell = index.get('/index.html')
+        if shell is None:
+            return ()
+        links = {}  # url -> valor del header, en orden de prioridad
+        
+        def add(url, rel, as_type=None, crossorigin=False):
+            if url in links or len(links) >= PRELOAD_MAX_LINKS:
+                return
+            links[url] = (f'<{urllib.parse.quote(url, safe=":/?=&,")}>; rel={rel}'
+                          f'{f"; as={as_type}" if as_type else ""}'
+                          f'{"; crossorigin" if crossorigin else ""}')
+        
+        scanner = _ShellScanner()
+        scanner.feed(self.html_text(shell))
+        modules = []
+        for href, rel, as_type, crossorigin in scanner.resources:
+            if rel == 'preconnect':
+                if href.startswith(('https://', 'http://')):
+                    add(href, rel, crossorigin=crossorigin)
+                continue
+            url = local_url('/', href)
+            if url is None or index.get(url) is None:
+                continue
+            add(url, rel, as_type, crossorigin)
+            if rel == 'modulepreload':
+                modules.append(url)
+        
+        # Grafo de imports de los módulos, en anchura: primero lo más cercano
+        seen = set(modules)
+        pending = deque(modules)
+        while pending:
+            module = index.get(pending.popleft())
+            text = self.load_asset(module)[0].decode('utf-8', 'replace')
+            for ref in STATIC_IMPORT_RE.findall(text):
+                url = local_url(posixpath.dirname(module.url) + '/', ref)
+                if url not in seen and index.get(url) is not None:
+                    seen.add(url)
+                    add(url, 'modulepreload')
+                    pending.append(url)
+        
+        # El mismo request que hace fetchBundle() (los componentes
+        # insertados por --inline-components no se piden)
+        loader = index.get(COMPONENTS_LOADER_URL)
+        match = loader and PRELOAD_COMPONENTS_RE.search(
+            self.load_asset(loader)[0].decode('utf-8', 'replace'))
+        if match:
+            inlined = {name for name, _ in self.inline_components}
+            names = [name for name in COMPONENT_NAME_RE.findall(match.group(1))
+                     if name not in inlined]
+            if len(names) >= 2:
+                add(f'{COMPONENT_BUNDLE_PATH}?names={",".join(names)}', 'preload', 'fetch', True)
         
-        # Enviar headers
-        self.send_header('Content-Type', self.guess_type(path))
-        self.send_header('Content-Length', str(len(content)))
+        return tuple(links.values())
+    
+    def send_early_hints(self):
+        """
+        Enviar 103 Early Hints con los headers Link antes de la respuesta
+        
+        Solo en navegaciones de un navegador (Sec-Fetch-Mode: navigate)
+        con HTTP/1.1 (el motor --async): http.client y otros clientes
+        toman cualquier 1xx distinto de 100 como la respuesta final, y en
+        HTTP/1.0 no existen las respuestas 1xx.
+        """
+        if (not self.preload_links or self.protocol_version != 'HTTP/1.1'
+                or self.request_version != 'HTTP/1.1'
+                or self.headers.get('Sec-Fetch-Mode') != 'navigate'):
+            return
+        self.wfile.write(f'{self.protocol_version} 103 Early Hints\r\n'
+                         f'Link: {", ".join(self.preload_links)}\r\n\r\n'.encode('latin-1'))
+    
+    def serve_status_events(self):
+        """
+        Avisos en vivo del estado de un pago (Server-Sent Events)
+        
+        Envía el último estado conocido apenas el cliente se conecta y
+        cada cambio que publica wompi_webhook.py. La respuesta termina con
+        un estado final o tras STATUS_STREAM_MAX_SECONDS.
+        """
+        # Ninguna respuesta de esta ruta se cachea (ni el 404 ni un 503 pasajero)
+        self.cache_time = 0
+        reference = urllib.parse.unquote(self.path.split('?', 1)[0][len(STATUS_EVENTS_PATH):])
+        if not STATUS_REFERENCE_RE.fullmatch(reference):
+            self.send_error(404, "Referencia inválida")
+            return
+        
+        slots = self.status_stream_slots
+        if slots is not None and not slots.acquire(blocking=False):
+            self.send_status_busy(503)
+            return
+        try:
+            self.open_status_stream(reference)
+        finally:
+            if slots is not None:
+                slots.release()
+    
+    def send_status_busy(self, status):
+        """429/503 sin cuerpo para una suscripción que no se acepta"""
+        self.cache_time = 0
+        self.send_response(status)
+        self.send_header('Retry-After', str(STATUS_STREAM_RETRY_AFTER))
+        self.send_header('Content-Length', '0')
         self.end_headers()
+    
+    def open_status_stream(self, reference):
+        try:
+            events, subscription, last = self.subscribe_status(reference)
+        except status_events.SubscriberLimit as e:
+            # Por referencia: demasiadas pestañas del mismo pago (429);
+            # del proceso: el servidor está lleno (503)
+            self.send_status_busy(429 if e.per_reference else 503)
+            return
+        
+        self.close_connection = True
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+            self.send_header('Connection', 'close')
+            self.send_header('X-Accel-Buffering', 'no')
+            self.end_headers()
+            self.wfile.write(f'retry: {STATUS_STREAM_RETRY_MS}\n\n'.encode('ascii')
+                             + (status_frame(last) if last else b''))
+        except Exception:
+            subscription.close()
+            raise
+        
+        if last and last['status'] in status_events.FINAL_STATUSES:
+            subscription.close()
+            return
+        self.stream_status(events, subscription)
+    
+    def subscribe_status(self, reference):
+        """Suscribirse al hub: (cola de eventos, Subscription, último evento)"""
+        events = queue.Queue(STATUS_STREAM_BACKLOG)
+        
+        def deliver(event):
+            try:
+                events.put_nowait(event)
+            except queue.Full:
+                pass  # Cliente que no lee: ya tiene avisos pendientes
+        
+        subscription, last = status_events.HUB.subscribe(reference, deliver)
+        return events, subscription, last
+    
+    def stream_status(self, events, subscription):
+        """Enviar avisos hasta un estado final (modo threads: ocupa este thread)"""
+        deadline = time.monotonic() + STATUS_STREAM_MAX_SECONDS
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    event = events.get(timeout=min(remaining, STATUS_STREAM_HEARTBEAT))
+                except queue.Empty:
+                    self.wfile.write(b': ping\n\n')
+                    continue
+                self.wfile.write(status_frame(event))
+                if event['status'] in status_events.FINAL_STATUSES:
+                    break
+        except OSError:
+            pass  # El cliente cerró la conexión
+        finally:
+            subscription.close()
+    
+    def content_hash(self, path, mtime_ns, size):
+        """
+        Hash del contenido de un archivo, calculado una vez por versión
+        
+        Se recalcula solo cuando cambian el mtime o el tamaño.
+        """
+        cached = self.content_hashes.get(path)
+        if cached is not None and cached[0] == mtime_ns and cached[1] == size:
+            return cached[2]
+        
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                digest.update(chunk)
+        value = digest.hexdigest()[:32]
+        self.content_hashes[path] = (mtime_ns, size, value)
+        return value
+    
+    def not_modified(self, etag, mtime):
+        """
+        Evaluar If-None-Match / If-Modified-Since para responder 304
+        
+        If-None-Match tiene prioridad: si viene, If-Modified-Since se ignora.
+        """
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match:
+            if if_none_match.strip() == '*':
+                return True
+            # Comparación débil: W/"x" y "x" se consideran iguales
+            for tag in if_none_match.split(','):
+                tag = tag.strip()
+                if tag.startswith('W/'):
+                    tag = tag[2:]
+                if tag == etag:
+                    return True
+            return False
+        
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError, IndexError):
+                return False
+            if since is None:
+                return False
+            # Last-Modified tiene resolución de segundos
+            return int(mtime) <= since.timestamp()
+        return False
+    
+    def requested_range(self, length, etag, last_modified):
+        """
+        Rango de bytes a enviar según Range / If-Range, o None para todo
+        
+        Si If-Range no coincide con la versión actual (ETag fuerte o fecha
+        exacta) se ignora el rango y se envía el archivo completo.
+        """
+        range_header = self.headers.get('Range')
+        if not range_header or length == 0:
+            return None
+        if_range = self.headers.get('If-Range')
+        if if_range and if_range.strip() not in (etag, last_modified):
+            return None
+        return parse_range(range_header, length)
+    
+    def send_file(self, f, offset, count):
+        """
+        Enviar un tramo del archivo directo del fd al socket
+        
+        socket.sendfile usa os.sendfile cuando el sistema lo soporta (sin
+        copiar a memoria de Python) y si no hace el envío por bloques.
+        """
+        if count <= 0 or self.command == 'HEAD':
+            return
+        self.wfile.flush()
+        self.connection.sendfile(f, offset, count)
+    
+    def load_asset(self, entry):
+        """
+        Obtener (raw, gzipped) de un archivo usando la caché en memoria
+        
+        gzipped es None cuando el tipo no es comprimible, el archivo es
+        pequeño o la compresión no reduce el tamaño.
+        """
+        cached = self.asset_cache.get(entry.path, entry.mtime_ns, entry.size)
+        if cached is not None:
+            return cached
         
-        # Enviar contenido
-        self.wfile.write(content)
+        with open(entry.path, 'rb') as f:
+            raw = f.read()
+            st = os.fstat(f.fileno())
+        
+        gzipped = None
+        # Solo comprimir si es mayor a 1KB
+        if entry.compressible and len(raw) > 1024:
+            buf = io.BytesIO()
+            # mtime=0 para que el resultado sea siempre el mismo (ETag fuerte)
+            with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=6, mtime=0) as gz:
+                gz.write(raw)
+            if len(buf.getvalue()) < len(raw):
+                gzipped = buf.getvalue()
+        
+        self.asset_cache.put(entry.path, st.st_mtime_ns, st.st_size, raw, gzipped)
+        return raw, gzipped
     
     def log_message(self, format, *args):
         """Logging más limpio"""
@@ -330,17 +1983,553 @@ class OptimizedSPAHandler(http.server.SimpleHTTPRequestHandler):
         #     super().log_message(format, *args)
 
 
+def _cache_lookups():
+    asset = OptimizedSPAHandler.asset_cache.stats()
+    proxy = OptimizedSPAHandler.wompi_cache.stats()
+    return {
+        ('asset', 'hit'): asset['hits'],
+        ('asset', 'miss'): asset['misses'],
+        ('proxy', 'hit'): proxy['hits'],
+        ('proxy', 'miss'): proxy['misses'],
+        ('proxy', 'coalesced'): proxy['coalesced'],
+        ('proxy', 'bypass'): proxy['bypassed'],
+    }
+
+
+def _upstream_pool_counts():
+    stats = OptimizedSPAHandler.wompi_pool.stats()
+    return {(key,): stats[key] for key in ('idle', 'in_flight')}
+
+
+# Estado de las cachés y del pool, leído en cada scrape
+METRICS.gauge('spa_cache_lookups_total', 'Búsquedas en las cachés por resultado',
+              _cache_lookups, ('cache', 'result'), kind='counter')
+METRICS.gauge('spa_cache_hit_ratio', 'Proporción de aciertos de cada caché',
+              lambda: {('asset',): OptimizedSPAHandler.asset_cache.stats()['hit_rate'],
+                       ('proxy',): OptimizedSPAHandler.wompi_cache.stats()['hit_rate']},
+              ('cache',))
+METRICS.gauge('spa_asset_cache_bytes', 'Bytes en uso en la caché de archivos',
+              lambda: OptimizedSPAHandler.asset_cache.stats()['bytes'])
+METRICS.gauge('spa_wompi_pool_connections', 'Conexiones del pool de Wompi por estado',
+              _upstream_pool_counts, ('state',))
+METRICS.gauge('spa_wompi_queue_rejections_total',
+              'Requests al proxy rechazados por falta de turno',
+              lambda: OptimizedSPAHandler.wompi_pool.stats()['queue_rejections'], kind='counter')
+METRICS.gauge('spa_wompi_circuit_open', '1 si el circuit breaker de Wompi está abierto',
+              lambda: int(OptimizedSPAHandler.wompi_pool.breaker.stats()['state'] == 'open'))
+
+
+def _write_variant(path, data, source_stat):
+    """Escribir una variante de forma atómica con el mtime del original"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.utime(tmp_path, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+    os.replace(tmp_path, path)
+
+
+def precompress_file(path, force=False):
+    """
+    Generar las variantes .gz (y .br si hay brotli) de un archivo
+    
+    Retorna cuántas variantes se escribieron.
+    """
+    st = os.stat(path)
+    if st.st_size <= 1024:
+        return 0
+    
+    encoders = {'gzip': lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        encoders['br'] = lambda data: brotli.compress(data, quality=11)
+    
+    raw = None
+    written = 0
+    for coding, suffix in PRECOMPRESSED_VARIANTS:
+        if coding not in encoders:
+            continue
+        variant_path = path + suffix
+        if not force:
+            try:
+                if os.stat(variant_path).st_mtime_ns == st.st_mtime_ns:
+                    continue
+            except OSError:
+                pass
+        if raw is None:
+            with open(path, 'rb') as f:
+                raw = f.read()
+        encoded = encoders[coding](raw)
+        if len(encoded) < len(raw):
+            _write_variant(variant_path, encoded, st)
+            written += 1
+        elif os.path.exists(variant_path):
+            # No vale la pena: borrar la variante vieja
+            os.remove(variant_path)
+    return written
+
+
+def precompress_assets(roots=PRECOMPRESS_ROOTS, force=False):
+    """
+    Precomprimir todos los archivos comprimibles de assets/ e index.html
+    
+    Retorna (archivos revisados, variantes escritas).
+    """
+    files = []
+    for root in roots:
+        if os.path.isfile(root):
+            files.append(root)
+            continue
+        for dirpath, _, filenames in os.walk(root):
+            for name in filenames:
+                files.append(os.path.join(dirpath, name))
+    
+    checked = written = 0
+    for path in files:
+        _, ext = os.path.splitext(path)
+        if ext.lower() not in OptimizedSPAHandler.COMPRESSIBLE_TYPES:
+            continue
+        checked += 1
+        try:
+            written += precompress_file(path, force=force)
+        except OSError as e:
+            print(f"⚠️ No se pudo precomprimir {path}: {e}")
+    return checked, written
+
+
 class ThreadedTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
     """Servidor con soporte para múltiples threads"""
     allow_reuse_address = True
     daemon_threads = True
+    # Cola de listen() igual a la del modo --async: con la de socketserver (5)
+    # una ráfaga de conexiones pierde SYNs y espera el reintento de 1 s
+    request_queue_size = 1024
+
+
+class ReusePortTCPServer(ThreadedTCPServer):
+    """Servidor para --workers: varios procesos escuchan el mismo puerto"""
+    
+    def server_bind(self):
+        # El kernel reparte las conexiones entre los sockets con SO_REUSEPORT
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+
+class _LoopWriter:
+    """
+    wfile de un handler que corre en un thread del executor
+    
+    Cada escritura se agenda en el event loop y espera el drain, así el
+    thread no avanza más rápido de lo que el cliente recibe.
+    """
+    
+    def __init__(self, loop, writer, timeout):
+        self._loop = loop
+        self._writer = writer
+        self._timeout = timeout
+    
+    def write(self, data):
+        if data:
+            self._run(self._write(bytes(data)))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def sendfile(self, f, offset, count):
+        """Enviar un tramo de archivo con loop.sendfile (os.sendfile si se puede)"""
+        self._run(self._loop.sendfile(self._writer.transport, f, offset, count))
+    
+    async def _write(self, data):
+        self._writer.write(data)
+        await self._writer.drain()
+    
+    def _run(self, coro):
+        async def guarded():
+            return await asyncio.wait_for(coro, self._timeout)
+        return asyncio.run_coroutine_threadsafe(guarded(), self._loop).result()
+
+
+class AsyncHandlerMixin:
+    """
+    Adaptar un handler de http.server al motor asyncio
+    
+    El handler recibe el request ya leído (línea, headers y cuerpo) y
+    escribe la respuesta a través de _LoopWriter, así que la lógica de
+    rutas (SPA fallback, proxy de Wompi, caché) es exactamente la misma
+    que en el modo con threads.
+    """
+    protocol_version = 'HTTP/1.1'
+    
+    # (cola, Subscription) de una respuesta de avisos que sigue el event loop
+    status_stream = None
+    
+    # La espera no ocupa threads: alcanza con los límites del hub
+    status_stream_slots = None
+    
+    def __init__(self, raw_request, client_address, server, loop_writer):
+        # No se llama a BaseRequestHandler.__init__: no hay socket propio
+        self.client_address = client_address
+        self.server = server
+        self.directory = server.directory
+        self.rfile = io.BytesIO(raw_request)
+        self.wfile = loop_writer
+        self.loop = loop_writer._loop
+        self.close_connection = True
+    
+    def send_file(self, f, offset, count):
+        if count > 0 and self.command != 'HEAD':
+            self.wfile.sendfile(f, offset, count)
+    
+    def subscribe_status(self, reference):
+        events = asyncio.Queue(STATUS_STREAM_BACKLOG)
+        
+        def offer(event):
+            try:
+                events.put_nowait(event)
+            except asyncio.QueueFull:
+                pass
+        
+        subscription, last = status_events.HUB.subscribe(
+            reference, lambda event: self.loop.call_soon_threadsafe(offer, event))
+        return events, subscription, last
+    
+    def stream_status(self, events, subscription):
+        # La espera no ocupa el thread: sigue AsyncSPAServer._stream_status
+        self.status_stream = (events, subscription)
+
+
+class AsyncSPAServer:
+    """
+    Servidor HTTP/1.1 sobre asyncio con conexiones persistentes
+    
+    Las conexiones inactivas solo ocupan el event loop; los requests
+    activos se ejecutan en un pool acotado de threads con el mismo
+    handler del modo clásico.
+    """
+    
+    def __init__(self, address, handler_class, max_connections=ASYNC_MAX_CONNECTIONS,
+                 workers=ASYNC_WORKERS, idle_timeout=ASYNC_IDLE_TIMEOUT):
+        self.address = address
+        self.handler_class = type(
+            'Async' + handler_class.__name__, (AsyncHandlerMixin, handler_class), {})
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.directory = os.getcwd()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='spa')
+        self.proxy_executor = ThreadPoolExecutor(
+            max_workers=ASYNC_PROXY_WORKERS, thread_name_prefix='spa-proxy')
+        self.active_connections = 0
+        self.rejected_connections = 0
+        self.requests_served = 0
+        METRICS.gauge('spa_async_open_connections', 'Conexiones abiertas en el motor asyncio',
+                      lambda: self.active_connections)
+        METRICS.gauge('spa_async_rejected_connections_total',
+                      'Conexiones rechazadas por max_connections',
+                      lambda: self.rejected_connections, kind='counter')
+    
+    async def serve_forever(self, reuse_port=False):
+        host, port = self.address
+        server = await asyncio.start_server(
+            self._handle_connection, host or None, port,
+            reuse_address=True, reuse_port=reuse_port or None, backlog=1024)
+        
+        # SIGTERM: dejar de aceptar conexiones y terminar limpio
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, server.close)
+        except (NotImplementedError, AttributeError, RuntimeError):
+            pass  # Windows o event loop fuera del thread principal
+        
+        async with server:
+            try:
+                await server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+    
+    async def _handle_connection(self, reader, writer):
+        if self.active_connections >= self.max_connections:
+            self.rejected_connections += 1
+            writer.close()
+            return
+        
+        self.active_connections += 1
+        loop = asyncio.get_running_loop()
+        loop_writer = _LoopWriter(loop, writer, self.idle_timeout * 4)
+        peer = writer.get_extra_info('peername') or ('', 0)
+        try:
+            while True:
+                raw_request = await self._read_request(reader, writer)
+                if raw_request is None:
+                    break
+                
+                handler = self.handler_class(raw_request, peer[:2], self, loop_writer)
+                target = raw_request.split(b' ', 2)[1] if raw_request.count(b' ') >= 2 else b''
+                executor = self.proxy_executor if target.startswith(b'/api/') else self.executor
+                await loop.run_in_executor(executor, handler.handle_one_request)
+                self.requests_served += 1
+                if handler.status_stream is not None:
+                    await self._stream_status(reader, writer, *handler.status_stream)
+                    break
+                if handler.close_connection:
+                    break
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+        except Exception as e:
+            print(f"❌ Error en conexión {peer[0]}: {e}")
+        finally:
+            self.active_connections -= 1
+            writer.close()
+    
+    async def _stream_status(self, reader, writer, events, subscription):
+        """
+        Enviar los avisos de /events/transactions/ desde el event loop
+        
+        Un cliente esperando el estado de su pago solo ocupa esta
+        corrutina y su cola, ningún thread del executor.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + STATUS_STREAM_MAX_SECONDS
+        # El cliente no envía nada más: leer algo es que cerró la conexión,
+        # y su lugar en la referencia se libera sin esperar al heartbeat
+        closed = loop.create_task(reader.read(1))
+        try:
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                received = loop.create_task(events.get())
+                done, _ = await asyncio.wait(
+                    (received, closed), timeout=min(remaining, STATUS_STREAM_HEARTBEAT),
+                    return_when=asyncio.FIRST_COMPLETED)
+                if received not in done:
+                    received.cancel()
+                if closed in done:
+                    break
+                event = received.result() if received in done else None
+                writer.write(status_frame(event) if event else b': ping\n\n')
+                await asyncio.wait_for(writer.drain(), self.idle_timeout)
+                if event and event['status'] in status_events.FINAL_STATUSES:
+                    break
+        finally:
+            closed.cancel()
+            subscription.close()
+    
+    async def _read_request(self, reader, writer):
+        """
+        Leer un request completo (headers + cuerpo) o None para cerrar
+        
+        Un cliente que no envía nada durante idle_timeout se desconecta.
+        """
+        try:
+            head = await asyncio.wait_for(
+                reader.readuntil(b'\r\n\r\n'), self.idle_timeout)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                asyncio.TimeoutError, ConnectionError):
+            return None
+        
+        content_length = 0
+        for line in head.split(b'\r\n')[1:]:
+            name, _, value = line.partition(b':')
+            name = name.strip().lower()
+            if name == b'content-length':
+                try:
+                    content_length = int(value.strip())
+                except ValueError:
+                    content_length = -1
+            elif name == b'transfer-encoding':
+                # http.server tampoco soporta cuerpos chunked
+                content_length = -1
+        
+        if content_length < 0 or content_length > MAX_REQUEST_BODY:
+            status = '413 Payload Too Large' if content_length > 0 else '400 Bad Request'
+            writer.write(f'HTTP/1.1 {status}\r\nContent-Length: 0\r\n'
+                         f'Connection: close\r\n\r\n'.encode('latin-1'))
+            return None
+        
+        body = b''
+        if content_length:
+            try:
+                body = await asyncio.wait_for(
+                    reader.readexactly(content_length), self.idle_timeout)
+            except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                return None
+        return head + body
+    
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.proxy_executor.shutdown(wait=False, cancel_futures=True)
+
+
+def raise_fd_limit():
+    """Subir el límite de descriptores abiertos al máximo permitido (Unix)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard != resource.RLIM_INFINITY and soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+            soft = hard
+        except (ValueError, OSError):
+            pass
+    return soft
+
+
+def print_cache_stats():
+    """Mostrar los contadores de la caché de este proceso"""
+    stats = OptimizedSPAHandler.asset_cache.stats()
+    print(f"📊 Caché [pid {os.getpid()}]: {stats['hits']} hits, {stats['misses']} misses, "
+          f"{stats['evictions']} expulsiones, {stats['bytes'] // 1024} KB en uso")
+
+
+def run_server(port, use_async=False, max_connections=ASYNC_MAX_CONNECTIONS,
+               idle_timeout=ASYNC_IDLE_TIMEOUT, reuse_port=False):
+    """Atender requests en este proceso hasta Ctrl+C o SIGTERM"""
+    if status_events.HUB.start() is None:
+        print(f"⚠️ Puertos UDP {status_events.STATUS_EVENTS_PORT}-"
+              f"{status_events.STATUS_EVENTS_PORT + status_events.STATUS_EVENTS_PORTS - 1} "
+              f"ocupados: sin avisos de estado en vivo [pid {os.getpid()}]")
+    
+    if use_async:
+        httpd = AsyncSPAServer(("", port), OptimizedSPAHandler,
+                               max_connections=max_connections,
+                               idle_timeout=idle_timeout)
+        try:
+            asyncio.run(httpd.serve_forever(reuse_port=reuse_port))
+        finally:
+            httpd.shutdown()
+        return
+    
+    server_class = ReusePortTCPServer if reuse_port else ThreadedTCPServer
+    with server_class(("", port), OptimizedSPAHandler) as httpd:
+        # SIGTERM: shutdown() se llama desde otro thread porque bloquea
+        # hasta que serve_forever termina
+        signal.signal(signal.SIGTERM,
+                      lambda *_: threading.Thread(target=httpd.shutdown).start())
+        httpd.serve_forever()
+
+
+def supports_workers():
+    """El modo --workers necesita fork y SO_REUSEPORT"""
+    return hasattr(os, 'fork') and hasattr(socket, 'SO_REUSEPORT')
+
+
+# Segundos que el supervisor espera a los workers antes de forzar SIGKILL
+WORKER_SHUTDOWN_GRACE = 10
+
+
+def run_workers(count, serve):
+    """
+    Supervisor del modo --workers
+    
+    Hace fork de `count` procesos que ejecutan serve() (cada uno abre su
+    propio socket con SO_REUSEPORT), reinicia los que terminan de forma
+    inesperada y reenvía SIGINT/SIGTERM para un apagado ordenado.
+    """
+    workers = {}  # pid -> (índice, momento de inicio)
+    stopping = False
+    
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            # Proceso hijo: Ctrl+C llega a todo el grupo, pero el apagado
+            # lo coordina el supervisor con SIGTERM
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            code = 0
+            try:
+                serve()
+                print_cache_stats()
+            except Exception as e:
+                print(f"❌ Worker {index} falló: {e}")
+                code = 1
+            finally:
+                os._exit(code)
+        workers[pid] = (index, time.monotonic())
+    
+    def forward(signum, frame):
+        nonlocal stopping
+        if not stopping:
+            print(f"\n🛑 Deteniendo {len(workers)} workers...")
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+    
+    signal.signal(signal.SIGINT, forward)
+    signal.signal(signal.SIGTERM, forward)
+    for index in range(count):
+        spawn(index)
+    
+    deadline = None
+    while workers:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            if stopping:
+                deadline = deadline or time.monotonic() + WORKER_SHUTDOWN_GRACE
+                if time.monotonic() > deadline:
+                    for pid in list(workers):
+                        os.kill(pid, signal.SIGKILL)
+            time.sleep(0.2)
+            continue
+        
+        index, started = workers.pop(pid)
+        if stopping:
+            continue
+        print(f"⚠️ Worker {index} (pid {pid}) terminó con código "
+              f"{os.waitstatus_to_exitcode(status)} - reiniciando")
+        # Evitar un bucle de reinicios si el worker falla al arrancar
+        if time.monotonic() - started < 1:
+            time.sleep(1)
+        spawn(index)
+    
+    print("🛑 Servidor detenido")
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Servidor SPA optimizado')
+    parser.add_argument('--port', type=int, default=8000, help='Puerto (default: 8000)')
+    parser.add_argument('--precompress', action='store_true',
+                        help='Solo generar las variantes .gz/.br y salir')
+    parser.add_argument('--no-precompress', action='store_true',
+                        help='No precomprimir assets al iniciar')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='Usar el motor asyncio HTTP/1.1 con keep-alive')
+    parser.add_argument('--max-connections', type=int, default=ASYNC_MAX_CONNECTIONS,
+                        help=f'Conexiones simultáneas en modo --async (default: {ASYNC_MAX_CONNECTIONS})')
+    parser.add_argument('--idle-timeout', type=float, default=ASYNC_IDLE_TIMEOUT,
+                        help=f'Segundos de keep-alive inactivo en modo --async (default: {ASYNC_IDLE_TIMEOUT})')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Procesos que atienden el mismo puerto (default: 1)')
+    parser.add_argument('--inline-components', action='store_true',
+                        help='Servir index.html con header y hero ya insertados')
+    parser.add_argument('--fingerprint', action='store_true',
+                        help='Minificar assets y servirlos con hash en el nombre (caché immutable)')
+    parser.add_argument('--build', action='store_true',
+                        help='Solo generar los assets con hash y las variantes .gz/.br, y salir')
+    args = parser.parse_args()
+    
     # Cambiar al directorio del script
     os.chdir(os.path.dirname(os.path.abspath(__file__)))
     
-    PORT = 8000
+    PORT = args.port
+    if args.inline_components:
+        OptimizedSPAHandler.inline_components = INLINE_COMPONENTS
+    
+    if args.build or args.fingerprint:
+        manifest, written = asset_pipeline.build()
+        print(f"🔖 Assets con hash: {len(manifest)} archivos, {written} nuevos"
+              f" (manifiesto en {asset_pipeline.MANIFEST_FILE})")
+        if args.fingerprint:
+            OptimizedSPAHandler.asset_manifest = manifest
+    
+    if args.precompress or args.build or not args.no_precompress:
+        checked, written = precompress_assets(force=args.precompress)
+        print(f"🗜️  Precompresión: {checked} archivos revisados, {written} variantes generadas"
+              f" ({'gzip + brotli' if brotli else 'solo gzip'})")
+        if args.precompress or args.build:
+            raise SystemExit(0)
     
     print("=" * 60)
     print("🚀 Servidor SPA Optimizado")
@@ -351,15 +2540,44 @@ if __name__ == '__main__':
     print("=" * 60)
     print("✨ Características:")
     print("  • Caché HTTP optimizado")
-    print("  • Compresión gzip automática")
-    print("  • Soporte multi-thread")
+    print("  • Compresión gzip/brotli precalculada")
+    print(f"  • Caché en memoria ({ASSET_CACHE_MAX_BYTES // (1024 * 1024)} MB)")
+    if args.use_async:
+        fd_limit = raise_fd_limit()
+        print(f"  • Motor asyncio HTTP/1.1 con keep-alive ({args.max_connections} conexiones"
+              f"{f', límite de fds {fd_limit}' if fd_limit else ''})")
+    else:
+        print("  • Soporte multi-thread")
+    if args.fingerprint:
+        print("  • Assets minificados con hash en el nombre (caché immutable)")
     print("  • SPA routing")
+    print(f"  • Paquetes de componentes en {COMPONENT_BUNDLE_PATH}?names=...")
+    print(f"  • Estado de pagos en vivo en {STATUS_EVENTS_PATH}<referencia>")
+    if args.inline_components:
+        print(f"  • index.html con componentes insertados: "
+              f"{', '.join(name for name, _ in INLINE_COMPONENTS)}")
+    if admission.ENABLED:
+        print(f"  • Control de admisión: límites por IP, {ADMISSION_MAX_ACTIVE} requests en curso"
+              f" ({ADMISSION_RESERVED} reservados para pagos)")
+    print(f"  • Métricas Prometheus en http://localhost:{PORT}{METRICS_PATH}"
+          f" ({'Bearer METRICS_TOKEN' if metrics.METRICS_TOKEN else 'solo desde esta máquina'})")
     print("=" * 60)
     print("Presiona Ctrl+C para detener")
     print("=" * 60)
     
-    try:
-        with ThreadedTCPServer(("", PORT), OptimizedSPAHandler) as httpd:
-            httpd.serve_forever()
-    except KeyboardInterrupt:
+    def serve(reuse_port=False):
+        run_server(PORT, use_async=args.use_async, max_connections=args.max_connections,
+                   idle_timeout=args.idle_timeout, reuse_port=reuse_port)
+    
+    if args.workers > 1 and supports_workers():
+        print(f"👷 Modo multi-proceso: {args.workers} workers con SO_REUSEPORT")
+        run_workers(args.workers, lambda: serve(reuse_port=True))
+    else:
+        if args.workers > 1:
+            print("⚠️ --workers requiere fork y SO_REUSEPORT (Linux/macOS): usando un solo proceso")
+        try:
+            serve()
+        except KeyboardInterrupt:
+            pass
         print("\n\n🛑 Servidor detenido")
+        print_cache_stats()
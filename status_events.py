@@ -0,0 +1,330 @@
+"""
+===================================
+EVENTOS DE ESTADO DE TRANSACCIONES
+===================================
+Canal en memoria para avisar al navegador cuando cambia el estado de un
+pago, sin que tenga que consultar cada pocos segundos
+
+wompi_webhook.py publica cada evento procesado con publish(); cada
+proceso de server.py escucha con StatusHub.start() y entrega el evento a
+los clientes suscritos a esa referencia (Server-Sent Events en
+/events/transactions/<referencia>).
+
+Entre los dos procesos el canal es UDP en 127.0.0.1 (funciona igual en
+Windows, Linux y macOS): cada proceso del servidor toma el primer puerto
+libre de un rango y publish() envía el evento a todo el rango. Un
+datagrama que no llega se pierde sin más: la página de confirmación
+queda en pendiente hasta que el usuario la recarga o Wompi reenvía el
+evento (el navegador no consulta el estado por otra vía).
+
+Cualquier proceso de la máquina puede enviar a esos puertos, así que
+cada datagrama va firmado con HMAC-SHA256 y el hub descarta los que no
+traen una firma válida. La clave es STATUS_EVENTS_SECRET o, si no está
+definida, la del archivo STATUS_EVENTS_KEY_FILE (en la carpeta del
+usuario, fuera de la carpeta que sirve el SPA), que el primero de los
+dos procesos crea con permisos 0600.
+
+- Cada referencia admite a lo sumo MAX_SUBSCRIBERS_PER_REFERENCE
+  clientes y el proceso MAX_SUBSCRIBERS en total
+- El último estado de cada referencia se recuerda un tiempo, así un
+  cliente que se conecta después del webhook lo recibe igual
+- Un PENDING que llega después de un estado final no lo reemplaza (los
+  workers del webhook procesan en paralelo)
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import socket
+import threading
+import time
+from collections import OrderedDict
+
+# Rango de puertos UDP locales: base, base + 1, ... (uno por proceso)
+STATUS_EVENTS_HOST = '127.0.0.1'
+STATUS_EVENTS_PORT = int(os.environ.get('STATUS_EVENTS_PORT', '8790'))
+STATUS_EVENTS_PORTS = 16
+
+# Un evento cabe holgado en un datagrama; lo demás se descarta
+MAX_DATAGRAM = 8192
+
+# Clave compartida de las firmas (ver _secret)
+STATUS_EVENTS_SECRET = os.environ.get('STATUS_EVENTS_SECRET', '')
+STATUS_EVENTS_KEY_FILE = os.environ.get(
+    'STATUS_EVENTS_KEY_FILE', os.path.join(os.path.expanduser('~'), '.status_events_key'))
+
+# Suscriptores simultáneos por referencia y por proceso
+MAX_SUBSCRIBERS_PER_REFERENCE = 8
+MAX_SUBSCRIBERS = 10000
+
+# Últimos estados que se recuerdan: segundos y cantidad de referencias
+RECENT_TTL = 900
+RECENT_MAX = 10000
+
+# Campos que se publican (el navegador no necesita más, ni datos del cliente)
+EVENT_FIELDS = ('reference', 'transaction_id', 'status', 'timestamp')
+
+PENDING_STATUS = 'PENDING'
+FINAL_STATUSES = frozenset({'APPROVED', 'DECLINED', 'VOIDED', 'ERROR'})
+
+
+_key = None
+_key_lock = threading.Lock()
+
+
+def _secret():
+    """Clave de las firmas: STATUS_EVENTS_SECRET o el archivo de clave"""
+    global _key
+    if _key is None:
+        with _key_lock:
+            if _key is None:
+                _key = STATUS_EVENTS_SECRET.encode('utf-8') or _read_key_file(STATUS_EVENTS_KEY_FILE)
+    return _key
+
+
+def _read_key_file(path):
+    """Leer la clave o, si el archivo no existe, crearlo con una clave nueva (0600)"""
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(path, 'rb') as f:
+            key = f.read().strip()
+        if key:
+            return key
+        raise ValueError(f'{path} está vacío: borrarlo para generar una clave nueva')
+    key = secrets.token_hex(32).encode('ascii')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(key)
+    return key
+
+
+def sign(data, key=None):
+    """Datagrama firmado: HMAC-SHA256 en hex, un punto y el JSON"""
+    mac = hmac.new(key or _secret(), data, hashlib.sha256).hexdigest()
+    return mac.encode('ascii') + b'.' + data
+
+
+def verify(datagram, key=None):
+    """El JSON de un datagrama con firma válida, o None"""
+    mac, _, data = datagram.partition(b'.')
+    expected = hmac.new(key or _secret(), data, hashlib.sha256).hexdigest().encode('ascii')
+    return data if hmac.compare_digest(mac, expected) else None
+
+
+def publish(transaction_info, host=STATUS_EVENTS_HOST, port=STATUS_EVENTS_PORT,
+            ports=STATUS_EVENTS_PORTS):
+    """
+    Avisar a los procesos del servidor que cambió una transacción
+    
+    No espera respuesta ni falla: retorna a cuántos puertos se envió.
+    """
+    event = {field: transaction_info.get(field) for field in EVENT_FIELDS}
+    if not event['reference'] or not event['status']:
+        return 0
+    try:
+        data = sign(json.dumps(event, ensure_ascii=False).encode('utf-8'))
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Sin clave para firmar avisos de estado: {e}")
+        return 0
+    if len(data) > MAX_DATAGRAM:
+        return 0
+    
+    sent = 0
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        for offset in range(ports):
+            try:
+                sock.sendto(data, (host, port + offset))
+                sent += 1
+            except OSError:
+                pass
+    return sent
+
+
+class SubscriberLimit(Exception):
+    """No se aceptan más suscriptores (para la referencia o para el proceso)"""
+    
+    def __init__(self, message, per_reference):
+        super().__init__(message)
+        self.per_reference = per_reference
+
+
+class Subscription:
+    """Un cliente esperando eventos de una referencia"""
+    __slots__ = ('hub', 'reference', 'deliver')
+    
+    def __init__(self, hub, reference, deliver):
+        self.hub = hub
+        self.reference = reference
+        self.deliver = deliver
+    
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class StatusHub:
+    """
+    Suscriptores por referencia y últimos estados conocidos
+    
+    deliver es una función que recibe el evento (un dict) y no debe
+    bloquear: se llama desde el thread que escucha el canal. El servidor
+    usa un queue.Queue en modo threads y call_soon_threadsafe hacia el
+    event loop en modo asyncio, así un suscriptor inactivo no ocupa
+    ningún thread del hub.
+    """
+    
+    def __init__(self, max_per_reference=MAX_SUBSCRIBERS_PER_REFERENCE,
+                 max_subscribers=MAX_SUBSCRIBERS, recent_ttl=RECENT_TTL, recent_max=RECENT_MAX):
+        self.max_per_reference = max_per_reference
+        self.max_subscribers = max_subscribers
+        self.recent_ttl = recent_ttl
+        self.recent_max = recent_max
+        self._lock = threading.Lock()
+        self._subscribers = {}  # referencia -> lista de Subscription
+        self._count = 0
+        self._recent = OrderedDict()  # referencia -> (momento, evento)
+        self._listener = None
+        self.port = None
+        self.received = 0
+        self.delivered = 0
+        self.rejected = 0
+        self.forged = 0
+    
+    def subscribe(self, reference, deliver):
+        """
+        Registrar un suscriptor; retorna (Subscription, último evento o None)
+        
+        El último estado se lee en el mismo paso que el registro: un
+        evento que llega justo entonces no se pierde ni se duplica.
+        Lanza SubscriberLimit si la referencia o el proceso están llenos.
+        """
+        with self._lock:
+            subscribers = self._subscribers.get(reference, ())
+            if len(subscribers) >= self.max_per_reference:
+                self.rejected += 1
+                raise SubscriberLimit(f'Máximo {self.max_per_reference} suscriptores '
+                                      f'por referencia', per_reference=True)
+            if self._count >= self.max_subscribers:
+                self.rejected += 1
+                raise SubscriberLimit(f'Máximo {self.max_subscribers} suscriptores',
+                                      per_reference=False)
+            subscription = Subscription(self, reference, deliver)
+            self._subscribers.setdefault(reference, []).append(subscription)
+            self._count += 1
+            return subscription, self._last(reference)
+    
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.reference)
+            if not subscribers or subscription not in subscribers:
+                return
+            subscribers.remove(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.reference]
+            self._count -= 1
+    
+    def dispatch(self, event):
+        """Registrar un evento recibido y entregarlo a los suscriptores"""
+        reference = event.get('reference')
+        status = event.get('status')
+        if not reference or not status:
+            return 0
+        
+        with self._lock:
+            self.received += 1
+            last = self._last(reference)
+            if status == PENDING_STATUS and last and last['status'] != PENDING_STATUS:
+                return 0
+            if last and last['status'] == status:
+                # Reentrega de Wompi: los suscriptores ya lo tienen
+                return 0
+            self._remember(reference, event)
+            subscribers = list(self._subscribers.get(reference, ()))
+        
+        for subscription in subscribers:
+            try:
+                subscription.deliver(event)
+            except Exception as e:
+                print(f"⚠️ Error entregando evento de {reference}: {e}")
+        self.delivered += len(subscribers)
+        return len(subscribers)
+    
+    def _last(self, reference):
+        item = self._recent.get(reference)
+        if item is None:
+            return None
+        if time.monotonic() - item[0] > self.recent_ttl:
+            del self._recent[reference]
+            return None
+        return item[1]
+    
+    def _remember(self, reference, event):
+        now = time.monotonic()
+        self._recent[reference] = (now, event)
+        self._recent.move_to_end(reference)
+        while self._recent:
+            oldest_at = next(iter(self._recent.values()))[0]
+            if len(self._recent) <= self.recent_max and now - oldest_at <= self.recent_ttl:
+                break
+            self._recent.popitem(last=False)
+    
+    def subscriber_count(self):
+        return self._count
+    
+    def reference_count(self):
+        return len(self._subscribers)
+    
+    # ========================================
+    # CANAL ENTRE PROCESOS
+    # ========================================
+    
+    def start(self, host=STATUS_EVENTS_HOST, port=STATUS_EVENTS_PORT, ports=STATUS_EVENTS_PORTS):
+        """
+        Escuchar el canal en el primer puerto libre del rango
+        
+        Retorna el puerto, o None si están todos ocupados (el servidor
+        funciona igual, sin avisos en vivo). Llamarlo otra vez no hace nada.
+        """
+        if self._listener is not None:
+            return self.port
+        try:
+            key = _secret()
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Sin clave para verificar avisos de estado: {e}")
+            return None
+        for offset in range(ports):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                sock.bind((host, port + offset))
+            except OSError:
+                sock.close()
+                continue
+            self.port = port + offset
+            self._listener = threading.Thread(
+                target=self._listen, args=(sock, key), name='status-events', daemon=True)
+            self._listener.start()
+            return self.port
+        return None
+    
+    def _listen(self, sock, key):
+        while True:
+            try:
+                datagram, _ = sock.recvfrom(MAX_DATAGRAM)
+            except OSError:
+                return
+            data = verify(datagram, key)
+            if data is None:
+                # Sin firma o con otra clave: no viene de wompi_webhook.py
+                self.forged += 1
+                continue
+            try:
+                event = json.loads(data)
+            except ValueError:
+                continue
+            if isinstance(event, dict):
+                self.dispatch(event)
+
+
+# Hub del proceso, compartido por todos los handlers
+HUB = StatusHub()
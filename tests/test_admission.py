@@ -0,0 +1,87 @@
+"""
+===================================
+PRUEBAS DEL CONTROL DE ADMISIÓN
+===================================
+admission.py: buckets por cliente, límite global y la IP que se usa
+detrás del túnel
+
+    python -m unittest discover tests
+"""
+
+import unittest
+from email.message import Message
+from unittest import mock
+
+import admission
+from admission import AdmissionController, AdmissionMixin
+
+
+class FakeRequest(AdmissionMixin):
+    """Lo único que admission_client() lee de un handler"""
+    
+    def __init__(self, peer, forwarded=None):
+        self.client_address = (peer, 50000)
+        self.headers = Message()
+        if forwarded is not None:
+            self.headers['X-Forwarded-For'] = forwarded
+
+
+class AdmissionClientTest(unittest.TestCase):
+    """Por el túnel cada visitante tiene su propio bucket"""
+    
+    def test_tunnelled_request_uses_forwarded_address(self):
+        self.assertEqual(FakeRequest('127.0.0.1', '203.0.113.7').admission_client(), '203.0.113.7')
+        self.assertEqual(FakeRequest('::1', '198.51.100.1, 203.0.113.7').admission_client(),
+                         '203.0.113.7')
+    
+    def test_local_request_without_header_uses_peer(self):
+        self.assertEqual(FakeRequest('127.0.0.1').admission_client(), '127.0.0.1')
+    
+    def test_remote_peer_cannot_choose_its_bucket(self):
+        with mock.patch.object(admission, 'TRUST_FORWARDED', False):
+            self.assertEqual(FakeRequest('192.0.2.10', '203.0.113.7').admission_client(),
+                             '192.0.2.10')
+        with mock.patch.object(admission, 'TRUST_FORWARDED', True):
+            self.assertEqual(FakeRequest('192.0.2.10', '203.0.113.7').admission_client(),
+                             '203.0.113.7')
+
+
+class AdmissionControllerTest(unittest.TestCase):
+
+    def controller(self, **kwargs):
+        options = dict(limits={'spa': (5, 30), 'pay': None}, default_limit=(10, 50),
+                       max_active=4, reserved=1, priority=('pay',))
+        options.update(kwargs)
+        return AdmissionController(**options)
+    
+    def test_burst_then_rate_limited(self):
+        controller = self.controller(max_active=100)
+        for _ in range(30):
+            self.assertIsNone(controller.admit('203.0.113.7', 'spa'))
+            controller.release('spa')
+        rejection = controller.admit('203.0.113.7', 'spa')
+        self.assertEqual((rejection.status, rejection.reason), (429, admission.RATE_LIMITED))
+        # Otro visitante no comparte el bucket
+        self.assertIsNone(controller.admit('198.51.100.1', 'spa'))
+    
+    def test_reserved_slots_are_for_priority_classes(self):
+        controller = self.controller()
+        for n in range(3):
+            self.assertIsNone(controller.admit(f'192.0.2.{n}', 'spa'))
+        rejection = controller.admit('192.0.2.9', 'spa')
+        self.assertEqual((rejection.status, rejection.reason), (503, admission.OVERLOADED))
+        self.assertIsNone(controller.admit('192.0.2.9', 'pay'))
+        self.assertIsNotNone(controller.admit('192.0.2.10', 'pay'))
+        controller.release('spa')
+        self.assertIsNone(controller.admit('192.0.2.9', 'pay'))
+        self.assertEqual(controller.active(), 4)
+    
+    def test_exempt_class_is_not_counted(self):
+        controller = self.controller(exempt=('health',))
+        for n in range(10):
+            self.assertIsNone(controller.admit(f'192.0.2.{n}', 'health'))
+        self.assertEqual(controller.active(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+"""
+===================================
+PRUEBAS DEL PIPELINE DE ASSETS
+===================================
+asset_pipeline.py: el minificador no cambia lo que el código hace y un
+build repetido deja los mismos archivos con hash
+
+    python -m unittest discover tests
+
+Los builds se hacen en una carpeta temporal con assets de prueba.
+"""
+
+import glob
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import textwrap
+import unittest
+
+import asset_pipeline
+from asset_pipeline import minify_css, minify_js
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class MinifyJsTest(unittest.TestCase):
+    """Strings, regex y template literals se copian tal cual"""
+    
+    def test_division_is_not_a_regex(self):
+        self.assertEqual(minify_js('const half = (a + b) / 2 / 3; // mitad'),
+                         'const half = (a + b) / 2 / 3;\n')
+        self.assertEqual(minify_js('total = items.length / pages  /  2'),
+                         'total = items.length / pages / 2\n')
+    
+    def test_regex_literals_are_kept(self):
+        self.assertEqual(minify_js('const re = /ab+c  \\/\\/ x/g; // fin'),
+                         'const re = /ab+c  \\/\\/ x/g;\n')
+        # Un "/" dentro de una clase no cierra la regex
+        self.assertEqual(minify_js('if (x)   return /[/]  //.test(y)'),
+                         'if (x) return /[/]  //.test(y)\n')
+    
+    def test_template_literals_are_kept(self):
+        source = 'let t = `a  ${b + `c  ${d}`} //  no es comentario ${ {x: 1}.x }  `;'
+        self.assertEqual(minify_js(source), source + '\n')
+        source = 'html = `\n    <div>\n\n      ${ items.map(i => `<li>${i}</li>`).join("") }\n    </div>`'
+        self.assertEqual(minify_js(source), source + '\n')
+    
+    def test_comments_inside_strings_are_kept(self):
+        self.assertEqual(minify_js("const u = 'http://example.com/*x*/'; // fin"),
+                         "const u = 'http://example.com/*x*/';\n")
+        self.assertEqual(minify_js('const s = "a\\"//b"  /* c */ + "/*"'),
+                         'const s = "a\\"//b" + "/*"\n')
+    
+    def test_newlines_are_kept_for_asi(self):
+        source = textwrap.dedent('''\
+            let a = b
+                ++c
+            
+            
+            function f() {
+                return
+                    x
+            }
+            const d = 1  /* varias
+            líneas */  const e = 2
+        ''')
+        self.assertEqual(minify_js(source),
+                         'let a = b\n++c\nfunction f() {\nreturn\nx\n}\nconst d = 1\nconst e = 2\n')
+    
+    def test_license_comments_are_kept(self):
+        self.assertEqual(minify_js('/*! licencia MIT */\n  foo()'), '/*! licencia MIT */\nfoo()\n')
+    
+    @unittest.skipUnless(shutil.which('node'), 'node no está instalado')
+    def test_project_scripts_still_parse(self):
+        with tempfile.TemporaryDirectory() as folder:
+            for path in glob.glob(os.path.join(ROOT, 'assets', 'js', '**', '*.js'), recursive=True):
+                with open(path, encoding='utf-8') as f:
+                    minified = minify_js(f.read())
+                target = os.path.join(folder, 'check.mjs')
+                with open(target, 'w', encoding='utf-8') as f:
+                    f.write(minified)
+                result = subprocess.run(['node', '--check', target],
+                                        capture_output=True, text=True, timeout=60)
+                self.assertEqual(result.returncode, 0, f'{path}\n{result.stderr}')
+
+
+class MinifyCssTest(unittest.TestCase):
+
+    def test_whitespace_and_comments_are_removed(self):
+        source = 'a {\n  color : red ;\n  /* fondo */\n  margin: 0  1px;\n}\n\nb , i { top: 0 }'
+        self.assertEqual(minify_css(source), 'a{color :red;margin:0 1px}b,i{top:0}')
+    
+    def test_strings_and_selectors_are_kept(self):
+        # El espacio antes de ":" cambia el selector (a :hover != a:hover)
+        self.assertEqual(minify_css('a :hover , a:focus { content: "  /* x */  " }'),
+                         'a :hover,a:focus{content:"  /* x */  "}')
+
+
+class BuildTest(unittest.TestCase):
+    """build() en una carpeta temporal con un ciclo de imports"""
+    
+    FILES = {
+        'assets/js/main.js': "import { a } from './a.js';\nimport './lib/util.js';\na();\n",
+        'assets/js/a.js': "import { b } from './b.js';\nexport function a() { return b(); }\n",
+        'assets/js/b.js': "import { a } from './a.js';\nexport function b() { return 1; }\n",
+        'assets/js/lib/util.js': "export const util = 1;\n",
+        'assets/css/main.css': "@import 'base.css';\nbody { background: url(../img/logo.png); }\n",
+        'assets/css/base.css': "html { margin: 0; }\n",
+        'assets/img/logo.png': b'\x89PNG\r\n\x1a\nlogo',
+    }
+    
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='asset-build-test-')
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        for name, content in self.FILES.items():
+            path = os.path.join(self.dir, *name.split('/'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(content if isinstance(content, bytes) else content.encode('utf-8'))
+    
+    def build(self):
+        return asset_pipeline.build(self.dir)
+    
+    def read(self, url):
+        with open(os.path.join(self.dir, *url.lstrip('/').split('/')), 'rb') as f:
+            return f.read().decode('utf-8')
+    
+    def snapshot(self):
+        """{ruta relativa: contenido} de todo lo que hay en la carpeta"""
+        files = {}
+        for dirpath, _, filenames in os.walk(self.dir):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                with open(path, 'rb') as f:
+                    files[os.path.relpath(path, self.dir)] = f.read()
+        return files
+    
+    def test_second_build_is_stable(self):
+        manifest, written = self.build()
+        self.assertEqual(written, len(self.FILES))
+        before = self.snapshot()
+        
+        again, written = self.build()
+        self.assertEqual(written, 0)
+        self.assertEqual(again.files, manifest.files)
+        self.assertEqual(self.snapshot(), before)
+    
+    def test_references_point_to_hashed_names(self):
+        files = self.build()[0].files
+        main = self.read(files['/assets/js/main.js'])
+        self.assertIn("'./" + os.path.basename(files['/assets/js/a.js']) + "'", main)
+        self.assertIn("'./lib/" + os.path.basename(files['/assets/js/lib/util.js']) + "'", main)
+        css = self.read(files['/assets/css/main.css'])
+        self.assertIn(os.path.basename(files['/assets/css/base.css']), css)
+        self.assertIn('../img/' + os.path.basename(files['/assets/img/logo.png']), css)
+    
+    def test_circular_imports_are_rewritten(self):
+        files = self.build()[0].files
+        a, b = files['/assets/js/a.js'], files['/assets/js/b.js']
+        self.assertIn("'./" + os.path.basename(b) + "'", self.read(a))
+        self.assertIn("'./" + os.path.basename(a) + "'", self.read(b))
+        # Los dos archivos del ciclo comparten el hash del conjunto
+        self.assertEqual(a.rsplit('.', 2)[1], b.rsplit('.', 2)[1])
+    
+    def test_changed_file_replaces_old_copy(self):
+        old = self.build()[0].files
+        with open(os.path.join(self.dir, 'assets', 'js', 'lib', 'util.js'), 'a') as f:
+            f.write('export const other = 2;\n')
+        new = self.build()[0].files
+        
+        # Cambia util.js y también main.js, que lo importa
+        for url in ('/assets/js/lib/util.js', '/assets/js/main.js'):
+            self.assertNotEqual(new[url], old[url], url)
+            self.assertFalse(os.path.exists(os.path.join(self.dir, *old[url].split('/'))))
+        self.assertEqual(new['/assets/js/a.js'], old['/assets/js/a.js'])
+        with open(os.path.join(self.dir, asset_pipeline.MANIFEST_FILE), encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['files'], new)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,320 @@
+"""
+===================================
+PRUEBAS DE DURABILIDAD DEL WEBHOOK
+===================================
+Lo que wompi_webhook.py le promete a Wompi al responder 200: un evento
+confirmado está en disco una sola vez, y en /stats cada transacción
+cuenta una sola vez en su último estado
+
+    python -m unittest discover tests
+
+Cada prueba usa una carpeta temporal; no toca las bases del proyecto.
+"""
+
+import contextlib
+import io
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+from unittest import mock
+
+import rollups
+import webhook_queue
+import wompi_webhook
+from transaction_store import TransactionStore
+from webhook_queue import WebhookQueue
+from wompi_webhook import event_key
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Proceso que escribe con varios threads e imprime cada escritura
+# confirmada; no termina solo: la prueba lo mata con SIGKILL mientras
+# escribe (sin close(), sin checkpoint y sin flush)
+CRASH_WRITER = textwrap.dedent('''
+    import os, sys, threading
+    sys.path.insert(0, sys.argv[1])
+    from transaction_store import TransactionStore
+    from webhook_queue import WebhookQueue
+    
+    folder, durability, threads = sys.argv[2], sys.argv[3], int(sys.argv[4])
+    store = TransactionStore(os.path.join(folder, 'transactions.db'), durability=durability)
+    queue = WebhookQueue(os.path.join(folder, 'queue.db'), max_depth=10 ** 6,
+                         durability=durability)
+    output = threading.Lock()
+    
+    def write(worker):
+        for i in range(10 ** 5):
+            tx = f'tx-{worker}-{i}'
+            key = f'{tx}|APPROVED|1'
+            store.append({'transaction_id': tx, 'reference': f'REF-{tx}', 'status': 'APPROVED',
+                          'timestamp': '2026-10-18T12:00:00', 'amount': 1000, 'currency': 'COP'},
+                         event_key=key)
+            queue.put(b'{}', key=key)
+            with output:
+                print(tx, flush=True)
+    
+    for n in range(threads):
+        threading.Thread(target=write, args=(n,)).start()
+''')
+
+
+def wompi_event(transaction_id, status, timestamp=1760000000):
+    """Cuerpo de un evento transaction.updated como lo envía Wompi"""
+    return {
+        'event': 'transaction.updated',
+        'data': {'transaction': {'id': transaction_id, 'status': status,
+                                 'reference': f'REF-{transaction_id}'}},
+        'timestamp': timestamp,
+    }
+
+
+def put_event(queue, event):
+    """Encolar un evento igual que el handler de /webhook"""
+    return queue.put(json.dumps(event).encode('utf-8'), event_key(event))
+
+
+def count_rows(path, table):
+    """Filas de una tabla leídas con una conexión nueva"""
+    return len(column_values(path, f'SELECT 1 FROM {table}'))
+
+
+def column_values(path, sql):
+    """Primera columna de una consulta, leída con una conexión nueva"""
+    conn = sqlite3.connect(path)
+    try:
+        return [row[0] for row in conn.execute(sql)]
+    finally:
+        conn.close()
+
+
+class TempDirTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='webhook-test-')
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+    
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+
+class WebhookDedupTest(TempDirTestCase):
+    """Un reenvío de Wompi se confirma sin encolarse otra vez"""
+    
+    def test_duplicate_key_is_acknowledged_without_second_row(self):
+        path = self.path('queue.db')
+        queue = WebhookQueue(path, max_depth=10)
+        event = wompi_event('tx-1', 'APPROVED')
+        self.assertEqual(put_event(queue, event), webhook_queue.QUEUED)
+        self.assertEqual(put_event(queue, event), webhook_queue.DUPLICATE)
+        self.assertEqual(queue.depth(), 1)
+        queue.close()
+        
+        self.assertEqual(count_rows(path, 'webhook_queue'), 1)
+        self.assertEqual(count_rows(path, 'webhook_seen'), 1)
+    
+    def test_duplicate_key_is_remembered_after_restart(self):
+        path = self.path('queue.db')
+        event = wompi_event('tx-1', 'APPROVED')
+        queue = WebhookQueue(path, max_depth=10)
+        put_event(queue, event)
+        queue.close()
+        
+        queue = WebhookQueue(path, max_depth=10)
+        self.assertEqual(put_event(queue, event), webhook_queue.DUPLICATE)
+        queue.close()
+        self.assertEqual(count_rows(path, 'webhook_queue'), 1)
+    
+    def test_status_change_of_same_transaction_is_queued(self):
+        path = self.path('queue.db')
+        queue = WebhookQueue(path, max_depth=10)
+        self.assertEqual(put_event(queue, wompi_event('tx-1', 'PENDING')), webhook_queue.QUEUED)
+        self.assertEqual(put_event(queue, wompi_event('tx-1', 'APPROVED')), webhook_queue.QUEUED)
+        queue.close()
+        self.assertEqual(count_rows(path, 'webhook_queue'), 2)
+
+
+class CrashDurabilityTest(TempDirTestCase):
+    """
+    En los modos 'event' y 'group' cada escritura confirmada sobrevive a
+    que el proceso muera a mitad de otras escrituras ('interval' no lo
+    promete y no se prueba)
+    """
+    
+    THREADS = 8
+    # Escrituras confirmadas que se esperan antes de matar el proceso
+    KILL_AFTER = 200
+    
+    def kill_while_writing(self, durability):
+        """Transacciones que el proceso confirmó antes de morir"""
+        process = subprocess.Popen(
+            [sys.executable, '-c', CRASH_WRITER, ROOT, self.dir, durability, str(self.THREADS)],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        acked = []
+        try:
+            for line in process.stdout:
+                acked.append(line.strip())
+                if len(acked) >= self.KILL_AFTER:
+                    break
+            # SIGKILL (TerminateProcess en Windows) con los threads escribiendo
+            process.kill()
+            rest, errors = process.communicate(timeout=60)
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+        self.assertGreaterEqual(len(acked), self.KILL_AFTER, errors)
+        # Lo que alcanzó a imprimir antes de morir también estaba confirmado
+        acked += [line for line in rest.split('\n')[:-1] if line]
+        return acked
+    
+    def check_mode(self, durability):
+        acked = self.kill_while_writing(durability)
+        stored = column_values(self.path('transactions.db'),
+                               'SELECT transaction_id FROM transactions')
+        seen = column_values(self.path('queue.db'), 'SELECT key FROM webhook_seen')
+        self.assertEqual(len(stored), len(set(stored)))
+        self.assertEqual(set(acked) - set(stored), set())
+        self.assertEqual({f'{tx}|APPROVED|1' for tx in acked} - set(seen), set())
+    
+    def test_event_mode_persists_every_acknowledged_write(self):
+        self.check_mode('event')
+    
+    def test_group_mode_persists_every_acknowledged_write(self):
+        self.check_mode('group')
+
+
+class ReplayTest(TempDirTestCase):
+    """
+    Un evento que se procesa otra vez (el proceso murió después de
+    guardarlo y antes de que queue.done llegara al disco) se guarda y se
+    cuenta una sola vez
+    """
+    
+    def test_append_with_same_key_is_ignored(self):
+        store = TransactionStore(self.path('transactions.db'))
+        self.addCleanup(store.close)
+        record = {'transaction_id': 'tx-1', 'status': 'APPROVED', 'amount': 1000,
+                  'currency': 'COP', 'created_at': '2026-10-18T12:00:00+00:00'}
+        self.assertIsNotNone(store.append(record, event_key='tx-1|APPROVED|1'))
+        self.assertIsNone(store.append(record, event_key='tx-1|APPROVED|1'))
+        self.assertIsNotNone(store.append(record))
+        self.assertEqual(store.count(), 2)
+        self.assertEqual(rollups.summarize(store.stats('total'))['count'], 1)
+    
+    def test_reprocessed_webhook_event_is_stored_once(self):
+        store = TransactionStore(self.path('transactions.db'))
+        self.addCleanup(store.close)
+        event = wompi_event('tx-1', 'APPROVED')
+        event['data']['transaction'].update(amount_in_cents=59900, currency='COP',
+                                            created_at='2026-10-18T12:00:00+00:00')
+        with mock.patch.object(wompi_webhook, '_store', store), \
+                mock.patch.object(wompi_webhook.status_events, 'publish') as publish, \
+                contextlib.redirect_stdout(io.StringIO()):
+            wompi_webhook.process_webhook_event(event)
+            wompi_webhook.process_webhook_event(event)
+        self.assertEqual(store.count(), 1)
+        self.assertEqual(rollups.summarize(store.stats('total'))['approved_amount'], {'COP': 599.0})
+        # El aviso al navegador se repite: el primero pudo perderse
+        self.assertEqual(publish.call_count, 2)
+    
+    def test_old_database_gets_the_key_column(self):
+        path = self.path('transactions.db')
+        conn = sqlite3.connect(path)
+        conn.execute('CREATE TABLE transactions (seq INTEGER PRIMARY KEY AUTOINCREMENT, '
+                     'timestamp TEXT, event_type TEXT, transaction_id TEXT, reference TEXT, '
+                     'status TEXT, amount REAL, currency TEXT, payment_method TEXT, '
+                     'created_at TEXT, customer_email TEXT, data TEXT NOT NULL)')
+        conn.execute("INSERT INTO transactions (transaction_id, data) VALUES ('tx-0', '{}')")
+        conn.commit()
+        conn.close()
+        
+        store = TransactionStore(path)
+        self.addCleanup(store.close)
+        self.assertIsNotNone(store.append({'transaction_id': 'tx-1'}, event_key='tx-1|X|1'))
+        self.assertIsNone(store.append({'transaction_id': 'tx-1'}, event_key='tx-1|X|1'))
+        self.assertEqual(store.count(), 2)
+
+
+class RollupsTest(TempDirTestCase):
+    """Una transacción cuenta una vez en /stats, en su último estado"""
+    
+    def transaction(self, status, timestamp):
+        return {'transaction_id': 'tx-1', 'reference': 'REF-tx-1', 'status': status,
+                'timestamp': timestamp, 'created_at': '2026-10-18T12:00:00+00:00',
+                'amount': 59900, 'currency': 'COP', 'payment_method': 'CARD'}
+    
+    def test_pending_approved_approved_counts_once(self):
+        store = TransactionStore(self.path('transactions.db'))
+        self.addCleanup(store.close)
+        store.append(self.transaction('PENDING', '2026-10-18T12:00:05+00:00'))
+        store.append(self.transaction('APPROVED', '2026-10-18T12:01:00+00:00'))
+        store.append(self.transaction('APPROVED', '2026-10-18T12:01:30+00:00'))
+        
+        for granularity in ('total', 'hour', 'minute'):
+            summary = rollups.summarize(store.stats(granularity))
+            self.assertEqual(summary['count'], 1, granularity)
+            self.assertEqual(summary['by_status'], {'APPROVED': 1}, granularity)
+            self.assertEqual(summary['approved_amount'], {'COP': 59900}, granularity)
+        # El historial completo sigue en el log
+        self.assertEqual(store.count(), 3)
+    
+    def test_late_pending_does_not_undo_final_status(self):
+        store = TransactionStore(self.path('transactions.db'))
+        self.addCleanup(store.close)
+        store.append(self.transaction('APPROVED', '2026-10-18T12:01:00+00:00'))
+        store.append(self.transaction('PENDING', '2026-10-18T12:00:05+00:00'))
+        
+        summary = rollups.summarize(store.stats('total'))
+        self.assertEqual(summary['by_status'], {'APPROVED': 1})
+    
+    def test_rebuild_matches_incremental_totals(self):
+        path = self.path('transactions.db')
+        store = TransactionStore(path)
+        for status in ('PENDING', 'APPROVED', 'APPROVED'):
+            store.append(self.transaction(status, '2026-10-18T12:01:00+00:00'))
+        incremental = sorted(store.stats('minute'))
+        store.close()
+        
+        conn = sqlite3.connect(path)
+        try:
+            records = [json.loads(data) for data, in conn.execute(
+                'SELECT data FROM transactions ORDER BY seq')]
+            rollups.rebuild(conn, records)
+            conn.commit()
+            rebuilt = sorted(rollups.read(conn, 'minute'))
+        finally:
+            conn.close()
+        self.assertEqual(rebuilt, incremental)
+
+    def test_total_with_range_only_counts_transactions_inside(self):
+        store = TransactionStore(self.path('transactions.db'))
+        self.addCleanup(store.close)
+        created = ['2026-10-18T09:59', '2026-10-18T10:00', '2026-10-18T10:30',
+                   '2026-10-18T12:15', '2026-10-18T13:45', '2026-10-19T08:00']
+        for n, minute in enumerate(created):
+            store.append({'transaction_id': f'tx-{n}', 'status': 'APPROVED', 'amount': 1000,
+                          'currency': 'COP', 'created_at': minute + ':00+00:00'})
+        
+        def total(start, end):
+            return rollups.summarize(store.stats('total', start, end))['count']
+        
+        self.assertEqual(total('2030-01-01T00:00', '2031-01-01T00:00'), 0)
+        self.assertEqual(total(None, None), len(created))
+        for start, end in [('2026-10-18T10:00', '2026-10-18T13:00'),
+                           ('2026-10-18T10:15', '2026-10-18T13:50'),
+                           ('2026-10-18T10:15', '2026-10-18T10:45'),
+                           ('2026-10-18T12:00', None),
+                           (None, '2026-10-18T12:16')]:
+            expected = sum(1 for minute in created
+                           if (start is None or minute >= start) and (end is None or minute < end))
+            self.assertEqual(total(start, end), expected, (start, end))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,220 @@
+"""
+===================================
+PRUEBAS DEL SERVIDOR SPA
+===================================
+server.py: HEAD responde con los mismos headers que GET (ETag,
+Last-Modified, Link del shell, Cache-Control) y sin cuerpo; Range,
+Accept-Encoding, el circuit breaker del proxy y el índice de archivos
+
+    python -m unittest discover tests
+
+Las pruebas de HTTP usan el motor de threads en un puerto libre de 127.0.0.1
+sirviendo la carpeta del proyecto.
+"""
+
+import http.client
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Headers que cambian entre dos respuestas iguales
+VOLATILE_HEADERS = {'date'}
+
+
+class QuietHandler(server.OptimizedSPAHandler):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, directory=ROOT, **kwargs)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+class SPAServerTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = server.ThreadedTCPServer(('127.0.0.1', 0), QuietHandler)
+        thread = threading.Thread(target=cls.server.serve_forever, args=(0.05,), daemon=True)
+        thread.start()
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+    
+    def request(self, method, path, headers=None):
+        """(status, headers sin los volátiles, cuerpo) de un request"""
+        conn = http.client.HTTPConnection('127.0.0.1', self.server.server_address[1], timeout=10)
+        try:
+            conn.request(method, path, headers=headers or {})
+            response = conn.getresponse()
+            fields = {name.lower(): value for name, value in response.getheaders()
+                      if name.lower() not in VOLATILE_HEADERS}
+            return response.status, fields, response.read()
+        finally:
+            conn.close()
+
+
+class HeadTest(SPAServerTestCase):
+    """HEAD pasa por el mismo índice y los mismos headers que GET"""
+    
+    def assert_same_as_get(self, path, headers=None):
+        get_status, get_headers, body = self.request('GET', path, headers)
+        head_status, head_headers, head_body = self.request('HEAD', path, headers)
+        self.assertEqual(head_status, get_status, path)
+        self.assertEqual(head_headers, get_headers, path)
+        self.assertEqual(head_body, b'', path)
+        return get_status, get_headers, body
+    
+    def test_shell_headers(self):
+        for path in ('/', '/carrito'):
+            for headers in ({}, {'Accept-Encoding': 'gzip'}):
+                status, fields, _ = self.assert_same_as_get(path, headers)
+                self.assertEqual(status, 200)
+                for name in ('etag', 'last-modified', 'link', 'content-length'):
+                    self.assertIn(name, fields, (path, name))
+                self.assertEqual(fields['cache-control'], 'no-cache')
+    
+    def test_static_asset_headers(self):
+        status, fields, body = self.assert_same_as_get('/assets/css/main.css')
+        self.assertEqual(status, 200)
+        self.assertEqual(int(fields['content-length']), len(body))
+        self.assertIn('etag', fields)
+        self.assertNotEqual(fields['cache-control'], 'no-cache')
+    
+    def test_private_file_is_not_served(self):
+        _, shell, _ = self.request('HEAD', '/')
+        status, fields, _ = self.request('HEAD', '/server.py')
+        self.assertEqual(status, 200)
+        self.assertEqual(fields['etag'], shell['etag'])
+    
+    def test_dynamic_routes_only_answer_get(self):
+        for path in (server.METRICS_PATH, '/api/wompi/merchants/x'):
+            status, fields, _ = self.request('HEAD', path)
+            self.assertEqual(status, 405, path)
+            self.assertEqual(fields['allow'], 'GET')
+
+
+class ParseRangeTest(unittest.TestCase):
+
+    def test_single_ranges(self):
+        self.assertEqual(server.parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(server.parse_range('bytes=900-', 1000), (900, 999))
+        self.assertEqual(server.parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(server.parse_range('bytes=-5000', 1000), (0, 999))
+        self.assertEqual(server.parse_range('bytes=990-5000', 1000), (990, 999))
+    
+    def test_ignored_headers_send_whole_file(self):
+        for header in ('bytes=0-1,5-9', 'items=0-1', 'bytes=abc', 'bytes=5-1', 'bytes=5'):
+            self.assertIsNone(server.parse_range(header, 1000), header)
+    
+    def test_unsatisfiable(self):
+        for header in ('bytes=1000-', 'bytes=-0'):
+            with self.assertRaises(server.RangeNotSatisfiable):
+                server.parse_range(header, 1000)
+
+
+class NegotiateEncodingTest(unittest.TestCase):
+
+    def test_server_preference_and_q_values(self):
+        available = ['br', 'gzip']
+        self.assertEqual(server.negotiate_encoding('gzip, deflate, br', available), 'br')
+        self.assertEqual(server.negotiate_encoding('br;q=0.5, gzip', available), 'gzip')
+        self.assertEqual(server.negotiate_encoding('*', available), 'br')
+        self.assertEqual(server.negotiate_encoding('gzip;q=0, *;q=0.1', ['gzip']), None)
+    
+    def test_identity(self):
+        self.assertIsNone(server.negotiate_encoding('', ['gzip']))
+        self.assertIsNone(server.negotiate_encoding('gzip', []))
+        self.assertIsNone(server.negotiate_encoding('identity', ['gzip']))
+        self.assertIsNone(server.negotiate_encoding('gzip;q=0.5, identity', ['gzip']))
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def breaker(self, **kwargs):
+        options = dict(window=60, min_calls=4, failure_rate=0.5, slow_call=1.0, cooldown=30)
+        options.update(kwargs)
+        with mock.patch('builtins.print'):
+            return server.CircuitBreaker(**options)
+    
+    def trip(self, breaker):
+        with mock.patch('builtins.print'):
+            for ok in (True, False, False, False):
+                self.assertTrue(breaker.allow())
+                breaker.record(ok, 0.1)
+    
+    def test_opens_on_failure_rate(self):
+        breaker = self.breaker()
+        self.trip(breaker)
+        self.assertEqual(breaker.state, 'open')
+        self.assertFalse(breaker.allow())
+        self.assertGreater(breaker.retry_after(), 1)
+    
+    def test_slow_calls_count_as_failures(self):
+        breaker = self.breaker()
+        with mock.patch('builtins.print'):
+            for _ in range(4):
+                breaker.allow()
+                breaker.record(True, 5.0)
+        self.assertEqual(breaker.state, 'open')
+    
+    def test_half_open_lets_one_probe_through(self):
+        breaker = self.breaker(cooldown=0)
+        self.trip(breaker)
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, 'half-open')
+        self.assertFalse(breaker.allow())
+        breaker.record(True, 0.1)
+        self.assertEqual(breaker.state, 'closed')
+        self.assertTrue(breaker.allow())
+
+
+class FileIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='file-index-test-')
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        for name in ('index.html', 'server.py', 'transactions.db', '.env', 'app.js',
+                     'docs/index.html', '.git/config', '__pycache__/x.html'):
+            path = os.path.join(self.dir, *name.split('/'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(name)
+        self.index = server.FileIndex(self.dir, lambda path: 'text/plain',
+                                      {'.html', '.js'}, {'.html': 0})
+    
+    def url(self, path):
+        entry, is_fallback = self.index.resolve(path)
+        return entry.url, is_fallback
+    
+    def test_files_and_directories(self):
+        self.assertEqual(self.url('/app.js?v=2'), ('/app.js', False))
+        self.assertEqual(self.url('/docs/'), ('/docs/index.html', False))
+        self.assertEqual(self.url('/docs'), ('/docs/index.html', False))
+    
+    def test_spa_routes_and_private_files_get_the_shell(self):
+        for path in ('/carrito', '/server.py', '/transactions.db', '/.env', '/.git/config',
+                     '/__pycache__/x.html', '/docs/../server.py', '//server.py', '/app.js/'):
+            self.assertEqual(self.url(path), ('/index.html', True), path)
+    
+    def test_refresh_picks_up_changes(self):
+        version = self.index.version
+        self.assertFalse(self.index.refresh())
+        with open(os.path.join(self.dir, 'new.js'), 'w') as f:
+            f.write('x')
+        self.assertTrue(self.index.refresh())
+        self.assertEqual(self.index.version, version + 1)
+        self.assertEqual(self.url('/new.js'), ('/new.js', False))
+
+
+if __name__ == '__main__':
+    unittest.main()
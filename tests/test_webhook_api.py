@@ -0,0 +1,129 @@
+"""
+===================================
+PRUEBAS DE LAS CONSULTAS DEL WEBHOOK
+===================================
+GET /transactions y GET /stats de wompi_webhook.py: quién puede leerlos
+y cómo se interpretan los filtros
+
+    python -m unittest discover tests
+
+Cada prueba levanta el handler en un puerto libre de 127.0.0.1 con un
+almacén en una carpeta temporal.
+"""
+
+import http.client
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta, timezone
+from http.server import ThreadingHTTPServer
+
+import wompi_webhook
+from transaction_store import TransactionStore
+
+
+class QuietHandler(wompi_webhook.WompiWebhookHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+class WebhookServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='webhook-api-test-')
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        self.store = TransactionStore(os.path.join(self.dir, 'transactions.db'))
+        self.addCleanup(self.store.close)
+        
+        previous = wompi_webhook._store, wompi_webhook.TRANSACTIONS_API_TOKEN
+        wompi_webhook._store = self.store
+        self.addCleanup(self.restore, previous)
+        
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), QuietHandler)
+        thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+    
+    def restore(self, previous):
+        wompi_webhook._store, wompi_webhook.TRANSACTIONS_API_TOKEN = previous
+    
+    def get(self, path, headers=None):
+        """(status, cuerpo) de un GET al servidor de la prueba"""
+        conn = http.client.HTTPConnection('127.0.0.1', self.server.server_address[1], timeout=10)
+        try:
+            conn.request('GET', path, headers=headers or {})
+            response = conn.getresponse()
+            return response.status, response.read()
+        finally:
+            conn.close()
+    
+    def append(self, transaction_id, timestamp):
+        self.store.append({'transaction_id': transaction_id, 'reference': f'REF-{transaction_id}',
+                           'status': 'APPROVED', 'timestamp': timestamp,
+                           'customer_email': 'cliente@example.com'})
+
+
+class TransactionsAccessTest(WebhookServerTestCase):
+    """Sin token, /transactions solo responde a la misma máquina sin proxy"""
+    
+    def test_direct_local_request_is_allowed(self):
+        self.assertEqual(self.get('/transactions')[0], 200)
+    
+    def test_tunnelled_request_is_rejected(self):
+        for header in ({'X-Forwarded-For': '203.0.113.7'}, {'Forwarded': 'for=203.0.113.7'}):
+            self.assertEqual(self.get('/transactions', header)[0], 403, header)
+    
+    def test_token_is_required_when_configured(self):
+        wompi_webhook.TRANSACTIONS_API_TOKEN = 'secreto'
+        self.assertEqual(self.get('/transactions')[0], 403)
+        tunnelled = {'X-Forwarded-For': '203.0.113.7', 'Authorization': 'Bearer secreto'}
+        self.assertEqual(self.get('/transactions', tunnelled)[0], 200)
+
+
+class TransactionsFilterTest(WebhookServerTestCase):
+    """from/to con zona se pasan a hora local antes de compararse"""
+    
+    def references(self, query):
+        status, body = self.get('/transactions?' + query)
+        self.assertEqual(status, 200, body)
+        return [json.loads(line)['reference'] for line in body.decode('utf-8').splitlines()]
+    
+    def test_aware_bounds_are_converted_to_local_time(self):
+        self.append('tx-1', '2026-10-18T10:00:00')
+        self.append('tx-2', '2026-10-18T12:00:00')
+        # 11:00 local escrito con otra zona (+05:00)
+        start = datetime.fromisoformat('2026-10-18T11:00:00').astimezone()
+        start = start.astimezone(timezone(timedelta(hours=5)))
+        query = 'from=' + start.isoformat().replace('+', '%2B')
+        self.assertEqual(self.references(query), ['REF-tx-2'])
+    
+    def test_invalid_bound_is_rejected(self):
+        self.assertEqual(self.get('/transactions?from=ayer')[0], 400)
+
+
+
+class StatsTest(WebhookServerTestCase):
+    """/stats sigue la misma regla de acceso y respeta from/to en total"""
+    
+    def stats(self, query=''):
+        status, body = self.get('/stats' + query)
+        self.assertEqual(status, 200, body)
+        return json.loads(body)
+    
+    def test_tunnelled_request_is_rejected(self):
+        self.assertEqual(self.get('/stats', {'X-Forwarded-For': '203.0.113.7'})[0], 403)
+    
+    def test_total_outside_range_is_empty(self):
+        self.store.append({'transaction_id': 'tx-1', 'status': 'APPROVED', 'amount': 1000,
+                           'currency': 'COP', 'created_at': '2026-10-18T12:00:00+00:00'})
+        self.assertEqual(self.stats()['totals']['count'], 1)
+        self.assertEqual(self.stats('?from=2030-01-01&to=2031-01-01')['totals']['count'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,333 @@
+"""
+===================================
+ALMACÉN DE TRANSACCIONES
+===================================
+Registro append-only de los eventos de Wompi sobre SQLite en modo WAL
+
+- Cada evento es un INSERT: el costo no crece con el historial
+- Un corte de luz a mitad de escritura no corrompe nada (transacciones
+  de SQLite + WAL)
+- Escrituras agrupadas (group commit, ver group_commit.py): los eventos
+  que llegan juntos comparten una transacción y un fsync
+- Índices por transaction_id y reference para buscar sin recorrer todo
+- Checkpoint periódico del WAL (pasa las páginas a la base principal,
+  no borra ni reescribe filas) para que el archivo -wal no crezca sin
+  límite; PASSIVE para no esperar a los lectores y TRUNCATE solo si no
+  hay ninguna consulta leyendo
+- Totales por período, estado, método y moneda (ver rollups.py)
+  actualizados en la misma transacción que cada evento
+- Idempotente por clave de evento: un evento que se vuelve a procesar
+  tras una caída (la cola no alcanzó a marcarlo hecho) no se guarda ni
+  se cuenta dos veces
+
+La primera vez que se abre migra el transactions.json anterior, si existe.
+"""
+
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import urllib.request
+
+import rollups
+from group_commit import GroupCommitter
+
+# Cada cuántas escrituras (o segundos) se hace checkpoint del WAL
+CHECKPOINT_EVERY_WRITES = 1000
+CHECKPOINT_EVERY_SECONDS = 300
+
+# Columnas indexables; el registro completo se guarda además como JSON
+COLUMNS = ('timestamp', 'event_type', 'transaction_id', 'reference', 'status',
+           'amount', 'currency', 'payment_method', 'created_at', 'customer_email')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT,
+    event_type TEXT,
+    transaction_id TEXT,
+    reference TEXT,
+    status TEXT,
+    amount REAL,
+    currency TEXT,
+    payment_method TEXT,
+    created_at TEXT,
+    customer_email TEXT,
+    data TEXT NOT NULL,
+    event_key TEXT
+);
+CREATE INDEX IF NOT EXISTS transactions_transaction_id_timestamp
+    ON transactions (transaction_id, timestamp);
+CREATE INDEX IF NOT EXISTS transactions_reference_timestamp ON transactions (reference, timestamp);
+DROP INDEX IF EXISTS transactions_transaction_id;
+DROP INDEX IF EXISTS transactions_reference;
+CREATE INDEX IF NOT EXISTS transactions_status ON transactions (status, timestamp);
+CREATE INDEX IF NOT EXISTS transactions_payment_method ON transactions (payment_method, timestamp);
+CREATE INDEX IF NOT EXISTS transactions_timestamp ON transactions (timestamp);
+"""
+
+# Después de SCHEMA: la columna event_key puede venir de add_event_key_column()
+EVENT_KEY_INDEX = """
+CREATE UNIQUE INDEX IF NOT EXISTS transactions_event_key
+    ON transactions (event_key) WHERE event_key IS NOT NULL;
+"""
+
+# Filtros de iter_query() -> condición SQL
+QUERY_FILTERS = {
+    'reference': 'reference = ?',
+    'transaction_id': 'transaction_id = ?',
+    'status': 'status = ?',
+    'payment_method': 'payment_method = ?',
+    'from': 'timestamp >= ?',
+    'to': 'timestamp < ?',
+}
+
+# Filas que se leen de SQLite por vez al recorrer un resultado
+QUERY_BATCH = 500
+
+# OR IGNORE: una event_key repetida no inserta nada (rowcount 0)
+INSERT_SQL = (f"INSERT OR IGNORE INTO transactions ({', '.join(COLUMNS)}, data, event_key) "
+              f"VALUES ({', '.join('?' * (len(COLUMNS) + 2))})")
+
+
+def _row(record, event_key=None):
+    """Valores de INSERT_SQL para un registro"""
+    return ([record.get(column) for column in COLUMNS]
+            + [json.dumps(record, ensure_ascii=False), event_key])
+
+
+def add_event_key_column(conn):
+    """Agregar event_key a una base de una versión anterior (sus filas quedan en NULL)"""
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(transactions)')}
+    if 'event_key' not in columns:
+        conn.execute('ALTER TABLE transactions ADD COLUMN event_key TEXT')
+
+
+class TransactionStore:
+    """
+    Log append-only de transacciones, seguro para varios threads
+    
+    Una sola conexión protegida con el lock del committer: SQLite
+    serializa las escrituras de todas formas y así no hay que abrir una
+    por thread. durability es el modo de group_commit.GroupCommitter
+    ('event', 'group' o 'interval'); batch_sizes y commit_latency son
+    Histogram opcionales.
+    """
+    
+    def __init__(self, path, checkpoint_every_writes=CHECKPOINT_EVERY_WRITES,
+                 checkpoint_every_seconds=CHECKPOINT_EVERY_SECONDS, durability='group',
+                 batch_sizes=None, commit_latency=None):
+        self.path = path
+        self.checkpoint_every_writes = checkpoint_every_writes
+        self.checkpoint_every_seconds = checkpoint_every_seconds
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        # FULL: cada commit llega al disco antes de responder a Wompi
+        self._conn.execute('PRAGMA synchronous=FULL')
+        # El checkpoint lo hace compact(), no cada commit
+        self._conn.execute('PRAGMA wal_autocheckpoint=0')
+        self._conn.executescript(SCHEMA)
+        add_event_key_column(self._conn)
+        self._conn.executescript(EVENT_KEY_INDEX)
+        self._conn.executescript(rollups.SCHEMA)
+        if rollups.needs_rebuild(self._conn):
+            # Base de una versión anterior: calcular los totales una vez
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                rollups.rebuild(self._conn, (json.loads(data) for data, in self._conn.execute(
+                    'SELECT data FROM transactions ORDER BY seq').fetchall()))
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        self._committer = GroupCommitter(self._conn, 'transactions', durability,
+                                         batch_sizes=batch_sizes, commit_latency=commit_latency)
+        self._lock = self._committer.lock
+        self._writes_since_checkpoint = 0
+        self._last_checkpoint = time.monotonic()
+        # Conexiones de lectura abiertas (iter_query, stats)
+        self._readers = 0
+        self._readers_lock = threading.Lock()
+    
+    def append(self, record, event_key=None):
+        """
+        Agregar un registro al final del log; retorna su número de secuencia
+        
+        Con durabilidad 'event' o 'group' retorna cuando el registro ya
+        está en disco. Los totales de rollups.py se actualizan en la misma
+        escritura: o quedan los dos o ninguno.
+        
+        Si event_key ya está guardada no se escribe nada y retorna None
+        (el evento se está procesando otra vez).
+        """
+        row = _row(record, event_key)
+        
+        def write(conn):
+            cursor = conn.execute(INSERT_SQL, row)
+            if cursor.rowcount == 0:
+                return None
+            rollups.apply(conn, record)
+            return cursor.lastrowid
+        
+        seq = self._committer.submit(write)
+        with self._lock:
+            self._writes_since_checkpoint += 1
+            if self._checkpoint_due():
+                self._committer.maintenance(lambda conn: self._checkpoint())
+        return seq
+    
+    def _checkpoint_due(self):
+        return (self._writes_since_checkpoint >= self.checkpoint_every_writes
+                or time.monotonic() - self._last_checkpoint >= self.checkpoint_every_seconds)
+    
+    def _checkpoint(self):
+        # PASSIVE copia lo que puede sin esperar a los lectores (se corre
+        # con el lock de escritura tomado). Si copió todo y nadie está
+        # leyendo, TRUNCATE ya no tiene nada que esperar y deja el -wal en
+        # cero bytes; mientras tanto no se abren lectores nuevos
+        busy, frames, copied = self._conn.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone()
+        if not busy and frames == copied:
+            with self._readers_lock:
+                if self._readers == 0:
+                    self._conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        self._writes_since_checkpoint = 0
+        self._last_checkpoint = time.monotonic()
+    
+    def compact(self):
+        """Pasar el WAL a la base principal y truncarlo si nadie está leyendo"""
+        def run(conn):
+            self._checkpoint()
+            conn.execute('PRAGMA optimize')
+        self._committer.maintenance(run)
+    
+    def by_transaction_id(self, transaction_id):
+        """Historial de eventos de una transacción, del más antiguo al más nuevo"""
+        return self._query('WHERE transaction_id = ? ORDER BY seq', (transaction_id,))
+    
+    def by_reference(self, reference):
+        """Historial de eventos de una referencia de pago"""
+        return self._query('WHERE reference = ? ORDER BY seq', (reference,))
+    
+    def all(self):
+        """Todos los registros en orden de llegada"""
+        return self._query('ORDER BY seq', ())
+    
+    def iter_query(self, filters=None, cursor=None, limit=None):
+        """
+        Recorrer registros del más nuevo al más viejo como texto JSON
+        
+        filters usa las claves de QUERY_FILTERS (from/to comparan el
+        timestamp ISO); cursor es el seq del último registro de la página
+        anterior. Cada registro sale con su "seq" para pedir la siguiente.
+        
+        El orden es (timestamp, seq), el mismo de los índices (SQLite
+        agrega seq al final de cada índice): con un solo filtro de igualdad
+        SQLite recorre el índice hacia atrás sin ordenar. Otras
+        combinaciones (status y payment_method juntos, por ejemplo) pueden
+        ordenar con un B-tree temporal. Usa su propia conexión de solo lectura y lee por bloques:
+        la memoria no depende del tamaño del resultado y un cliente lento
+        no bloquea las escrituras (WAL).
+        """
+        conditions, params = [], []
+        for name, value in (filters or {}).items():
+            conditions.append(QUERY_FILTERS[name])
+            params.append(value)
+        if cursor is not None:
+            conditions.append('(timestamp, seq) < '
+                              '(SELECT timestamp, seq FROM transactions WHERE seq = ?)')
+            params.append(cursor)
+        sql = 'SELECT seq, data FROM transactions'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY timestamp DESC, seq DESC'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        
+        with self._read_connection() as conn:
+            rows = conn.execute(sql, params)
+            while True:
+                batch = rows.fetchmany(QUERY_BATCH)
+                if not batch:
+                    break
+                for seq, data in batch:
+                    # Agregar seq sin decodificar el JSON guardado
+                    yield f'{{"seq": {seq}, {data[1:]}' if len(data) > 2 else f'{{"seq": {seq}}}'
+    
+    @contextlib.contextmanager
+    def _read_connection(self):
+        """
+        Conexión de solo lectura aparte: no espera el lock de escritura
+        
+        Mientras está abierta cuenta en self._readers, así el checkpoint
+        no intenta TRUNCATE (que esperaría a que termine).
+        """
+        uri = 'file:' + urllib.request.pathname2url(os.path.abspath(self.path)) + '?mode=ro'
+        with self._readers_lock:
+            self._readers += 1
+        try:
+            conn = sqlite3.connect(uri, uri=True)
+            try:
+                yield conn
+            finally:
+                conn.close()
+        finally:
+            with self._readers_lock:
+                self._readers -= 1
+    
+    def stats(self, granularity='total', start=None, end=None, max_buckets=None):
+        """
+        Totales precalculados (ver rollups.read): una lista de filas
+        (bucket, status, payment_method, currency, count, amount_cents)
+        
+        El costo depende de cuántos períodos se piden, no de cuántas
+        transacciones hay.
+        """
+        with self._read_connection() as conn:
+            return list(rollups.read(conn, granularity, start, end, max_buckets))
+    
+    def count(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM transactions').fetchone()[0]
+    
+    def _query(self, where, params):
+        with self._lock:
+            rows = self._conn.execute(f'SELECT data FROM transactions {where}', params).fetchall()
+        return [json.loads(row['data']) for row in rows]
+    
+    def migrate_json(self, json_path):
+        """
+        Importar un transactions.json anterior (lista de registros)
+        
+        Solo si la tabla está vacía; el archivo se renombra a .migrated
+        para no importarlo dos veces. Retorna cuántos registros importó.
+        """
+        if not os.path.exists(json_path) or self.count():
+            return 0
+        with open(json_path, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+        def run(conn):
+            conn.execute('BEGIN')
+            try:
+                conn.executemany(INSERT_SQL, [_row(record) for record in records])
+                rollups.rebuild(conn, records)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        self._committer.maintenance(run)
+        os.replace(json_path, json_path + '.migrated')
+        return len(records)
+    
+    def flush(self):
+        """Confirmar las escrituras pendientes (modo 'interval')"""
+        self._committer.flush()
+    
+    def close(self):
+        def run(conn):
+            self._checkpoint()
+            conn.close()
+        self._committer.maintenance(run)
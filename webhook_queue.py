@@ -0,0 +1,256 @@
+"""
+===================================
+COLA DURABLE DE WEBHOOKS
+===================================
+Cola acotada sobre SQLite para responder a Wompi apenas llega el evento
+
+El handler HTTP solo verifica la firma, guarda el payload aquí y
+responde 200; un pool de workers procesa los eventos después. Si el
+proceso se cae, los eventos pendientes siguen en disco y se procesan al
+reiniciar. Con la cola llena put() retorna FULL y el handler responde
+503 + Retry-After para que Wompi reintente más tarde.
+
+Wompi reenvía eventos: cada evento trae una clave de deduplicación y
+una entrega repetida se reconoce sin encolarla (DUPLICATE). Las claves
+vistas se guardan en la misma transacción que el evento (persisten
+entre reinicios) y las más recientes también en memoria, con ventana y
+tamaño acotados, para descartar reintentos sin tocar el disco.
+"""
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+from group_commit import GroupCommitter
+
+# Intentos antes de marcar un evento como fallido
+MAX_ATTEMPTS = 3
+
+# Claves de deduplicación: días que se guardan en disco, y ventana y
+# cantidad máxima de las que se recuerdan en memoria
+DEDUP_RETENTION_DAYS = 7
+DEDUP_MEMORY_WINDOW = 24 * 3600
+DEDUP_MEMORY_MAX = 100000
+
+# Resultados de put()
+QUEUED = 'queued'
+DUPLICATE = 'duplicate'
+FULL = 'full'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS webhook_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    received_at REAL NOT NULL,
+    payload BLOB NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS webhook_seen (
+    key TEXT PRIMARY KEY,
+    seen_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS webhook_seen_at ON webhook_seen (seen_at);
+"""
+
+
+class RecentKeys:
+    """
+    Conjunto de claves con ventana de tiempo y tamaño máximo
+    
+    Se recorre en orden de llegada, así expirar o expulsar es sacar del
+    principio. No es la fuente de verdad: una clave que no está aquí se
+    busca en la tabla webhook_seen.
+    """
+    
+    def __init__(self, window=DEDUP_MEMORY_WINDOW, max_entries=DEDUP_MEMORY_MAX):
+        self.window = window
+        self.max_entries = max_entries
+        self._keys = OrderedDict()  # clave -> momento en que se vio
+    
+    def __contains__(self, key):
+        seen_at = self._keys.get(key)
+        return seen_at is not None and time.time() - seen_at < self.window
+    
+    def __len__(self):
+        return len(self._keys)
+    
+    def add(self, key, seen_at=None):
+        self._keys[key] = seen_at or time.time()
+        self._keys.move_to_end(key)
+        limit = time.time() - self.window
+        while self._keys:
+            oldest_key, oldest_at = next(iter(self._keys.items()))
+            if len(self._keys) <= self.max_entries and oldest_at >= limit:
+                break
+            del self._keys[oldest_key]
+
+
+class QueueItem:
+    """Un evento pendiente"""
+    __slots__ = ('id', 'received_at', 'payload', 'attempts')
+    
+    def __init__(self, id, received_at, payload, attempts):
+        self.id = id
+        self.received_at = received_at
+        self.payload = payload
+        self.attempts = attempts
+
+
+class WebhookQueue:
+    """
+    Cola FIFO persistente con tamaño máximo
+    
+    Los eventos pendientes se mantienen también en memoria (la cola está
+    acotada), así los workers no consultan la base para tomar trabajo.
+    Un evento cuenta en depth() hasta que done() o fail() lo sacan.
+    
+    Las escrituras pasan por un GroupCommitter: en una ráfaga, los
+    eventos que llegan juntos se confirman con un solo fsync.
+    """
+    
+    def __init__(self, path, max_depth, max_attempts=MAX_ATTEMPTS,
+                 dedup_retention=DEDUP_RETENTION_DAYS * 86400, durability='group',
+                 batch_sizes=None, commit_latency=None):
+        self.path = path
+        self.max_depth = max_depth
+        self.max_attempts = max_attempts
+        self.dedup_retention = dedup_retention
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=FULL')
+        self._conn.executescript(SCHEMA)
+        self._cond = threading.Condition()
+        self._ready = deque()
+        self._depth = 0
+        self._recent = RecentKeys()
+        self._next_prune = 0
+        self.rejected = 0
+        self.failed = 0
+        self.duplicates = 0
+        
+        # Eventos que quedaron pendientes en la ejecución anterior
+        rows = self._conn.execute(
+            'SELECT id, received_at, payload, attempts FROM webhook_queue '
+            'WHERE failed = 0 ORDER BY id').fetchall()
+        for row in rows:
+            self._ready.append(QueueItem(*row))
+        self._depth = len(rows)
+        
+        # Las claves del último día pasan a memoria
+        for key, seen_at in self._conn.execute(
+                'SELECT key, seen_at FROM webhook_seen WHERE seen_at >= ? ORDER BY seen_at',
+                (time.time() - self._recent.window,)):
+            self._recent.add(key, seen_at)
+        
+        self._committer = GroupCommitter(self._conn, 'webhook_queue', durability,
+                                         batch_sizes=batch_sizes, commit_latency=commit_latency)
+    
+    def put(self, payload, key=None):
+        """
+        Guardar un evento: QUEUED, DUPLICATE (ya se recibió antes, no se
+        encola) o FULL (la cola está llena)
+        
+        Sin key el evento siempre se encola.
+        """
+        with self._cond:
+            if key is not None and key in self._recent:
+                self.duplicates += 1
+                return DUPLICATE
+            if self._depth >= self.max_depth:
+                self.rejected += 1
+                return FULL
+            self._depth += 1
+        
+        received_at = time.time()
+        
+        def write(conn):
+            # La clave y el evento se guardan juntos: si uno falla no
+            # queda ninguno y el reintento de Wompi no se pierde
+            claimed = key is None or conn.execute(
+                'INSERT OR IGNORE INTO webhook_seen (key, seen_at) VALUES (?, ?)',
+                (key, received_at)).rowcount == 1
+            if not claimed:
+                return None
+            if received_at >= self._next_prune:
+                self._prune(conn, received_at)
+            return conn.execute(
+                'INSERT INTO webhook_queue (received_at, payload) VALUES (?, ?)',
+                (received_at, payload)).lastrowid
+        
+        try:
+            item_id = self._committer.submit(write)
+        except Exception:
+            with self._cond:
+                self._depth -= 1
+            raise
+        
+        with self._cond:
+            if key is not None:
+                self._recent.add(key, received_at)
+            if item_id is None:
+                self._depth -= 1
+                self.duplicates += 1
+                return DUPLICATE
+            self._ready.append(QueueItem(item_id, received_at, payload, 0))
+            self._cond.notify()
+        return QUEUED
+    
+    def _prune(self, conn, now):
+        """Olvidar las claves más viejas que dedup_retention (una vez por hora)"""
+        self._next_prune = now + 3600
+        conn.execute('DELETE FROM webhook_seen WHERE seen_at < ?', (now - self.dedup_retention,))
+    
+    def get(self, timeout=None):
+        """Tomar el próximo evento, o None si no llega ninguno a tiempo"""
+        with self._cond:
+            if not self._ready and not self._cond.wait_for(lambda: self._ready, timeout):
+                return None
+            return self._ready.popleft()
+    
+    def done(self, item):
+        """
+        El evento se procesó: borrarlo de la cola (sin esperar el fsync)
+        
+        Si el proceso se cae antes de que el borrado llegue al disco, el
+        evento se procesa otra vez al reiniciar; TransactionStore.append
+        reconoce su clave y no lo guarda de nuevo.
+        """
+        self._committer.submit(
+            lambda conn: conn.execute('DELETE FROM webhook_queue WHERE id = ?', (item.id,)),
+            wait=False)
+        with self._cond:
+            self._depth -= 1
+    
+    def fail(self, item):
+        """
+        El procesamiento falló: reintentar o, tras max_attempts, dejar el
+        evento marcado como fallido en la tabla para revisarlo a mano
+        
+        Retorna True si el evento se volverá a intentar.
+        """
+        item.attempts += 1
+        give_up = item.attempts >= self.max_attempts
+        attempts = item.attempts
+        self._committer.submit(
+            lambda conn: conn.execute(
+                'UPDATE webhook_queue SET attempts = ?, failed = ? WHERE id = ?',
+                (attempts, int(give_up), item.id)),
+            wait=False)
+        with self._cond:
+            if give_up:
+                self._depth -= 1
+                self.failed += 1
+            else:
+                self._ready.append(item)
+                self._cond.notify()
+        return not give_up
+    
+    def depth(self):
+        return self._depth
+    
+    def recent_keys(self):
+        return len(self._recent)
+    
+    def close(self):
+        self._committer.maintenance(lambda conn: conn.close())
@@ -8,12 +8,23 @@ Endpoint seguro para recibir notificaciones de Wompi
 Solo recibe notificaciones del estado de los pagos
 """
 
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import json
 import hashlib
 import hmac
 from datetime import datetime
 import os
+import threading
+import time
+import urllib.parse
+
+import admission
+import metrics
+import rollups
+import status_events
+from group_commit import BATCH_BUCKETS, DURABILITY_MODES
+from transaction_store import QUERY_FILTERS, TransactionStore
+from webhook_queue import DUPLICATE, FULL, WebhookQueue
 
 # ========================================
 # CONFIGURACIÓN
@@ -32,32 +43,425 @@ WOMPI_EVENTS_SECRET = WOMPI_EVENTS_SECRET_TEST if USE_SANDBOX else WOMPI_EVENTS_
 
 PORT = 8080
 
+# Cola de eventos: el webhook responde apenas el evento queda en disco y
+# WEBHOOK_WORKERS threads lo procesan después
+WEBHOOK_QUEUE_DB = 'webhook_queue.db'
+WEBHOOK_QUEUE_MAX = int(os.environ.get('WEBHOOK_QUEUE_MAX', '10000'))
+WEBHOOK_WORKERS = int(os.environ.get('WEBHOOK_WORKERS', '4'))
+# Segundos que Wompi debe esperar antes de reintentar si la cola está llena
+WEBHOOK_RETRY_AFTER = 30
+
+# Durabilidad de las escrituras (ver group_commit.py):
+# 'event' = un fsync por evento, 'group' = los eventos que llegan juntos
+# comparten un fsync y cada uno espera el suyo, 'interval' = fsync cada
+# 50 ms sin esperar (un corte de luz puede perder ese intervalo)
+WEBHOOK_DURABILITY = os.environ.get('WEBHOOK_DURABILITY', 'group')
+
+# Consulta de transacciones (GET /transactions). Sin token solo se
+# permite desde la misma máquina
+TRANSACTIONS_API_TOKEN = os.environ.get('TRANSACTIONS_API_TOKEN', '')
+QUERY_DEFAULT_LIMIT = 100
+QUERY_MAX_LIMIT = 10000
+
+# Totales (GET /stats): períodos que se devuelven por defecto y como máximo
+STATS_DEFAULT_BUCKETS = 60
+STATS_MAX_BUCKETS = 1440
+
+# Métricas del proceso, expuestas en /__metrics
+METRICS_PATH = '/__metrics'
+METRICS = metrics.Registry()
+HTTP_METRICS = metrics.RequestMetrics(METRICS, 'webhook')
+EVENTS = METRICS.counter('webhook_events_total', 'Eventos de Wompi procesados por estado',
+                         ('event', 'status'))
+SIGNATURE_FAILURES = METRICS.counter('webhook_signature_failures_total',
+                                     'Webhooks rechazados por firma inválida')
+QUEUE_WAIT = METRICS.histogram('webhook_queue_wait_seconds',
+                               'Tiempo entre recibir un evento y empezar a procesarlo')
+PROCESSING_FAILURES = METRICS.counter('webhook_processing_failures_total',
+                                      'Errores de los workers al procesar eventos')
+COMMIT_BATCH_SIZE = METRICS.histogram('webhook_commit_batch_size',
+                                      'Escrituras confirmadas por cada commit', ('db',),
+                                      buckets=BATCH_BUCKETS)
+COMMIT_LATENCY = METRICS.histogram('webhook_commit_duration_seconds',
+                                   'Duración de cada commit (incluye el fsync)', ('db',))
+METRICS.gauge('webhook_queue_depth', 'Eventos en cola o en proceso',
+              lambda: get_queue().depth())
+METRICS.gauge('webhook_queue_capacity', 'Tamaño máximo de la cola', lambda: WEBHOOK_QUEUE_MAX)
+METRICS.gauge('webhook_queue_rejections_total', 'Eventos rechazados con 503 por cola llena',
+              lambda: get_queue().rejected, kind='counter')
+METRICS.gauge('webhook_queue_failed_total', 'Eventos descartados tras agotar los reintentos',
+              lambda: get_queue().failed, kind='counter')
+METRICS.gauge('webhook_duplicates_total', 'Entregas repetidas confirmadas sin procesar',
+              lambda: get_queue().duplicates, kind='counter')
+METRICS.gauge('webhook_dedup_memory_keys', 'Claves de deduplicación en memoria',
+              lambda: get_queue().recent_keys())
+
+# Control de admisión (ver admission.py): (requests por segundo, ráfaga)
+# por IP y clase de ruta. Los reintentos de Wompi llegan en ráfagas
+ADMISSION_LIMITS = {
+    'webhook': (100, 500),
+    'query': (5, 20),
+    'stats': (5, 20),
+    'metrics': (5, 20),
+}
+ADMISSION_DEFAULT_LIMIT = (5, 20)
+# Requests en curso a la vez; los últimos lugares son solo para /webhook
+ADMISSION_MAX_ACTIVE = 128
+ADMISSION_RESERVED = 32
+ADMISSION = admission.AdmissionController(
+    ADMISSION_LIMITS, ADMISSION_DEFAULT_LIMIT, ADMISSION_MAX_ACTIVE,
+    reserved=ADMISSION_RESERVED, priority=('webhook',))
+ADMISSION.register_metrics(METRICS, 'webhook')
+
 # ========================================
-# ALMACENAMIENTO SIMPLE (archivo JSON)
+# ALMACENAMIENTO (SQLite append-only, ver transaction_store.py)
 # ========================================
+TRANSACTIONS_DB = 'transactions.db'
+
+# Archivo del formato anterior: se migra a TRANSACTIONS_DB al iniciar
 TRANSACTIONS_FILE = 'transactions.json'
 
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """Abrir el almacén la primera vez que se usa (migrando el JSON anterior)"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = TransactionStore(TRANSACTIONS_DB, durability=WEBHOOK_DURABILITY,
+                                         batch_sizes=COMMIT_BATCH_SIZE,
+                                         commit_latency=COMMIT_LATENCY)
+                migrated = store.migrate_json(TRANSACTIONS_FILE)
+                if migrated:
+                    print(f"📦 {migrated} transacciones migradas de {TRANSACTIONS_FILE} a {TRANSACTIONS_DB}")
+                _store = store
+    return _store
+
 def load_transactions():
-    """Cargar transacciones desde archivo"""
-    if os.path.exists(TRANSACTIONS_FILE):
-        with open(TRANSACTIONS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return []
+    """Cargar transacciones desde el almacén"""
+    return get_store().all()
 
-def save_transaction(transaction_data):
-    """Guardar transacción en archivo"""
-    transactions = load_transactions()
-    transactions.append(transaction_data)
+def save_transaction(transaction_data, key=None):
+    """
+    Agregar una transacción al almacén (costo constante por evento)
     
-    with open(TRANSACTIONS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(transactions, f, indent=2, ensure_ascii=False)
+    Retorna False si el evento con esa clave ya estaba guardado.
+    """
+    if get_store().append(transaction_data, event_key=key) is None:
+        print(f"🔁 Evento ya guardado, no se repite: {key}")
+        return False
     
     print(f"✅ Transacción guardada: {transaction_data['reference']}")
+    return True
+
+def local_timestamp(value):
+    """
+    Fecha ISO de un filtro en el formato del campo timestamp (hora local
+    sin zona), para compararla como texto: '...Z' o '+05:00' se pasan a
+    hora local en vez de perder la zona
+    """
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment.isoformat()
+
+# ========================================
+# PROCESAMIENTO DE EVENTOS
+# ========================================
+def process_webhook_event(event_data):
+    """
+    Procesar evento del webhook
+    
+    DATOS QUE RECIBE (NO SENSIBLES):
+    - event: tipo de evento (transaction.updated)
+    - data: información de la transacción
+      - id: ID de la transacción
+      - reference: Referencia única
+      - status: Estado (APPROVED, DECLINED, PENDING, etc.)
+      - amount_in_cents: Monto en centavos
+      - currency: Moneda (COP)
+      - payment_method_type: Tipo de pago (CARD, NEQUI, PSE)
+      - created_at: Fecha de creación
+    
+    NO RECIBE:
+    ❌ Números de tarjeta
+    ❌ CVV
+    ❌ Datos bancarios completos
+    """
+    
+    event_type = event_data.get('event')
+    transaction = event_data.get('data', {}).get('transaction', {})
+    
+    print(f"\n{'='*50}")
+    print(f"📨 Webhook recibido: {event_type}")
+    print(f"{'='*50}")
+    
+    # Extraer información relevante (NO SENSIBLE)
+    transaction_info = {
+        'timestamp': datetime.now().isoformat(),
+        'event_type': event_type,
+        'transaction_id': transaction.get('id'),
+        'reference': transaction.get('reference'),
+        'status': transaction.get('status'),
+        'amount': transaction.get('amount_in_cents', 0) / 100,
+        'currency': transaction.get('currency'),
+        'payment_method': transaction.get('payment_method_type'),
+        'created_at': transaction.get('created_at'),
+        'customer_email': transaction.get('customer_email', 'N/A')
+    }
+    
+    # Mostrar información
+    print(f"🆔 ID: {transaction_info['transaction_id']}")
+    print(f"📋 Referencia: {transaction_info['reference']}")
+    print(f"💰 Monto: ${transaction_info['amount']} {transaction_info['currency']}")
+    print(f"📊 Estado: {transaction_info['status']}")
+    print(f"💳 Método: {transaction_info['payment_method']}")
+    print(f"📧 Email: {transaction_info['customer_email']}")
+    
+    # Guardar en el almacén; en la misma escritura se actualizan los
+    # totales por período/estado/método/moneda que responde /stats.
+    # Con la clave del evento, reprocesarlo tras una caída (entre guardar
+    # y queue.done) no lo guarda ni lo cuenta dos veces
+    saved = save_transaction(transaction_info, event_key(event_data))
+    
+    # Avisar al servidor web: el navegador que espera esta referencia
+    # recibe el estado al instante (ver status_events.py). Se repite
+    # aunque el evento ya estuviera guardado: el aviso pudo perderse
+    status_events.publish(transaction_info)
+    if not saved:
+        print(f"{'='*50}\n")
+        return
+    EVENTS.inc((event_type or 'unknown', transaction_info['status'] or 'unknown'))
+    
+    # Aquí puedes agregar lógica adicional según el estado:
+    if transaction_info['status'] == 'APPROVED':
+        print("✅ PAGO APROBADO - Procesar pedido")
+        # TODO: Enviar email de confirmación
+        # TODO: Actualizar inventario
+        # TODO: Generar factura
+    
+    elif transaction_info['status'] == 'DECLINED':
+        print("❌ PAGO RECHAZADO - Notificar al cliente")
+        # TODO: Enviar email de rechazo
+    
+    elif transaction_info['status'] == 'PENDING':
+        print("⏳ PAGO PENDIENTE - Esperar confirmación")
+        # TODO: Enviar email de pendiente
+    
+    print(f"{'='*50}\n")
+
+# ========================================
+# COLA Y WORKERS (ver webhook_queue.py)
+# ========================================
+_queue = None
+_queue_lock = threading.Lock()
+
+def get_queue():
+    """Abrir la cola la primera vez que se usa (recupera eventos pendientes)"""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = WebhookQueue(WEBHOOK_QUEUE_DB, WEBHOOK_QUEUE_MAX,
+                                      durability=WEBHOOK_DURABILITY,
+                                      batch_sizes=COMMIT_BATCH_SIZE,
+                                      commit_latency=COMMIT_LATENCY)
+    return _queue
+
+def event_key(event_data):
+    """
+    Clave de deduplicación de un evento: (transaction_id, estado, marca)
+    
+    La marca es el timestamp del evento o, si falta, el checksum de su
+    firma; sin ninguno de los dos basta (transaction_id, estado). Sin
+    transaction_id el evento no se deduplica (None).
+    """
+    transaction = event_data.get('data', {}).get('transaction', {})
+    transaction_id = transaction.get('id')
+    if not transaction_id:
+        return None
+    stamp = event_data.get('timestamp')
+    if stamp is None:
+        stamp = (event_data.get('signature') or {}).get('checksum', '')
+    return f"{transaction_id}|{transaction.get('status')}|{stamp}"
+
+def webhook_worker():
+    """Procesar eventos de la cola hasta que termine el proceso"""
+    queue = get_queue()
+    while True:
+        item = queue.get()
+        QUEUE_WAIT.observe(max(time.time() - item.received_at, 0))
+        try:
+            process_webhook_event(json.loads(item.payload.decode('utf-8')))
+        except Exception as e:
+            PROCESSING_FAILURES.inc()
+            retry = queue.fail(item)
+            print(f"❌ Error procesando evento #{item.id} (intento {item.attempts}): {e}"
+                  f"{'' if retry else ' - marcado como fallido'}")
+        else:
+            queue.done(item)
+
+def start_workers(count=None):
+    """Iniciar el pool de workers que procesa la cola"""
+    for i in range(count or WEBHOOK_WORKERS):
+        threading.Thread(target=webhook_worker, name=f'webhook-worker-{i}', daemon=True).start()
 
 # ========================================
 # WEBHOOK HANDLER
 # ========================================
-class WompiWebhookHandler(BaseHTTPRequestHandler):
+class WompiWebhookHandler(metrics.InstrumentedHandlerMixin, admission.AdmissionMixin,
+                          BaseHTTPRequestHandler):
+    
+    request_metrics = HTTP_METRICS
+    admission_controller = ADMISSION if admission.ENABLED else None
+    
+    def admission_class(self):
+        """Clase de ruta del request para admission.py"""
+        path = self.path.split('?', 1)[0]
+        if self.command == 'POST':
+            return 'webhook' if path == '/webhook' else 'other'
+        return {'/transactions': 'query', '/stats': 'stats',
+                METRICS_PATH: 'metrics'}.get(path, 'other')
+    
+    def do_GET(self):
+        """Consultar transacciones y exponer las métricas del servidor"""
+        path = self.path.split('?', 1)[0]
+        if path == '/transactions':
+            self.route_class = 'query'
+            self.handle_transactions_query()
+        elif path == '/stats':
+            self.route_class = 'stats'
+            self.handle_stats()
+        elif path == METRICS_PATH:
+            self.send_metrics(METRICS)
+        else:
+            self.send_error(404)
+    
+    def handle_transactions_query(self):
+        """
+        GET /transactions?reference=&status=&payment_method=&from=&to=&cursor=&limit=
+        
+        Responde NDJSON (una transacción por línea, de la más nueva a la
+        más vieja) leyendo por índices y en streaming. Cada línea trae su
+        "seq": para la siguiente página se pasa cursor=<seq de la última>.
+        """
+        if not self.query_allowed():
+            self.send_json_error(403, 'Acceso denegado')
+            return
+        
+        params = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        try:
+            filters = {}
+            for name in QUERY_FILTERS:
+                value = params.get(name, [''])[0]
+                if not value:
+                    continue
+                if name in ('from', 'to'):
+                    value = local_timestamp(value)
+                filters[name] = value
+            cursor = int(params['cursor'][0]) if params.get('cursor', [''])[0] else None
+            limit = int(params.get('limit', [QUERY_DEFAULT_LIMIT])[0])
+            if not 0 < limit <= QUERY_MAX_LIMIT:
+                raise ValueError(f'limit debe estar entre 1 y {QUERY_MAX_LIMIT}')
+        except ValueError as e:
+            self.send_json_error(400, f'Parámetro inválido: {e}')
+            return
+        
+        # Sin Content-Length: el final de la respuesta lo marca el cierre
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson; charset=utf-8')
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        
+        buffer, buffered = [], 0
+        for line in get_store().iter_query(filters, cursor, limit):
+            data = (line + '\n').encode('utf-8')
+            buffer.append(data)
+            buffered += len(data)
+            if buffered >= 65536:
+                self.wfile.write(b''.join(buffer))
+                self.response_bytes += buffered
+                buffer, buffered = [], 0
+        if buffer:
+            self.wfile.write(b''.join(buffer))
+            self.response_bytes += buffered
+    
+    def handle_stats(self):
+        """
+        GET /stats?granularity=total|hour|minute&from=&to=&buckets=
+        
+        Totales precalculados: cantidad por estado, ingresos aprobados por
+        moneda y tasa de rechazo, en total y por método de pago. Con
+        hour/minute se agregan los períodos (UTC) más recientes, hasta
+        `buckets`. No recorre las transacciones: lee unas pocas filas.
+        """
+        if not self.query_allowed():
+            self.send_json_error(403, 'Acceso denegado')
+            return
+        
+        params = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        try:
+            granularity = params.get('granularity', ['total'])[0]
+            if granularity not in rollups.GRANULARITIES:
+                raise ValueError(f"granularity debe ser {', '.join(rollups.GRANULARITIES)}")
+            start, end = (rollups.bucket_minute(params.get(name, [''])[0]) for name in ('from', 'to'))
+            for name, value in (('from', start), ('to', end)):
+                if params.get(name, [''])[0] and value is None:
+                    raise ValueError(f'{name} no es una fecha ISO')
+            max_buckets = int(params.get('buckets', [STATS_DEFAULT_BUCKETS])[0])
+            if not 0 < max_buckets <= STATS_MAX_BUCKETS:
+                raise ValueError(f'buckets debe estar entre 1 y {STATS_MAX_BUCKETS}')
+        except ValueError as e:
+            self.send_json_error(400, f'Parámetro inválido: {e}')
+            return
+        
+        rows = get_store().stats(granularity, start, end, max_buckets)
+        
+        def summary(rows):
+            result = rollups.summarize(rows)
+            methods = {}
+            for row in rows:
+                methods.setdefault(row[2] or 'unknown', []).append(row)
+            result['by_payment_method'] = {
+                method: rollups.summarize(method_rows) for method, method_rows in sorted(methods.items())}
+            return result
+        
+        stats = {'granularity': granularity, 'totals': summary(rows)}
+        if granularity != 'total':
+            periods = {}
+            for row in rows:
+                periods.setdefault(row[0], []).append(row)
+            stats['buckets'] = [dict(bucket=bucket, **summary(bucket_rows))
+                                for bucket, bucket_rows in periods.items()]
+        
+        body = json.dumps(stats, ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Cache-Control', 'no-store')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def query_allowed(self):
+        """
+        Con TRANSACTIONS_API_TOKEN se exige Bearer; sin él, solo localhost
+        sin proxy (por el túnel todo llega desde 127.0.0.1)
+        """
+        if TRANSACTIONS_API_TOKEN:
+            authorization = self.headers.get('Authorization', '')
+            return hmac.compare_digest(authorization.encode('utf-8'),
+                                       f'Bearer {TRANSACTIONS_API_TOKEN}'.encode('utf-8'))
+        return metrics.direct_local_request(self)
+    
+    def send_json_error(self, code, message):
+        body = json.dumps({'error': message}, ensure_ascii=False).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
     
     def do_POST(self):
         """Manejar POST requests de Wompi"""
@@ -66,32 +470,51 @@ class WompiWebhookHandler(BaseHTTPRequestHandler):
         if self.path != '/webhook':
             self.send_error(404)
             return
+        self.route_class = 'webhook'
         
         try:
             # Leer el contenido del request
             content_length = int(self.headers['Content-Length'])
             post_data = self.rfile.read(content_length)
             
-            # Parsear JSON
-            webhook_data = json.loads(post_data.decode('utf-8'))
-            
             # Verificar firma (seguridad)
             if not self.verify_signature(post_data, self.headers.get('X-Event-Signature', '')):
                 print("❌ Firma inválida - request rechazado")
+                SIGNATURE_FAILURES.inc()
                 self.send_error(401, "Invalid signature")
                 return
             
-            # Procesar el evento
-            self.process_webhook_event(webhook_data)
+            # Validar el JSON aquí: un payload roto no debe llegar a la cola
+            try:
+                webhook_data = json.loads(post_data.decode('utf-8'))
+            except ValueError:
+                self.send_error(400, "Invalid JSON")
+                return
+            
+            # Encolar el evento (salvo que sea una entrega repetida); los
+            # workers lo procesan después
+            key = event_key(webhook_data)
+            result = get_queue().put(post_data, key)
+            if result == DUPLICATE:
+                print(f"♻️ Evento repetido ignorado: {key}")
+            elif result == FULL:
+                print("⏳ Cola de webhooks llena - Wompi reintentará")
+                self.send_response(503)
+                self.send_header('Retry-After', str(WEBHOOK_RETRY_AFTER))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
             
             # Responder con éxito
+            body = json.dumps({"status": "success"}).encode()
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
             self.end_headers()
-            self.wfile.write(json.dumps({"status": "success"}).encode())
+            self.wfile.write(body)
             
         except Exception as e:
-            print(f"❌ Error procesando webhook: {e}")
+            print(f"❌ Error recibiendo webhook: {e}")
             self.send_error(500, str(e))
     
     def verify_signature(self, payload, signature):
@@ -112,76 +535,6 @@ class WompiWebhookHandler(BaseHTTPRequestHandler):
         
         return hmac.compare_digest(expected_signature, signature)
     
-    def process_webhook_event(self, event_data):
-        """
-        Procesar evento del webhook
-        
-        DATOS QUE RECIBE (NO SENSIBLES):
-        - event: tipo de evento (transaction.updated)
-        - data: información de la transacción
-          - id: ID de la transacción
-          - reference: Referencia única
-          - status: Estado (APPROVED, DECLINED, PENDING, etc.)
-          - amount_in_cents: Monto en centavos
-          - currency: Moneda (COP)
-          - payment_method_type: Tipo de pago (CARD, NEQUI, PSE)
-          - created_at: Fecha de creación
-        
-        NO RECIBE:
-        ❌ Números de tarjeta
-        ❌ CVV
-        ❌ Datos bancarios completos
-        """
-        
-        event_type = event_data.get('event')
-        transaction = event_data.get('data', {}).get('transaction', {})
-        
-        print(f"\n{'='*50}")
-        print(f"📨 Webhook recibido: {event_type}")
-        print(f"{'='*50}")
-        
-        # Extraer información relevante (NO SENSIBLE)
-        transaction_info = {
-            'timestamp': datetime.now().isoformat(),
-            'event_type': event_type,
-            'transaction_id': transaction.get('id'),
-            'reference': transaction.get('reference'),
-            'status': transaction.get('status'),
-            'amount': transaction.get('amount_in_cents', 0) / 100,
-            'currency': transaction.get('currency'),
-            'payment_method': transaction.get('payment_method_type'),
-            'created_at': transaction.get('created_at'),
-            'customer_email': transaction.get('customer_email', 'N/A')
-        }
-        
-        # Mostrar información
-        print(f"🆔 ID: {transaction_info['transaction_id']}")
-        print(f"📋 Referencia: {transaction_info['reference']}")
-        print(f"💰 Monto: ${transaction_info['amount']} {transaction_info['currency']}")
-        print(f"📊 Estado: {transaction_info['status']}")
-        print(f"💳 Método: {transaction_info['payment_method']}")
-        print(f"📧 Email: {transaction_info['customer_email']}")
-        
-        # Guardar en archivo
-        save_transaction(transaction_info)
-        
-        # Aquí puedes agregar lógica adicional según el estado:
-        if transaction_info['status'] == 'APPROVED':
-            print("✅ PAGO APROBADO - Procesar pedido")
-            # TODO: Enviar email de confirmación
-            # TODO: Actualizar inventario
-            # TODO: Generar factura
-            
-        elif transaction_info['status'] == 'DECLINED':
-            print("❌ PAGO RECHAZADO - Notificar al cliente")
-            # TODO: Enviar email de rechazo
-            
-        elif transaction_info['status'] == 'PENDING':
-            print("⏳ PAGO PENDIENTE - Esperar confirmación")
-            # TODO: Enviar email de pendiente
-        
-        print(f"{'='*50}\n")
-    
     def log_message(self, format, *args):
         """Personalizar logs"""
         print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {format % args}")
@@ -189,16 +542,39 @@ class WompiWebhookHandler(BaseHTTPRequestHandler):
 # ========================================
 # SERVIDOR
 # ========================================
+class WebhookHTTPServer(ThreadingHTTPServer):
+    """Un thread por conexión; la cola de listen() aguanta ráfagas de reintentos"""
+    daemon_threads = True
+    request_queue_size = 1024
+
 def run_webhook_server():
     """Iniciar servidor de webhooks"""
+    if WEBHOOK_DURABILITY not in DURABILITY_MODES:
+        raise SystemExit(f"❌ WEBHOOK_DURABILITY debe ser uno de: {', '.join(DURABILITY_MODES)}")
+    
     server_address = ('', PORT)
-    httpd = HTTPServer(server_address, WompiWebhookHandler)
+    httpd = WebhookHTTPServer(server_address, WompiWebhookHandler)
+    get_store()
+    pending = get_queue().depth()
+    start_workers()
     
     print(f"\n{'='*60}")
     print(f"🚀 Servidor de Webhooks de Wompi iniciado")
     print(f"{'='*60}")
     print(f"📡 Escuchando en: http://localhost:{PORT}/webhook")
-    print(f"📁 Transacciones guardadas en: {TRANSACTIONS_FILE}")
+    print(f"📁 Transacciones guardadas en: {TRANSACTIONS_DB}")
+    print(f"💾 Durabilidad: {WEBHOOK_DURABILITY}")
+    print(f"📥 Cola: {WEBHOOK_QUEUE_DB} ({WEBHOOK_WORKERS} workers, máx. {WEBHOOK_QUEUE_MAX} eventos"
+          f"{f', {pending} pendientes' if pending else ''})")
+    print(f"📊 Métricas en: http://localhost:{PORT}{METRICS_PATH}"
+          f" ({'Bearer METRICS_TOKEN' if metrics.METRICS_TOKEN else 'solo desde esta máquina'})")
+    if admission.ENABLED:
+        print(f"🚦 Admisión: límites por IP, {ADMISSION_MAX_ACTIVE} requests en curso"
+              f" ({ADMISSION_RESERVED} reservados para /webhook)")
+    print(f"🔎 Consultas en: http://localhost:{PORT}/transactions?reference=...")
+    print(f"📈 Totales en: http://localhost:{PORT}/stats?granularity=hour")
+    print(f"📣 Avisos de estado a server.py: UDP 127.0.0.1:{status_events.STATUS_EVENTS_PORT}"
+          f"-{status_events.STATUS_EVENTS_PORT + status_events.STATUS_EVENTS_PORTS - 1}")
     print(f"\n⚠️  IMPORTANTE:")
     print(f"   - Este endpoint NO procesa datos sensibles")
     print(f"   - Solo recibe notificaciones de estado de pagos")
@@ -215,6 +591,9 @@ def run_webhook_server():
     except KeyboardInterrupt:
         print("\n\n🛑 Servidor detenido")
         httpd.server_close()
+        # Los eventos sin procesar quedan en la cola y se retoman al reiniciar
+        get_queue().close()
+        get_store().close()
 
 if __name__ == '__main__':
     run_webhook_server()